@@ -1,108 +1,280 @@
 import streamlit as st
-import google.generativeai as genai
 import os
-import re # 正規表現モジュールをインポート
-
-from duckduckgo_search import DDGS
-from googleapiclient.discovery import build # Google APIクライアントライブラリ
-
-
-# --- 改善されたパース関数 ---
-def parse_lean_canvas_response(text):
-    parsed_blocks = {}
-    score = "N/A"
-    rationale = "N/A"
-    score_text = f"スコア: {score}/100\n根拠: {rationale}" # デフォルト値
-
-    # 1. 品質スコア部分を抽出・分離
-    score_section = ""
-    draft_section = text # まず全体をドラフト部分とする
-    if "## 品質スコア" in text:
-        parts = text.split("## 品質スコア", 1)
-        draft_section = parts[0].strip() # スコアより前がドラフト
-        score_section = parts[1].strip()
-
-        # スコアと根拠を正規表現で抽出 (より柔軟に)
-        score_match = re.search(r"\*\*スコア:\s*(\d+)\s*/\s*100", score_section)
-        rationale_match = re.search(r"\*\*根拠:\s*(.*)", score_section, re.DOTALL)
-
-        score = score_match.group(1) if score_match else "N/A"
-        rationale = rationale_match.group(1).strip() if rationale_match else "N/A"
-        score_text = f"スコア: {score}/100\n根拠: {rationale}"
-
-    # 2. Lean Canvasドラフト部分から各ブロックを抽出
-    # "### X. Heading Name" 形式の行と、それに続く内容を抽出
-    # findall で (見出し行全体, 見出し名本体, 内容ブロック) をタプルとして取得
-    block_matches = re.findall(r"(###\s*\d+\.\s*(.*?)\s*)\n(.*?)(?=\n###\s*\d+\.|\Z)", draft_section, re.DOTALL | re.MULTILINE)
-
-    if block_matches:
-        for _full_heading, heading_name, content_block in block_matches:
-            # heading_name から括弧や前後の空白を除去してキーとする
-            clean_key = re.sub(r"\(.*?\)", "", heading_name).strip()
-            parsed_blocks[clean_key] = content_block.strip()
-    else:
-        # もしブロック抽出がうまくいかなかった場合
-        parsed_blocks["解析エラー"] = draft_section # 解析できなかった部分全体を入れる
-
-    return score_text, parsed_blocks # スコア文字列とブロック辞書を返す
-
-# --- VPCパース関数の例 (簡易版) ---
-def parse_vpc_response(text):
-    parsed_vpc_blocks = {}
-    # VPCの6ブロックの想定される見出し (AIの出力に合わせる)
-    # プロンプトで指定した見出し形式 "## 見出し名 (英語名)" を想定
-    vpc_headings_map = {
-        "顧客のジョブ": "顧客のジョブ (Customer Jobs)", # 表示名: プロンプト内の見出し名
-        "ペイン": "顧客のペイン (Customer Pains)",
-        "ゲイン": "顧客のゲイン (Customer Gains)",
-        "製品・サービス": "製品・サービス (Products & Services)",
-        "ペインリリーバー": "ペインリリーバー (Pain Relievers)",
-        "ゲインクリエイター": "ゲインクリエイター (Gain Creators)"
+import uuid
+
+from bizdev.artifacts import ArtifactState, get_blob_store, memory_report # 分析結果の共有ストア
+from bizdev.backends import backend_settings, get_backend # 本番のAPI / 録画した応答の再生
+from bizdev.analyses import LEAN_CANVAS_KEYS, Services, build_pipeline, submit_digests # 分析の依存グラフ
+from bizdev.cache import open_cache # Gemini応答のディスクキャッシュ (利用状況の表示用)
+from bizdev.context_cache import get_context_cache # 共通の前提情報のコンテキストキャッシュ
+from bizdev.digests import get_summary_store # ステップ出力の要約ストア
+from bizdev.jobs import QUEUED, get_job_runner # 生成のバックグラウンド実行
+from bizdev.lazy import LazyResource # 重いSDKの遅延読み込み
+from bizdev.metrics import metrics, start_metrics_server # AI・検索呼び出しの計測
+from bizdev.pipeline import FINGERPRINTS_KEY # 生成済みの分析の入力ハッシュ (保存して再開時に作り直さない)
+from bizdev.projects import checkpoint, open_project_store, restore # プロジェクトの保存と再開
+from bizdev.parsing import parse_problem_lines, parse_target_options, split_moat_proposals # AI応答のパース
+from bizdev.ratelimit import (PRIORITY_INTERACTIVE, PriorityContextCache, PriorityModel, PrioritySearchClient, # APIクォータ共有のレート制限
+                              get_limiter, limiter_settings)
+from bizdev.resources import get_model, registry # プロセス内で共有するモデル
+from bizdev.search import get_search_client # Google Custom Search (並列実行・結果キャッシュ)
+from bizdev.shared import REPLICA_ID, use_shared_store # 複数レプリカで共有するストア
+
+
+# --- APIキーの設定 ---
+# モデルはプロセス内で1つだけ作って全セッションで共有する (bizdev.resources)。
+# Gemini SDK の import とモデル作成は、最初にAIを呼び出す時まで遅らせる (起動直後の画面表示を速くする)
+try:
+    # SHARED_STORE_URL = "redis://..." で、キャッシュ・レート制限・分析の実行・プロジェクトを全レプリカで共有する。
+    # キャッシュやレート制限を開く前に設定する
+    shared_store = use_shared_store(st.secrets.get("SHARED_STORE_URL", ""))
+    # BACKEND = "replay" で、APIキーなしで録画した応答を返すローカルの代替を使う ("record" は本番の応答を録画する)
+    backend = get_backend(**backend_settings(st.secrets))
+    api_key = st.secrets["GEMINI_API_KEY"] if backend.name != "replay" else st.secrets.get("GEMINI_API_KEY", "replay")
+    llm_cache_ttl_seconds = int(st.secrets.get("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+    llm_cache_max_bytes = int(st.secrets.get("LLM_CACHE_MAX_MB", 200)) * 1024 * 1024
+    # APIクォータはキー単位なので、全セッションの呼び出しをプロセス共通のレート制限に通す ([rate_limits] で設定)
+    rate_limits = limiter_settings(st.secrets)
+    gemini_limiter = get_limiter("gemini", *rate_limits["gemini"])
+    search_limiter = get_limiter("search", *rate_limits["search"])
+    # 一時的なエラー(429/503など)は自動で再試行する。GENERATION_HEDGE = true で遅い呼び出しのヘッジも有効になる
+    generation_options = {
+        "max_attempts": int(st.secrets.get("GENERATION_MAX_ATTEMPTS", 4)),
+        "call_timeout": float(st.secrets.get("GENERATION_CALL_TIMEOUT_SECONDS", 90)),
+        "total_deadline": float(st.secrets.get("GENERATION_DEADLINE_SECONDS", 180)),
+        "hedge": bool(st.secrets.get("GENERATION_HEDGE", False)),
+        "limiter": gemini_limiter,
     }
-    # より頑健にするには正規表現の詳細化が必要
-    current_heading_key = None
-    current_content = []
-
-    if not text: # textがNoneや空の場合の処理
-        return parsed_vpc_blocks
-
-    for line in text.splitlines():
-        matched_heading = None
-        for display_name, actual_heading_pattern in vpc_headings_map.items():
-            # 見出し行を探す (行頭が ## で始まり、指定の見出し名を含むか)
-            # AIの出力が "## 顧客のジョブ (Customer Jobs)" のような形式を期待
-            if line.strip().startswith(f"## {actual_heading_pattern}"):
-                matched_heading = display_name # 表示名をキーとして使う
-                break
-        
-        if matched_heading:
-            if current_heading_key and current_content:
-                parsed_vpc_blocks[current_heading_key] = "\n".join(current_content).strip()
-            current_heading_key = matched_heading
-            current_content = []
-        elif current_heading_key:
-            current_content.append(line)
-    
-    # 最後のブロックを保存
-    if current_heading_key and current_content:
-        parsed_vpc_blocks[current_heading_key] = "\n".join(current_content).strip()
+    # 呼び出しごとの概算コストの計算に使う、100万トークンあたりの料金 (USD)
+    price_per_mtok = (float(st.secrets.get("GEMINI_PRICE_INPUT_PER_MTOK", 0.075)),
+                      float(st.secrets.get("GEMINI_PRICE_OUTPUT_PER_MTOK", 0.30)))
+    model = LazyResource(lambda: get_model(api_key, cache_ttl_seconds=llm_cache_ttl_seconds, cache_max_bytes=llm_cache_max_bytes,
+                                           generation_options=generation_options, price_per_mtok=price_per_mtok,
+                                           backend=backend))
+    # CONTEXT_CACHE = "gemini" で、ステップ3以降に共通の前提情報を Gemini のコンテキストキャッシュに登録して再利用する
+    # ("local" はAPIを使わない代替、既定の "off" は前提情報をプロンプトの先頭に付けて送る)
+    context_cache_mode = str(st.secrets.get("CONTEXT_CACHE", "off")).lower()
+    if context_cache_mode == "gemini" and backend.name == "replay":
+        context_cache_mode = "local" # 再生用のバックエンドには Gemini のコンテキストキャッシュが無い
+    context_cache = get_context_cache(
+        context_cache_mode, api_key=api_key, model=model,
+        model_name=st.secrets.get("CONTEXT_CACHE_MODEL", "models/gemini-1.5-flash-001"),
+        ttl_seconds=int(st.secrets.get("CONTEXT_CACHE_TTL_SECONDS", 3600)),
+        min_tokens=int(st.secrets.get("CONTEXT_CACHE_MIN_TOKENS", 32768)),
+        generation_options=generation_options, price_per_mtok=price_per_mtok,
+        llm_cache=open_cache("gemini_responses", ttl_seconds=llm_cache_ttl_seconds, max_bytes=llm_cache_max_bytes))
+except Exception as e:
+    st.error(f"APIキーの設定でエラーが発生しました。st.secretsを確認してください。エラー: {e}")
+    st.stop()
 
-    # 想定されるキーが全て揃っているか確認し、なければ空文字で初期化
-    for display_name in vpc_headings_map.keys():
-        if display_name not in parsed_vpc_blocks:
-            parsed_vpc_blocks[display_name] = ""
+# 各ステップ出力の要約 (後続ステップのプロンプトを短くするため。プロセス内で共有)
+summary_store = get_summary_store()
+
+# --- 分析の実行 ---
+# 各分析の入力・出力・プロンプトは bizdev.analyses に宣言してある。
+# エンジンは出力が無いか、入力が前回の生成時から変わった分析だけを実行する。
+google_api_key = st.secrets.get("GOOGLE_API_KEY", "" if backend.name != "replay" else "replay")
+search_engine_id = st.secrets.get("SEARCH_ENGINE_ID", "" if backend.name != "replay" else "replay")
+
+def make_search_client():
+    # 検索を使う分析が実行される時だけ呼ばれる (ワーカースレッドから呼ばれるので st.secrets は読まない)
+    if not google_api_key or not search_engine_id:
+        raise KeyError("GOOGLE_API_KEY と SEARCH_ENGINE_ID を st.secrets に設定してください")
+    client = get_search_client(google_api_key, search_engine_id, limiter=search_limiter, backend=backend)
+    return PrioritySearchClient(client, PRIORITY_INTERACTIVE)
+
+# STRUCTURED_OUTPUT = false で、ターゲット案・課題・VPC・Lean Canvas・Moat案をJSONではなくマークダウンで生成する
+# 画面で結果を待っている呼び出しなので、レート制限の待ち行列ではバッチ処理などより先に通す
+services = Services(PriorityModel(model, PRIORITY_INTERACTIVE), search_client=make_search_client, summary_store=summary_store,
+                    pitch_token_budget=int(st.secrets.get("PITCH_CONTEXT_TOKEN_BUDGET", 8000)),
+                    structured_output=bool(st.secrets.get("STRUCTURED_OUTPUT", True)),
+                    context_cache=PriorityContextCache(context_cache, PRIORITY_INTERACTIVE) if context_cache else None,
+                    backend_name=backend.name)
+# COMBINE_FRAMEWORKS = true で、ステップ3の SWOT・4P・3C を1回の呼び出しでまとめて生成する
+pipeline = build_pipeline(combine_frameworks=bool(st.secrets.get("COMBINE_FRAMEWORKS", False)))
+
+# 分析結果などの大きな文字列はセッションごとに持たず、プロセス共通のストアに圧縮して1回だけ保存する。
+# session_state には参照だけが入るので、分析結果は artifacts を通して読み書きする (bizdev.artifacts)
+blob_store = get_blob_store(max_memory_mb=int(st.secrets.get("SESSION_BLOB_MEMORY_MB", 64)))
+artifacts = ArtifactState(st.session_state, blob_store, keys=list(pipeline.producers) + ['selected_ai_moats_text_final'])
+
+# 分析を作り直した時に捨てる、前の結果を元にしたユーザーの編集内容
+# (戻る/進むでは消さない。ドラフト自体が変わった時だけ、新しいドラフトを表示し直す)
+VPC_EDIT_KEYS = ["vpc_ps_edit", "vpc_pr_edit", "vpc_gc_edit", "vpc_cj_edit", "vpc_p_edit", "vpc_g_edit"]
+EDITS_BASED_ON = {
+    'vpc': ['vpc_final_data'] + VPC_EDIT_KEYS,
+    'lean_canvas': ['lean_canvas_final'] + [f"lc_{key_lc.replace(' ', '_')}" for key_lc in LEAN_CANVAS_KEYS],
+}
+
+# --- バックグラウンド実行 ---
+# 分析はプロセス共通のジョブランナーで実行し、終わった結果をスクリプトスレッドで session_state へ取り込む。
+# 生成中にウィジェットを操作したり別のステップへ移動しても、生成は中断もやり直しもされない。
+job_runner = get_job_runner()
+if '_job_owner' not in st.session_state:
+    st.session_state._job_owner = uuid.uuid4().hex # このセッションのジョブの持ち主
+
+def collect_analyses(names=()):
+    """終わったジョブの結果を取り込み、names のうち実行できるようになった分析をジョブとして投入する。"""
+    errors = dict(st.session_state.get('pipeline_errors', {}))
+    for node, error in pipeline.advance(artifacts, names, services, job_runner, st.session_state._job_owner):
+        if error:
+            errors[node.name] = f"{node.label}の生成中にエラー: {error}"
+        else:
+            errors.pop(node.name, None)
+            submit_digests(node, artifacts, services) # 後続ステップ用の要約を先に作っておく
+            for edit_key in EDITS_BASED_ON.get(node.name, []):
+                st.session_state.pop(edit_key, None)
+    st.session_state.pipeline_errors = errors
+
+@st.fragment(run_every=1.0)
+def show_analysis_progress(names, label):
+    # 実行中の間だけ描画され、1秒ごとに結果を取り込む。全部終わったらページ全体を再実行して結果を表示する
+    names = pipeline.resolve(names) # まとめて生成する分析は1つとして表示する
+    collect_analyses(names)
+    if not pipeline.busy(artifacts, names):
+        st.rerun()
+    with st.status(label, expanded=True):
+        for name in names:
+            node = pipeline[name]
+            job_id = pipeline.job_id(artifacts, name)
+            job = job_runner.get(job_id) if job_id else None
+            if name in st.session_state.pipeline_errors:
+                st.write(f"❌ {node.label} の生成に失敗しました")
+            elif job is None:
+                if pipeline.is_stale(artifacts, node):
+                    st.write(f"⏸ {node.label} は他の分析の完了を待っています")
+                else:
+                    st.write(f"✅ {node.label} が完了しました")
+            elif job.status == QUEUED:
+                st.write(f"⏳ {node.label} は実行待ちです")
+            else:
+                st.write(f"🔄 {node.label} を生成中...")
+                if job.progress:
+                    st.markdown(job.progress) # ストリーミング中の文章
+        # 他のユーザーの呼び出しと合わせてレート制限の待ち行列に並んでいる数と、
+        # このセッションの分析の呼び出しのうち最も先に処理されるものより前に並んでいる数を表示
+        waiting = gemini_limiter.queue_length()
+        if waiting:
+            ahead = gemini_limiter.position_for(st.session_state._job_owner)
+            position = f"前に {ahead}件 / " if ahead is not None else ""
+            st.caption(f"APIの混雑のため順番待ち中です ({position}待ち行列: {waiting}件)")
+
+def run_pipeline(names, label):
+    """names の分析のうち作り直しが必要なものをバックグラウンドで実行し、終わるまで進捗を表示する。
+
+    失敗した分析にはエラーと再試行ボタンを表示する。まだ実行中なら True を返す。
+    """
+    names = pipeline.resolve(names)
+    collect_analyses(names)
+    for name in names:
+        message = st.session_state.pipeline_errors.get(name)
+        if message:
+            st.error(message)
+            if st.button("再試行", key=f"retry_{name}"):
+                pipeline.invalidate(artifacts, name)
+                st.session_state.pipeline_errors = {k: v for k, v in st.session_state.pipeline_errors.items() if k != name}
+                st.rerun()
+    busy = pipeline.busy(artifacts, names)
+    if busy:
+        show_analysis_progress(names, label)
+    return busy
+
+# --- 計測 ---
+# AI・検索の呼び出しごとの遅延・トークン数・コストを集計している (bizdev.metrics)。
+# METRICS_PORT を設定すると http://<host>:<port>/metrics で Prometheus 形式の集計を返す。
+# ADMIN_TOKEN を設定すると、URL に ?admin=<ADMIN_TOKEN> を付けて開いた時だけ管理ページを表示する。
+if st.secrets.get("METRICS_PORT"):
+    try:
+        start_metrics_server(int(st.secrets["METRICS_PORT"]))
+    except OSError as e:
+        st.sidebar.warning(f"計測用のサーバーを起動できませんでした: {e}")
+
+admin_token = str(st.secrets.get("ADMIN_TOKEN", ""))
+if admin_token and st.query_params.get("admin") == admin_token:
+    st.title("管理ページ")
+    st.subheader("AI・検索の呼び出し (プロセス起動からの累計)")
+    call_rows = metrics.summary()
+    if call_rows:
+        st.dataframe(call_rows, hide_index=True)
+        st.caption(f"概算コスト合計: ${sum(row['概算コスト(USD)'] for row in call_rows):.4f}")
+    else:
+        st.caption("まだ呼び出しはありません")
+    st.subheader("キャッシュ・待ち行列")
+    st.json({
+        "AI応答キャッシュ": open_cache("gemini_responses", ttl_seconds=llm_cache_ttl_seconds, max_bytes=llm_cache_max_bytes).stats(),
+        "コンテキストキャッシュ": context_cache.stats() if context_cache is not None else "off",
+        "共有ストア": blob_store.stats(),
+        "バックグラウンド処理": job_runner.stats(),
+        "待ち行列": {"gemini": gemini_limiter.queue_length(), "search": search_limiter.queue_length()},
+        "バックエンド": {"name": backend.name, **(backend.stats() if hasattr(backend, "stats") else {})},
+        "レプリカ": {"replica": REPLICA_ID, "store": type(shared_store).__name__ if shared_store is not None else "off"},
+    })
+    st.subheader("共有リソース")
+    # リソース名には APIキーが含まれるので、種類だけを表示する
+    st.dataframe([{"リソース": name[0] if isinstance(name, tuple) else name, **info} for name, info in registry.status().items()],
+                 hide_index=True)
+    st.stop()
 
-    return parsed_vpc_blocks
-# --- VPCパース関数ここまで ---
+# --- プロジェクトの保存と再開 ---
+# 各ステップの入力と分析結果をプロジェクトストア (既定はローカルの SQLite) に保存し、
+# URL の ?project=<ID> またはサイドバーでIDを指定すると、再起動後や別のセッションから続きを再開できる。
+# 再開時は現在のステップで使う値だけを読み込み、他のステップの値は移動した時に読み込む。
+project_store = open_project_store(st.secrets.get("PROJECT_STORE_URL"))
+
+# 保存する state のキー: 各分析の出力と、ユーザーが選んだ・編集した内容
+PROJECT_KEYS = ['step', 'tech_summary', 'selected_target', 'selected_problems', 'vpc_final_data', 'lean_canvas_final',
+                'mvp_definition_final', 'selected_ai_moats_text_final', 'final_moat_definition_user',
+                FINGERPRINTS_KEY] + list(pipeline.producers)
+# ステップごとに実行する分析と、分析の入力・出力以外に画面で使う値
+STEP_NODES = {1: ['targets'], 1.2: ['problems'], 1.3: ['vpc'], 2.1: ['lean_canvas'],
+              3: ['mvp', 'swot', 'four_p', 'three_c', 'financials'], 4: ['competitors', 'moat'], 5: ['pitch'], 6: ['vc_review']}
+STEP_KEYS = {1: ['selected_target'], 1.2: ['selected_problems'], 1.3: ['vpc_final_data'], 2.1: ['lean_canvas_final'],
+             3: ['mvp_definition_final'], 4: ['selected_ai_moats_text_final', 'final_moat_definition_user']}
+
+def step_keys(step):
+    """ステップ step の表示と分析に必要な、保存対象のキー。"""
+    keys = {'step', 'tech_summary', FINGERPRINTS_KEY, *STEP_KEYS.get(step, [])}
+    for name in pipeline.resolve(STEP_NODES.get(step, [])):
+        keys.update(pipeline[name].inputs)
+        keys.update(pipeline[name].outputs)
+    return [key for key in PROJECT_KEYS if key in keys]
+
+def open_project(project_id):
+    """保存済みのプロジェクトを開く。今のセッションの内容は破棄する。"""
+    for key in list(st.session_state.keys()):
+        if key != '_job_owner':
+            del st.session_state[key]
+    st.session_state.project_id = project_id
+    st.session_state._project_saved = {} # 保存済み(読み込み済み)の値のハッシュ
+    st.query_params["project"] = project_id
+
+def save_project():
+    """前回の実行からの変更をプロジェクトに保存する。技術概要が入力されるまではプロジェクトを作らない。"""
+    if 'project_id' not in st.session_state:
+        tech_summary = st.session_state.get('tech_summary', '')
+        if not tech_summary:
+            return
+        title = next((line.split(":", 1)[1].strip() for line in tech_summary.splitlines() if "技術の名称:" in line), "")
+        st.session_state.project_id = project_store.create(title=title)
+        st.session_state._project_saved = {}
+        st.query_params["project"] = st.session_state.project_id
+    checkpoint(project_store, st.session_state.project_id, artifacts, PROJECT_KEYS,
+               st.session_state._project_saved, step=st.session_state.get('step'))
 
-# --- APIキーの設定 (変更なし) ---
 try:
-    api_key = st.secrets["GEMINI_API_KEY"]
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-1.5-flash')
+    # 新しいセッションで URL にプロジェクトIDがあれば、そのプロジェクトを再開する
+    requested_project = st.query_params.get("project")
+    if requested_project and requested_project != st.session_state.get('project_id') and project_store.get(requested_project):
+        open_project(requested_project)
+    if 'project_id' in st.session_state:
+        # 現在のステップで使う値のうち、まだ読み込んでいないものを読み込む (このセッションで削除した値は除く)
+        saved = st.session_state._project_saved
+        if 'step' not in st.session_state:
+            restore(project_store, st.session_state.project_id, artifacts, ['step'], saved)
+        keys = [key for key in step_keys(st.session_state.get('step', 0)) if key not in saved]
+        restore(project_store, st.session_state.project_id, artifacts, keys, saved)
 except Exception as e:
-    st.error(f"APIキーの設定でエラーが発生しました。st.secretsを確認してください。エラー: {e}")
-    st.stop()
+    st.sidebar.warning(f"プロジェクトの読み込みに失敗しました: {e}")
 
 # --- Session Stateの初期化 ---
 # st.session_stateを初期化して、アプリの実行間でデータを保持できるようにする
@@ -117,6 +289,42 @@ if 'selected_stories' not in st.session_state:
 
 # --- Streamlit UI部分 ---
 st.title("技術事業化支援サービス プロトタイプ")
+if backend.name == "replay":
+    st.sidebar.info("再生モード: AIと検索の応答は録画またはダミーです (BACKEND = \"replay\")")
+
+# Gemini応答キャッシュの利用状況 (プロセス全体での累計)
+llm_cache_stats = open_cache("gemini_responses", ttl_seconds=llm_cache_ttl_seconds, max_bytes=llm_cache_max_bytes).stats()
+llm_cache_entries = f" (保存 {llm_cache_stats['entries']}件)" if llm_cache_stats['entries'] is not None else "" # 共有ストアでは数えない
+st.sidebar.caption(f"AI応答キャッシュ: ヒット {llm_cache_stats['hits']} / ミス {llm_cache_stats['misses']}{llm_cache_entries}")
+st.sidebar.caption(f"AIリクエスト待ち行列: {gemini_limiter.queue_length()}件 / 検索待ち行列: {search_limiter.queue_length()}件")
+job_stats = job_runner.stats()
+st.sidebar.caption(f"バックグラウンド処理: 実行中 {job_stats['running']}件 / 待機 {job_stats['queued']}件")
+with st.sidebar.expander("メモリ使用量"):
+    session_memory = memory_report(st.session_state)
+    blob_stats = blob_store.stats()
+    st.caption(f"このセッション: {sum(row['バイト数'] for row in session_memory) / 1024:.0f} KB")
+    st.caption(f"共有ストア (全セッション): {blob_stats['blobs']}件 {blob_stats['memory_bytes'] / 1024:.0f} KB"
+               f" / 共有で省いた複製 {blob_stats['shared']}件 / ディスクへ退避 {blob_stats['spilled']}件")
+    st.dataframe(session_memory[:15], hide_index=True)
+
+# 前のステップで始めた分析が終わっていれば、結果を取り込んでおく
+collect_analyses()
+
+# 前回の実行で変わった入力・分析結果をプロジェクトに保存する (接続が切れても次のセッションで再開できる)
+try:
+    save_project()
+except Exception as e:
+    st.sidebar.warning(f"プロジェクトの保存に失敗しました: {e}")
+if 'project_id' in st.session_state:
+    st.sidebar.caption(f"プロジェクトID: `{st.session_state.project_id}` (このURLで再開できます)")
+with st.sidebar.expander("保存したプロジェクトを開く"):
+    resume_id = st.text_input("プロジェクトID", key="resume_project_id")
+    if st.button("開く", key="open_project") and resume_id.strip():
+        if project_store.get(resume_id.strip()):
+            open_project(resume_id.strip())
+            st.rerun()
+        else:
+            st.warning("プロジェクトが見つかりません。")
 
 # --- ステップ0: 技術概要の入力 ---
 if st.session_state.step == 0:
@@ -148,37 +356,10 @@ if st.session_state.step == 0:
                 """
 
                 # --- ★★★ 新しい処理: ターゲット戦略提案依頼 ★★★ ---
-                st.info("AIがターゲット戦略のアイデアを考えています...")
-
-                # プロンプト作成 (ターゲット戦略提案用)
-                target_prompt = f"""以下の技術概要に基づいて、事業化が考えられる具体的なターゲット市場セグメント、またはターゲット顧客像のアイデアを3つ提案してください。
-                それぞれのアイデアについて、なぜそれがターゲットとなり得るのか簡単な根拠も添えてください。
-
-                # 技術概要:
-                {st.session_state.tech_summary}
-
-                # 出力形式例 (マークダウン):
-                **ターゲット案1: [セグメント名や顧客像]**
-                * 根拠: [簡単な理由]
-
-                **ターゲット案2: [セグメント名や顧客像]**
-                * 根拠: [簡単な理由]
-
-                **ターゲット案3: [セグメント名や顧客像]**
-                * 根拠: [簡単な理由]
-                """
-
-                try:
-                        with st.spinner('Geminiがターゲット戦略を分析中...'):
-                            response_target = model.generate_content(target_prompt)
-                        st.session_state.target_strategy_ideas = response_target.text
-                        st.session_state.step = 1
-                        st.write("--- DEBUG: Step changed to 1. Preparing to rerun. ---")
-                        st.rerun()
-
-                except Exception as e:
-                    st.write(f"--- DEBUG: API call FAILED: {e} ---")
-                    st.error(f"ターゲット戦略生成中にエラーが発生しました: {e}")
+                # バックグラウンドで生成を始めてすぐにステップ1へ進む (結果はステップ1で表示)
+                collect_analyses(['targets'])
+                st.session_state.step = 1
+                st.rerun()
 # --- ★★★ ターゲット戦略提案依頼ここまで ★★★ ---
 
             else:
@@ -196,8 +377,9 @@ elif st.session_state.step == 1:
     st.divider()
 
     st.subheader("AIによるターゲット戦略提案")
-    if 'target_strategy_ideas' in st.session_state and st.session_state.target_strategy_ideas:
-        st.markdown(st.session_state.target_strategy_ideas)
+    targets_busy = run_pipeline(['targets'], "Geminiがターゲット戦略を分析中...")
+    if 'target_strategy_ideas' in artifacts and artifacts['target_strategy_ideas']:
+        st.markdown(artifacts['target_strategy_ideas'])
 
         # --- ↓↓↓ ターゲット選択UIを修正 ↓↓↓ ---
         st.divider()
@@ -205,9 +387,9 @@ elif st.session_state.step == 1:
 
         # target_strategy_ideas から選択肢を抽出
         target_options = []
-        raw_ideas_text = st.session_state.target_strategy_ideas
+        raw_ideas_text = artifacts['target_strategy_ideas']
         # "**ターゲット案X:**" で始まる行を抽出 (タイトル行全体)
-        extracted_options = [line.strip() for line in raw_ideas_text.splitlines() if line.strip().startswith("**ターゲット案")]
+        extracted_options = parse_target_options(raw_ideas_text)
         if extracted_options:
              target_options.extend(extracted_options)
         else:
@@ -217,12 +399,16 @@ elif st.session_state.step == 1:
         other_option = "その他（自由記述）"
         target_options.append(other_option)
 
+        # 前回選んだターゲットがあれば、それを選択した状態で表示する (同じターゲットなら課題リストを作り直さずに済む)
+        previous_target = st.session_state.get('selected_target', '')
+        previous_is_manual = bool(previous_target) and previous_target not in target_options
+
         # ラジオボタンで選択
         selected_target_option = st.radio(
             "ターゲットを選択、または「その他」を選んで自由記述してください:",
             options=target_options,
             key="target_selection_radio",
-            index=len(target_options)-1 # デフォルトで「その他」を選択状態にする場合
+            index=target_options.index(previous_target) if previous_target in target_options else len(target_options)-1 # デフォルトで「その他」を選択状態にする場合
             # index=0 # デフォルトで最初の提案を選択状態にする場合
         )
 
@@ -231,6 +417,7 @@ elif st.session_state.step == 1:
         if selected_target_option == other_option:
             manual_target_input = st.text_area(
                 "ターゲット顧客（セグメント、ペルソナなど）を具体的に記述してください:",
+                value=previous_target if previous_is_manual else "",
                 key="manual_target_input",
                 height=150
             )
@@ -253,14 +440,11 @@ elif st.session_state.step == 1:
             if valid_selection:
                 # 選択/入力されたターゲット情報をsession_stateに保存
                 st.session_state.selected_target = final_selected_target
-                # 課題リストはクリアしておく（ターゲットが変わったので再生成）
-                if 'potential_problems' in st.session_state:
-                    del st.session_state.potential_problems
                 st.session_state.step = 1.2 # 次のサブステップへ
                 st.rerun()
         # --- ↑↑↑ ターゲット選択UIを修正 ↑↑↑ ---
 
-    else:
+    elif not targets_busy:
         st.warning("ターゲット戦略のアイデアがまだ生成されていません。ステップ0に戻ってください。")
         # (戻るボタンのロジックは変更なし)
 
@@ -270,8 +454,6 @@ elif st.session_state.step == 1:
     # ナビゲーション（仮） - ステップ0に戻るボタンのみ残す
     if st.button("ステップ0（入力）に戻る"):
         st.session_state.step = 0
-        if 'target_strategy_ideas' in st.session_state: del st.session_state.target_strategy_ideas
-        if 'selected_target' in st.session_state: del st.session_state.selected_target
         st.rerun()
 
 # --- ステップ1.2: 壁打ち - 課題整理 ---
@@ -291,65 +473,33 @@ elif st.session_state.step == 1.2:
     st.write(selected_target)
     st.divider()
 
-    # --- AIによる課題リスト生成 (変更なし) ---
-    if 'potential_problems' not in st.session_state:
-        # (AI呼び出しロジックは前回と同じ)
-        st.info("AIが課題を分析中です...")
-        tech_summary = st.session_state.get('tech_summary', '')
-        if not tech_summary:
+    # --- AIによる課題リスト生成 (まだ無いか、技術概要・ターゲットが変わっていれば) ---
+    if pipeline.stale_nodes(artifacts, ['problems']):
+        if not st.session_state.get('tech_summary', ''):
              st.error("技術概要がありません。ステップ0からやり直してください。")
              st.stop()
         if not selected_target or selected_target == '（ターゲットが選択されていません）':
              st.error("ターゲットが選択されていません。ステップ1に戻ってください。")
              st.stop()
-       
-       # --- ↓↓↓ プロンプトを修正 ↓↓↓ ---
-        problem_prompt = f"""あなたは、新規事業のアイデアを検討するコンサルタントです。
-        以下の「技術概要」と、その技術の「ターゲット候補」に関する情報を分析してください。
-        そして、**このターゲット候補が抱えている可能性のある「課題」や「ペイン（悩み、不満、困りごと）」**を、できるだけ具体的に5～10個程度リストアップしてください。
-        この分析は、これまでの会話とは独立した、今回提示された情報のみに基づいて行ってください。
-
-        # 技術概要:
-        {tech_summary}
-
-        # ターゲット候補:
-        {selected_target}
-
-        # 出力形式 (マークダウンの箇条書き):
-        * [具体的な課題やペイン1]
-        * [具体的な課題やペイン2]
-        * ...
-        """
-        # --- ↑↑↑ プロンプトを修正 ↑↑↑ ---
-
-        try:
-            with st.spinner("Geminiが課題を分析中..."):
-                 response_problems = model.generate_content(problem_prompt)
-                 st.session_state.potential_problems = response_problems.text
-                 st.success("課題リストの生成が完了しました。")
-                 st.rerun()
-        except Exception as e:
-            st.error(f"課題リスト生成中にエラーが発生しました: {e}")
-            st.session_state.potential_problems = "課題リストの生成に失敗しました。"
+        run_pipeline(['problems'], "Geminiが課題を分析中...")
 
     # --- ★★★ 課題リスト表示と選択UI ★★★ ---
     st.subheader("AIが考えたターゲットの課題リスト（複数選択可）")
 
     selected_problems_list = [] # 選択された課題を格納するリスト
-    potential_problems_text = st.session_state.get('potential_problems', '')
+    potential_problems_text = artifacts.get('potential_problems', '')
 
     if potential_problems_text and potential_problems_text != "課題リストの生成に失敗しました。":
-        # AI応答テキストを解析して課題リストを作成 (簡易版: 行ごとに分割し、'*'などを除去)
-        problem_lines = [line.strip('* ') for line in potential_problems_text.splitlines() if line.strip() and line.strip().startswith('*')]
-        if not problem_lines: # もし'*'で始まらない形式なら、空行以外をそのまま使う
-             problem_lines = [line.strip() for line in potential_problems_text.splitlines() if line.strip()]
+        # AI応答テキストを解析して課題リストを作成
+        problem_lines = parse_problem_lines(potential_problems_text)
 
         if problem_lines:
-            # 各課題に対してチェックボックスを表示
+            # 各課題に対してチェックボックスを表示 (前回選んだ課題はチェック済みで表示)
+            previous_problems = st.session_state.get('selected_problems', [])
             for i, problem in enumerate(problem_lines):
                 key = f"problem_select_{i}"
                 # チェックボックスの状態は st.session_state に自動で保存される
-                is_selected = st.checkbox(problem, key=key)
+                is_selected = st.checkbox(problem, value=problem in previous_problems, key=key)
                 if is_selected:
                     selected_problems_list.append(problem) # チェックされたらリストに追加
         else:
@@ -366,8 +516,6 @@ elif st.session_state.step == 1.2:
     with col_nav1:
         if st.button("ステップ1（ターゲット選択）に戻る", key="back_to_step1_from_1_2"): # キー名を変更
             st.session_state.step = 1
-            if 'potential_problems' in st.session_state: del st.session_state.potential_problems
-            if 'selected_problems' in st.session_state: del st.session_state.selected_problems # 選択結果もクリア
             st.rerun()
     with col_nav2:
         # ↓↓↓ ボタンのロジックを修正 ↓↓↓
@@ -376,9 +524,6 @@ elif st.session_state.step == 1.2:
                 # 選択された課題リストをsession_stateに保存
                 st.session_state.selected_problems = selected_problems_list
                 st.session_state.step = 1.3 # 次のステップへ
-                # VPCドラフトはクリアしておく（インプットが変わるので再生成）
-                if 'vpc_draft_text' in st.session_state: del st.session_state.vpc_draft_text
-                if 'vpc_final_data' in st.session_state: del st.session_state.vpc_final_data # 編集データもクリア
                 st.rerun()
             else:
                 st.warning("VPC作成に進むには、少なくとも1つの課題を選択してください。")
@@ -402,85 +547,15 @@ elif st.session_state.step == 1.3:
     st.caption("AIが提案するドラフトを元に、顧客への提供価値を具体化しましょう。")
     st.divider()
 
-    # ... (必要な情報取得は同じ) ...
-    selected_target = st.session_state.get('selected_target', '')
-    focused_problems_list = st.session_state.get('selected_problems', [])
-    tech_summary = st.session_state.get('tech_summary', '')
-
-    # --- AIによるVPCドラフト生成 (まだパース結果がなければ) ---
-    if 'parsed_vpc_blocks' not in st.session_state: # パース後のデータがあるかで判断
-        st.info("AIがVPCドラフトを作成中です...")
-        
-        # ... (vpc_prompt 作成は同じ。入力として focused_problems_list を使う) ...
-        vpc_prompt = f"""あなたは事業開発の専門家です。以下の提供情報**のみ**に基づいて、「Value Proposition Canvas」の6つの構成要素について、具体的なアイデアを提案・記述してください。過去の会話の文脈は考慮せず、今回提示された情報だけで判断してください。
-
-        # 提供情報
-        ## 技術概要:
-        {tech_summary}
-
-        ## ターゲット候補:
-        {selected_target}
-
-        ## ターゲットの【主要な】課題リスト (ユーザー選抜済):
-        {chr(10).join([f'* {p}' for p in focused_problems_list]) if focused_problems_list else "(ユーザーによって特に選択された課題はありません。ターゲット候補全般の一般的な課題を考慮してください。)"}
-
-        # 作成するVPCの構成要素と記述内容の指示:
-        1.  **顧客のジョブ (Customer Jobs):** ターゲット顧客が達成しようとしていること、解決したい仕事は何か？
-        2.  **顧客のペイン (Customer Pains):** 顧客が現状感じている不満、障害、リスクは何か？（上記の【主要な】課題リストを最重要の参考情報として具体的に）
-        3.  **顧客のゲイン (Customer Gains):** 顧客が期待する成果、メリット、喜びは何か？
-        4.  **製品・サービス (Products & Services):** あなたの技術を元にした具体的な製品やサービス案は？
-        5.  **ペインリリーバー (Pain Relievers):** その製品・サービスが、どのように顧客のペインを取り除くか？
-        6.  **ゲインクリエイター (Gain Creators):** その製品・サービスが、どのように顧客のゲインを生み出すか？
-
-        # 出力形式 (各要素を以下の見出しで明確に区切ってください):
-        ## 顧客のジョブ (Customer Jobs)
-        [ここに具体的な記述を複数箇条書きで]
-
-        ## 顧客のペイン (Customer Pains)
-        [ここに具体的な記述を複数箇条書きで]
-
-        ## 顧客のゲイン (Customer Gains)
-        [ここに具体的な記述を複数箇条書きで]
-
-        ## 製品・サービス (Products & Services)
-        [ここに具体的な記述を複数箇条書きで]
-
-        ## ペインリリーバー (Pain Relievers)
-        [ここに具体的な記述を複数箇条書きで]
-
-        ## ゲインクリエイター (Gain Creators)
-        [ここに具体的な記述を複数箇条書きで]
-
-        マークダウン形式で記述してください。
-        """
-
-        try:
-            with st.spinner("GeminiがVPCドラフトを作成中..."):
-                response_vpc = model.generate_content(vpc_prompt)
-                vpc_raw_text = response_vpc.text
-                st.session_state.vpc_draft_text = vpc_raw_text # 生データも保存
-
-                # ★★★ AI応答をパースして session_state に保存 ★★★
-                if 'vpc_draft_text' in st.session_state and 'parsed_vpc_blocks' not in st.session_state: # まだパースされていなければ
-                    vpc_raw_text = st.session_state.vpc_draft_text
-                    if vpc_raw_text != "VPCドラフトの生成に失敗しました。": # エラーでない場合のみパース
-                        parsed_data = parse_vpc_response(vpc_raw_text)
-                        st.session_state.parsed_vpc_blocks = parsed_data
-                        st.success("VPCドラフトの解析が完了しました。") # メッセージ変更
-                        # st.rerun() # ここでのリランは不要
-
-        
-        except Exception as e:
-            st.error(f"VPCドラフト生成中にエラーが発生しました: {e}")
-            st.session_state.vpc_draft_text = "VPCドラフトの生成に失敗しました。"
-            st.session_state.parsed_vpc_blocks = {} # エラー時は空の辞書
+    # --- AIによるVPCドラフト生成 (まだ無いか、ターゲット・選択した課題が変わっていれば) ---
+    run_pipeline(['vpc'], "GeminiがVPCドラフトを作成中...")
 
-            
     # --- VPCフレームワークと編集UIの表示 ---
     st.subheader("Value Proposition Canvas （編集可）")
 
     if 'parsed_vpc_blocks' in st.session_state and st.session_state.parsed_vpc_blocks:
-            vpc_edit_data = st.session_state.parsed_vpc_blocks
+            # 前回このステップで編集した内容があればそれを表示する (ドラフトが作り直された時は消えている)
+            vpc_edit_data = {**st.session_state.parsed_vpc_blocks, **st.session_state.get('vpc_final_data', {})}
 
             col_vp, col_cs = st.columns(2)
 
@@ -529,11 +604,6 @@ elif st.session_state.step == 1.3:
     with col_nav1:
         if st.button("ステップ1.2（課題整理）に戻る", key="back_to_step1_2_from_vpc"): # キー名変更
             st.session_state.step = 1.2
-            if 'vpc_draft_text' in st.session_state: del st.session_state.vpc_draft_text
-            if 'parsed_vpc_blocks' in st.session_state: del st.session_state.parsed_vpc_blocks
-            # 編集中のデータをクリア
-            for k in ["vpc_ps_edit", "vpc_pr_edit", "vpc_gc_edit", "vpc_cj_edit", "vpc_p_edit", "vpc_g_edit"]:
-                if k in st.session_state: del st.session_state[k]
             st.rerun()
     with col_nav2:
         if st.button("ステップ2a（Lean Canvas）へ進む", key="goto_step2a_from_vpc"): # キー名変更
@@ -550,10 +620,6 @@ elif st.session_state.step == 1.3:
             # st.info("VPCの内容を保存しました。")
 
             st.session_state.step = 2.1
-            # Lean Canvas関連のデータをクリアして再生成させる
-            if 'lean_canvas_raw_output' in st.session_state: del st.session_state.lean_canvas_raw_output
-            if 'lean_canvas_score_text' in st.session_state: del st.session_state.lean_canvas_score_text
-            if 'lean_canvas_parsed_blocks' in st.session_state: del st.session_state.lean_canvas_parsed_blocks
             st.rerun()
     
 # --- ステップ2a (2.1): Lean Canvas Draft + Score ---
@@ -581,150 +647,28 @@ elif st.session_state.step == 2.1:
     st.caption("これまでの情報を元にAIがLean Canvasのドラフトを作成し、品質スコアを算出します。")
     st.divider()
 
-    # --- AIによるLean Canvas Draft + Score生成 (まだなければ) ---
-    if 'lean_canvas_raw_output' not in st.session_state:
-        st.info("AIがLean Canvasドラフトと品質スコアを作成中です...")
-
-        # 必要な情報をsession_stateから取得
-        tech_summary = st.session_state.get('tech_summary', '')
-        selected_target = st.session_state.get('selected_target', '')
-        potential_problems = st.session_state.get('potential_problems', '') # 課題リストも追加
-        vpc_data = st.session_state.get('vpc_final_data', {}) # Step 1.3で保存したVPCデータ
-
-        if not tech_summary or not selected_target: # VPCと課題は任意入力から生成される可能性考慮
+    # --- AIによるLean Canvas Draft + Score生成 (まだ無いか、VPCなどの入力が変わっていれば) ---
+    # 市場調査用の検索キーワード生成 → Google検索 → Lean Canvas作成・評価 を1つの分析として実行する
+    if pipeline.stale_nodes(artifacts, ['lean_canvas']):
+        if not st.session_state.get('tech_summary') or not st.session_state.get('selected_target'): # VPCと課題は任意入力から生成される可能性考慮
              st.error("Lean Canvas作成に必要な情報（技術概要、ターゲット）が不足しています。前のステップに戻ってください。")
              st.stop()
-                # --- ★★★ 1. AIによる市場調査用検索キーワード生成 ★★★ ---
-        market_search_keywords_generated = []
-        web_search_for_market_summary = ""
-        try:
-            with st.spinner("AIが市場調査用の検索キーワードを生成中... (1/3)"):
-                market_keyword_prompt = f"""以下の「技術概要」と「ターゲット顧客」に基づいて、この事業が参入する可能性のある市場の「市場規模」「最新トレンド」「主要な顧客セグメントの詳細」を調査するための効果的なGoogle検索キーワードを3つ提案してください。キーワードのみを箇条書きで出力してください。
-
-                # 技術概要:
-                {tech_summary}
-
-                # ターゲット顧客:
-                {selected_target}
-                """
-                response_market_keywords = model.generate_content(market_keyword_prompt)
-                market_search_keywords_text = response_market_keywords.text
-                market_search_keywords_generated = [kw.strip("* ").strip() for kw in market_search_keywords_text.splitlines() if kw.strip() and not kw.strip().startswith("Please provide")]
-                st.write("DEBUG - AIが生成した市場調査用キーワード:", market_search_keywords_generated) # デバッグ用
-        except Exception as e:
-            st.warning(f"市場調査用キーワード生成中にエラー: {e}")
-
-        # --- ★★★ 2. Web検索実行 (Google Custom Search API) ★★★ ---
-        if market_search_keywords_generated:
-            try:
-                with st.spinner("市場情報をGoogle検索で収集中... (2/3)"):
-                    google_api_key = st.secrets["GOOGLE_API_KEY"]
-                    search_engine_id = st.secrets["SEARCH_ENGINE_ID"]
-                    service = build("customsearch", "v1", developerKey=google_api_key)
-                    market_search_snippets = []
-                    for keyword in market_search_keywords_generated[:3]: # 上位3キーワード
-                        res = service.cse().list(q=keyword, cx=search_engine_id, num=2).execute() # 各2件
-                        if 'items' in res:
-                            for item in res['items']:
-                                title = item.get('title', '')
-                                snippet = item.get('snippet', '').replace('\n', ' ')
-                                market_search_snippets.append(f"- {title}: {snippet}")
-                    if market_search_snippets:
-                        web_search_for_market_summary = "\n".join(market_search_snippets)
-                        st.write("DEBUG - 収集した市場情報（一部）:", web_search_for_market_summary[:200] + "...") # デバッグ用
-            except Exception as e:
-                st.warning(f"市場情報のWeb検索中にエラー: {e}")
-        else:
-            web_search_for_market_summary = "市場調査のためのキーワードが生成されなかったため、Web検索はスキップされました。"
-
-
-        # --- ★★★ 3. Lean Canvas生成AIへの情報提供 (プロンプト修正) ★★★ ---
-        input_context = f"""
-        # 提供情報
-
-        ## 技術概要:
-        {tech_summary}
-
-        ## 選抜されたターゲット顧客:
-        {selected_target}
-
-        ## ターゲットの主な課題・ペイン (AI提案/ユーザー編集):
-        {potential_problems if potential_problems else "(情報なし)"}
-
-        ## Value Proposition Canvas の内容:
-        * 顧客のジョブ: {vpc_data.get('顧客のジョブ', '(情報なし)')}
-        * ペイン: {vpc_data.get('ペイン', '(情報なし)')}
-        * ゲイン: {vpc_data.get('ゲイン', '(情報なし)')}
-        * 製品・サービス: {vpc_data.get('製品・サービス', '(情報なし)')}
-        * ペインリリーバー: {vpc_data.get('ペインリリーバー', '(情報なし)')}
-        * ゲインクリエイター: {vpc_data.get('ゲインクリエイター', '(情報なし)')}
-        """
-
-        lc_prompt = f"""以下の情報に基づいて、Lean Canvasの9つの構成要素のドラフトを作成してください。
-        特に「顧客セグメント」と、市場規模を示唆する「主要指標」の項目については、提供された「市場調査のWeb検索結果」を最大限活用してください。
-        さらに、作成したドラフト全体について、事業アイデアの初期段階としての「品質スコア」を100点満点で採点し、その主な理由も記述してください。
-        **最終的な出力は、必ずLean Canvasの9ブロック全てと品質スコアを含めてください。**
-
-        # 技術概要:
-        {tech_summary}
-
-        # ターゲット顧客:
-        {selected_target}
-
-        # Value Proposition Canvas の内容:
-        {vpc_data}
-
-        # 市場調査のWeb検索結果 (これを参考に市場規模や顧客セグメントを具体化):
-        {web_search_for_market_summary if web_search_for_market_summary else "（Web検索結果なし。一般的な知識で補完してください。）"}
-
-        # 作成するLean Canvasの構成要素 (9項目全て記述必須):
-        1. 課題 (Problem)
-        2. 顧客セグメント (Customer Segments)
-        3. 独自の価値提案 (Unique Value Proposition)
-        4. 解決策 (Solution)
-        5. チャネル (Channels)
-        6. 収益の流れ (Revenue Streams)
-        7. コスト構造 (Cost Structure)
-        8. 主要指標 (Key Metrics)
-        9. 圧倒的優位性 (Unfair Advantage)
-
-        # 品質スコアの評価観点: (前回と同じ)
-        # ...
-
-        # 出力形式 (マークダウン、各項目を見出しで明確に区切る):
-        ## Lean Canvas Draft
-        ### 1. 課題
-        [記述]
-        ### 2. 顧客セグメント
-        [記述]
-        ... (9まですべて) ...
-
-        ## 品質スコア
-        **スコア:** [点数]/100
-        **根拠:** [簡単な理由]
-        """
-
-        try:
-            with st.spinner("Web検索情報を元にGeminiがLean Canvasを作成・評価中... (3/3)"):
-                response_lc = model.generate_content(lc_prompt)
-                raw_output = response_lc.text
-                st.session_state.lean_canvas_raw_output = raw_output
-
-                parsed_score, parsed_blocks = parse_lean_canvas_response(raw_output)
-                st.session_state.lean_canvas_score_text = parsed_score
-                st.session_state.lean_canvas_parsed_blocks = parsed_blocks
-                st.success("市場調査とLean Canvasドラフト作成が完了しました。")
-        except Exception as e:
-            st.error(f"Lean Canvas作成中にエラーが発生しました: {e}")
-   
+        run_pipeline(['lean_canvas'], "AIが市場情報をGoogle検索で収集し、Lean Canvasを作成・評価中...")
+
+    # 市場調査で使った検索キーワードと、検索中に起きたエラー
+    if st.session_state.get('market_search_keywords'):
+        st.caption("市場調査に使った検索キーワード: " + " / ".join(st.session_state.market_search_keywords))
+    for market_warning in st.session_state.get('market_search_warnings', []):
+        st.warning(market_warning)
+
     # --- Lean Canvas表示と編集UI ---
     st.subheader("Lean Canvas ドラフト （編集可）")
 
     # 品質スコア表示
-    if 'lean_canvas_score_text' in st.session_state:
+    if 'lean_canvas_score_text' in artifacts:
          st.markdown("**品質スコア**")
          # st.text だと改行が反映されない可能性があるので st.write や st.markdown を使う
-         st.markdown(st.session_state.lean_canvas_score_text.replace('\n', '  \n')) # Markdown改行
+         st.markdown(artifacts['lean_canvas_score_text'].replace('\n', '  \n')) # Markdown改行
          st.divider()
 
     # Lean Canvas 9ブロック表示 (編集可能)
@@ -740,8 +684,9 @@ elif st.session_state.step == 2.1:
 
          # 9つのテキストエリアで表示・編集
          # (レイアウトは後で調整するとして、まずは順番に表示)
+         lean_canvas_final = st.session_state.get('lean_canvas_final', {}) # 前回編集した内容 (ドラフトが作り直された時は消えている)
          for i, key in enumerate(valid_keys):
-             block_content = lc_data.get(key, "") # パース結果を取得
+             block_content = lean_canvas_final.get(key, lc_data.get(key, "")) # 編集内容が無ければパース結果を取得
              session_key = f"lc_{key.replace(' ', '_')}" # session_state用キー (スペースをアンダースコアに)
              # テキストエリアを作成 (valueにパース結果、keyを指定)
              edited_value = st.text_area(f"{i+1}. {key}", value=block_content, height=150, key=session_key)
@@ -767,11 +712,6 @@ elif st.session_state.step == 2.1:
     with col_nav1:
         if st.button("ステップ1.3（VPC）に戻る", key="back_to_step1_3"):
             st.session_state.step = 1.3
-            # 関連するsession_stateをクリア
-            if 'lean_canvas_raw_output' in st.session_state: del st.session_state.lean_canvas_raw_output
-            if 'lean_canvas_score_text' in st.session_state: del st.session_state.lean_canvas_score_text
-            if 'lean_canvas_parsed_blocks' in st.session_state: del st.session_state.lean_canvas_parsed_blocks
-            # VPCデータは残しておく
             st.rerun()
     with col_nav2:
         if st.button("ステップ2b（顧客インタビュー）へ進む", key="goto_step2b"):
@@ -782,7 +722,13 @@ elif st.session_state.step == 2.1:
             # st.rerun()
     with col_nav3:
         if st.button("ステップ3（深掘り）へ進む", key="goto_step3"):
-            # Lean Canvasの内容は st.session_state.lc_課題 などに保存されているはず
+            # ★★★ 編集されたLean Canvasの内容を st.session_state.lean_canvas_final に保存 ★★★
+            # (lc_課題 などのウィジェットの値は、このステップを離れると消えるため)
+            lc_parsed = st.session_state.get('lean_canvas_parsed_blocks', {})
+            st.session_state.lean_canvas_final = {
+                key_lc: st.session_state.get(f"lc_{key_lc.replace(' ', '_')}", lc_parsed.get(key_lc, ""))
+                for key_lc in LEAN_CANVAS_KEYS
+            }
             st.session_state.step = 3 # ★ ステップ番号を 3 に設定 ★
             st.rerun() # ★ 再実行してステップ3へ遷移 ★
    
@@ -799,29 +745,18 @@ elif st.session_state.step == 3:
     st.caption("Lean Canvasの内容などを元に、MVP、SWOTなどの分析を行います。")
     st.divider()
 
-    # --- 必要な情報をsession_stateから取得 ---
-    tech_summary = st.session_state.get('tech_summary', '')
-    selected_target = st.session_state.get('selected_target', '')
-    lc_parsed_blocks = st.session_state.get('lean_canvas_parsed_blocks', {})
-    # ... (VPCデータや、編集されたLean Canvasの各ブロックの値も必要に応じて取得) ...
-    # 例: lean_canvas_data = { key.replace('lc_', ''): st.session_state[key] for key in st.session_state if key.startswith('lc_') }
-    lean_canvas_problem = st.session_state.get('lc_課題', '') # key名を正確に指定
-    lean_canvas_solution = st.session_state.get('lc_解決策', '')
-    lean_canvas_uvp = st.session_state.get('lc_独自の価値提案', '')
-    lc_revenue = lc_parsed_blocks.get('収益の流れ', '')
-    lc_cost = lc_parsed_blocks.get('コスト構造', '')
-    
-    if (
-        'mvp_ideas_text' not in st.session_state or
-        'swot_analysis_text' not in st.session_state or
-        'four_p_analysis_text' not in st.session_state or
-        'three_c_analysis_text' not in st.session_state or
-        'financials_ideas_text' not in st.session_state
-    ):
-        st.info("AIが深掘り分析を実行中です。少々お待ちください...")
-        all_analyses_successful = True
-   
-   
+    # --- MVP定義 (ユーザー記述) は4P分析の入力になる ---
+    # ウィジェットの値はステップを離れると消えるので mvp_definition_final にも保存し、戻ってきた時に復元する
+    if 'mvp_definition_user' in st.session_state:
+        st.session_state.mvp_definition_final = st.session_state.mvp_definition_user
+    elif 'mvp_definition_final' in st.session_state:
+        st.session_state.mvp_definition_user = st.session_state.mvp_definition_final
+
+    # --- ★★★ 5つの深掘り分析を並列実行 ★★★ ---
+    # 独立した分析は同時にGeminiへ投げ、財務計画は4P分析、3C分析はSWOT分析の結果を待ってから実行する
+    # 生成中もMVP定義やコメントは編集できる (MVP定義を変えると4P分析から先が作り直される)
+    run_pipeline(['mvp', 'swot', 'four_p', 'three_c', 'financials'], "Geminiが深掘り分析を並列で実行中...")
+
     # --- MVP検討セクション ---
     with st.expander("MVP (Minimum Viable Product) の検討", expanded=True):
         st.markdown("""
@@ -830,47 +765,10 @@ elif st.session_state.step == 3:
         AIの提案を参考に、あなたの技術で最初に検証すべき核となる価値と、それを実現するシンプルな製品アイデアを考えてみましょう。
         """)
 
-        # AIにMVP案を提案させるボタン
-        if 'mvp_ideas_text' not in st.session_state: 
-            mvp_prompt = f"""
-            以下の情報を元に、実現可能で価値検証に適したMVP（Minimum Viable Product）のアイデアを2～3個提案してください。それぞれのMVPについて、主要な機能、ターゲットユーザー、検証したい仮説を簡潔に記述してください。
-
-                # 技術概要:
-                {tech_summary}
-
-                # ターゲット顧客:
-                {selected_target}
-
-                # Lean Canvas - 課題:
-                {lean_canvas_problem if lean_canvas_problem else "（Lean Canvasの課題情報は提供されていません）"}
-
-                # Lean Canvas - 解決策:
-                {lean_canvas_solution if lean_canvas_solution else "（Lean Canvasの解決策情報は提供されていません）"}
-
-                # Lean Canvas - 独自の価値提案:
-                {lean_canvas_uvp if lean_canvas_uvp else "（Lean CanvasのUVP情報は提供されていません）"}
-
-                # 出力形式 (マークダウン):
-                **MVP案1:**
-                * 主要機能: ...
-                * ターゲットユーザー（初期）: ...
-                * 検証したい仮説: ...
-
-                **MVP案2:**
-                ... (同様に)
-                """
-            try:
-                with st.spinner("GeminiがMVP案を分析中..."):
-                    response_mvp = model.generate_content(mvp_prompt)
-                    st.session_state.mvp_ideas_text = response_mvp.text # 結果を保存
-            except Exception as e:
-                st.error(f"MVP案生成中にエラー: {e}")
-                st.session_state.mvp_ideas_text = "MVP案の生成に失敗"
-
-            # AIが生成したMVP案の表示 (session_stateに保存後)
-        if 'mvp_ideas_text' in st.session_state:
+        # AIが生成したMVP案の表示 (session_stateに保存後)
+        if 'mvp_ideas_text' in artifacts:
             st.subheader("AIによるMVP提案")
-            st.markdown(st.session_state.mvp_ideas_text)
+            st.markdown(artifacts['mvp_ideas_text'])
             st.divider()
 
         # ユーザーがMVP定義を記述する欄
@@ -888,48 +786,10 @@ elif st.session_state.step == 3:
         AIが提案する各要素を参考に、自社の状況を客観的に把握しましょう。（クロスSWOT分析は今後のステップで検討します）
         """)
 
-        if 'swot_analysis' not in st.session_state: 
-            swot_prompt = f"""以下の情報を元に、この事業アイデアに関するSWOT分析（強み、弱み、機会、脅威）を行ってください。内部環境と外部環境の両面から、具体的な要素をリストアップしてください。
-
-            # 技術概要:
-            {tech_summary}
-
-            # ターゲット顧客:
-            {selected_target}
-
-            # Lean Canvas (主要項目):
-            * 課題: {lean_canvas_problem}
-            * 解決策: {lean_canvas_solution}
-            * 独自の価値提案: {lean_canvas_uvp}
-            # (必要なら他のLean Canvas項目も追加)
-
-            # 出力形式 (マークダウン):
-            ## SWOT分析結果
-            * **強み (Strengths):**
-                * [要素1]
-                * [要素2]
-            * **弱み (Weaknesses):**
-                * [要素1]
-                * [要素2]
-            * **機会 (Opportunities):**
-                * [要素1]
-                * [要素2]
-            * **脅威 (Threats):**
-                * [要素1]
-                * [要素2]
-            """
-            try:
-                with st.spinner("GeminiがSWOT分析を実行中..."):
-                        response_swot = model.generate_content(swot_prompt)
-                        st.session_state.swot_analysis = response_swot.text # 結果を保存
-            except Exception as e:
-                st.error(f"SWOT分析中にエラー: {e}")
-                st.session_state.swot_analysis = "SWOT分析の生成に失敗"
-
         # AIが生成したSWOT分析結果の表示
-        if 'swot_analysis' in st.session_state:
+        if 'swot_analysis' in artifacts:
             st.subheader("AIによるSWOT分析結果")
-            st.markdown(st.session_state.swot_analysis)
+            st.markdown(artifacts['swot_analysis'])
             st.divider()
 
         # ユーザーコメント欄
@@ -948,60 +808,10 @@ elif st.session_state.step == 3:
         AIの提案を参考に、具体的なマーケティング施策のアイデアを練りましょう。
         """)
 
-    # AIに4P分析を実行させるボタン
-        if 'four_p_analysis_text' not in st.session_state: # MVPがまだ生成されていなければif st.button("4P分析をAIに実行させる", key="generate_4p"):
-            # 必要なコンテキストを取得 (Lean Canvasの内容全体を使う例)
-            lc_parsed_blocks = st.session_state.get('lean_canvas_parsed_blocks', {})
-            lc_context = "\n".join([f"### {k}\n{v}" for k, v in lc_parsed_blocks.items()])
-            mvp_definition = st.session_state.get('mvp_definition_user', '(未定義)') # MVP定義も参照
-
-            four_p_prompt = f"""以下の情報に基づいて、この事業アイデアの4P分析を行い、具体的な戦略案を提案してください。
-
-            # 技術概要:
-            {tech_summary}
-
-            # ターゲット顧客:
-            {selected_target}
-
-            # MVP定義 (ユーザー記述):
-            {mvp_definition}
-
-            # Lean Canvas Draft:
-            {lc_context}
-
-            # 分析する4P項目と指示:
-            * **Product（製品・サービス）:** MVP案を踏まえ、どのような製品/サービス形態、品質、デザイン、ブランド名などが考えられるか？
-            * **Price（価格）:** どのような価格設定（例：買い切り、サブスク）、価格帯、割引戦略などが考えられるか？ 顧客の価値認識やコスト構造も考慮。
-            * **Place（流通・チャネル）:** Lean Canvasのチャネル案を元に、どのように顧客に製品/サービスを届けるか？（例：直販、代理店、オンライン）
-            * **Promotion（販促・プロモーション）:** どのようにターゲット顧客に製品/サービスを知ってもらい、購入を促すか？（例：広告、広報、Webマーケティング、展示会）
-
-            # 出力形式 (マークダウン):
-            ## 4P分析結果
-            ### Product（製品・サービス）
-            * [提案1]
-            * [提案2]
-            ### Price（価格）
-            * [提案1]
-            * [提案2]
-            ### Place（流通・チャネル）
-            * [提案1]
-            * [提案2]
-            ### Promotion（販促・プロモーション）
-            * [提案1]
-            * [提案2]
-            """
-            try:
-                with st.spinner("Geminiが4P分析を実行中..."):
-                        response_4p = model.generate_content(four_p_prompt)
-                        st.session_state.four_p_analysis_text = response_4p.text # 結果を保存
-            except Exception as e:
-                st.error(f"4P分析中にエラー: {e}")
-                st.session_state.four_p_analysis_text = "4P分析の生成に失敗"
-
         # AIが生成した4P分析結果の表示
-        if 'four_p_analysis_text' in st.session_state:
+        if 'four_p_analysis_text' in artifacts:
             st.subheader("AIによる4P分析結果")
-            st.markdown(st.session_state.four_p_analysis_text)
+            st.markdown(artifacts['four_p_analysis_text'])
             st.divider()
 
         # ユーザーコメント欄
@@ -1018,76 +828,10 @@ elif st.session_state.step == 3:
         AIがこれまでの情報を統合して提案する分析結果を元に、自社の立ち位置と戦略の方向性を確認しましょう。
         """)
 
-    # AIに3C分析を実行させる
-        if 'three_c_analysis_text' not in st.session_state:
-            # --- AI呼び出しロジック (3C用) ---
-            # 必要なコンテキストを収集 (より多くの情報を活用)
-            tech_summary = st.session_state.get('tech_summary', '')
-            selected_target = st.session_state.get('selected_target', '')
-            potential_problems = st.session_state.get('potential_problems', '')
-            vpc_data = st.session_state.get('vpc_final_data', {})
-            lc_parsed_blocks = st.session_state.get('lean_canvas_parsed_blocks', {})
-            swot_analysis = st.session_state.get('swot_analysis_text', '') # SWOT結果も活用
-
-            # Lean Canvasから関連情報を抽出
-            lc_customer = lc_parsed_blocks.get('顧客セグメント', '')
-            lc_problem = lc_parsed_blocks.get('課題', '')
-            lc_unfair_advantage = lc_parsed_blocks.get('lc_圧倒的優位性', '') # 競合情報含む可能性あり
-            lc_solution = lc_parsed_blocks.get('解決策', '')
-
-            three_c_prompt = f"""以下の提供情報に基づいて、3C分析（顧客、競合、自社）を行ってください。各要素について、重要なポイントを整理し、簡潔に記述してください。
-
-            # 提供情報
-            ## 技術概要:
-            {tech_summary}
-
-            ## ターゲット顧客（初期案）:
-            {selected_target}
-
-            ## 顧客の課題リスト（AI提案）:
-            {potential_problems}
-
-            ## Value Proposition Canvas:
-            {vpc_data}
-
-            ## Lean Canvas Draft (抜粋):
-            * 顧客セグメント: {lc_customer}
-            * 課題: {lc_problem}
-            * 解決策: {lc_solution}
-            * 圧倒的優位性: {lc_unfair_advantage}
-
-            ## SWOT分析結果:
-            {swot_analysis}
-
-            # 分析すべき3C項目と指示:
-            * **Customer（顧客）:** ターゲット顧客は誰か？市場規模やニーズは？（既存情報を統合・整理）
-            * **Competitor（競合）:** 主要な競合は誰か？競合の強み・弱みは？（既存情報に加え、推測や一般的な知見も加味）
-            * **Company（自社）:** 自社の強み・弱みは？（技術、リソース、SWOTなどを考慮） どうすれば競合に勝てるか？
-
-            # 出力形式 (マークダウン):
-            ## 3C分析結果
-            ### Customer（顧客）
-            * [分析結果1]
-            * [分析結果2]
-            ### Competitor（競合）
-            * [分析結果1]
-            * [分析結果2]
-            ### Company（自社）
-            * [分析結果1]
-            * [分析結果2]
-            """
-            try:
-                with st.spinner("Geminiが3C分析を実行中..."):
-                        response_3c = model.generate_content(three_c_prompt)
-                        st.session_state.three_c_analysis_text = response_3c.text # 結果を保存
-            except Exception as e:
-                st.error(f"3C分析中にエラー: {e}")
-                st.session_state.three_c_analysis_text = "3C分析の生成に失敗"
-
         # AIが生成した3C分析結果の表示
-        if 'three_c_analysis_text' in st.session_state:
+        if 'three_c_analysis_text' in artifacts:
             st.subheader("AIによる3C分析結果")
-            st.markdown(st.session_state.three_c_analysis_text)
+            st.markdown(artifacts['three_c_analysis_text'])
             st.divider()
 
         # ユーザーコメント欄
@@ -1102,62 +846,10 @@ elif st.session_state.step == 3:
         実現可能性のあるビジネスモデルを考える上での参考にしてください。
         """)
 
-        # AIに財務計画の初期アイデアを提案させるボタン
-        if 'financials_ideas_text' not in st.session_state:
-            # --- AI呼び出しロジック (財務初期用) ---
-            # 必要なコンテキストを収集 (Lean Canvas, 4Pなど)
-            tech_summary = st.session_state.get('tech_summary', '')
-            lc_parsed_blocks = st.session_state.get('lean_canvas_parsed_blocks', {})
-            four_p_analysis = st.session_state.get('four_p_analysis_text', '') # 4P分析結果も参照
-
-            # Lean Canvasから関連情報を抽出
-            lc_revenue = lc_parsed_blocks.get('収益の流れ', '')
-            lc_cost = lc_parsed_blocks.get('コスト構造', '')
-            lc_solution = lc_parsed_blocks.get('解決策', '')
-
-            financial_prompt = f"""以下の提供情報に基づいて、この事業アイデアの初期段階における財務計画の「骨子」を提案してください。これは詳細な予測ではなく、主要な要素と考え方を整理するものです。
-
-            # 提供情報
-            ## 技術概要:
-            {tech_summary}
-
-            ## Lean Canvas Draft (抜粋):
-            * 解決策: {lc_solution}
-            * 収益の流れ: {lc_revenue}
-            * コスト構造: {lc_cost}
-
-            ## 4P分析結果 (抜粋):
-            {four_p_analysis} # 価格戦略などが参考になる可能性
-
-            # 提案してほしい項目と指示:
-            * **主要な収益源 (Revenue Streams):** Lean Canvasのアイデアを元に、考えられる具体的な収益源をリストアップ。
-            * **主要なコスト構造 (Cost Structure):** Lean Canvasのアイデアを元に、主な変動費・固定費の項目をリストアップ。
-            * **初期の財務的考慮事項 (Initial Financial Considerations):** 価格設定の考え方、初期投資の主な項目、資金調達の必要性、最初に追うべき財務指標（例：損益分岐点、CAC）など、この段階で意識すべき点をいくつか提案。
-
-            # 出力形式 (マークダウン):
-            ## 財務計画（初期アイデア）
-            ### 主要な収益源
-            * [アイデア1]
-            * [アイデア2]
-            ### 主要なコスト構造
-            * [アイデア1]
-            * [アイデア2]
-            ### 初期の財務的考慮事項
-            * [ポイント1]
-            * [ポイント2]
-            """
-            try:
-                with st.spinner("Geminiが財務計画（初期）を分析中..."):
-                     response_financials = model.generate_content(financial_prompt)
-                     st.session_state.financials_ideas_text = response_financials.text # 結果を保存
-            except Exception as e:
-                st.error(f"財務計画（初期）の生成中にエラー: {e}")
-                st.session_state.financials_ideas_text = "財務計画（初期）の生成に失敗"
-
         # AIが生成した財務計画（初期）アイデアの表示
-        if 'financials_ideas_text' in st.session_state:
+        if 'financials_ideas_text' in artifacts:
             st.subheader("AIによる財務計画（初期）アイデア")
-            st.markdown(st.session_state.financials_ideas_text)
+            st.markdown(artifacts['financials_ideas_text'])
             st.divider()
 
         # ユーザーコメント欄
@@ -1169,12 +861,6 @@ elif st.session_state.step == 3:
     with col_nav1_step3:
         if st.button("ステップ2a（Lean Canvas）に戻る", key="back_to_step2a"):
             st.session_state.step = 2.1
-            # このステップで生成したデータをクリア
-            if 'mvp_ideas_text' in st.session_state: del st.session_state.mvp_ideas_text
-            if 'swot_analysis_text' in st.session_state: del st.session_state.swot_analysis_text
-            # ユーザー入力もクリアするかどうかは要検討
-            # if 'mvp_definition_user' in st.session_state: del st.session_state.mvp_definition_user
-            # if 'swot_comments_user' in st.session_state: del st.session_state.swot_comments_user
             st.rerun()
     with col_nav2_step3:
         if st.button("ステップ4（競合分析→Moat）へ進む", key="goto_step4"):
@@ -1191,160 +877,28 @@ elif st.session_state.step == 4:
     st.divider()
 
     # --- 必要な情報をsession_stateから取得 ---
-    tech_summary = st.session_state.get('tech_summary', '')
-    lc_competitors_input = st.session_state.get('lc_競合', '') # Lean Canvasの競合キーを確認
-    lc_unfair_advantage = st.session_state.get('lc_圧倒的優位性', '') # Lean Canvasの優位性キーを確認
-    swot_analysis = st.session_state.get('swot_analysis_text', '')
-
-    # --- ステップ4のAI分析をここで実行 (まだ結果がなければ) ---
-    if not st.session_state.get('step4_analyses_complete', False):
-        st.info("AIが競合分析とMoat提案を実行中です。これには数分かかることがあります...")
-        all_analyses_successful_step4 = True # エラー追跡用フラグ
+    lc_unfair_advantage = st.session_state.get('lean_canvas_final', {}).get('圧倒的優位性', '') # ステップ2aで編集した優位性
+    swot_analysis = artifacts.get('swot_analysis', '')
 
-    
-    # --- 1. 競合分析 (Web検索あり) ---
-        if 'competitor_analysis_text' not in st.session_state:
-            web_search_results_summary = ""
-            search_keywords_generated_by_ai = []        # --- 1. AIによる検索キーワード生成 ---
-            try:
-                with st.spinner("AIが検索キーワードを生成中... (ステップ4 - 1/4)"):
-                    # ↓↓↓ キーワード生成プロンプトを修正 ↓↓↓
-                    keyword_prompt = f"""あなたは市場調査の専門家です。
-                    以下の「技術概要」と「既存の競合情報」のみに基づいて、詳細な競合分析を行うために効果的かつ具体的なGoogle検索キーワードを3～5個提案してください。
-                    これまでの会話の文脈は考慮せず、今回提示された情報だけで判断してください。
-                    キーワードのみを箇条書きで出力してください。
-
-                    # 技術概要:
-                    {tech_summary}
-
-                    # 既存の競合情報（あれば）:
-                    {lc_competitors_input if lc_competitors_input else "特になし"}
-                    """
-                    # ↑↑↑ キーワード生成プロンプトを修正 ↑↑↑
-                    response_keywords = model.generate_content(keyword_prompt)
-                    search_keywords_text = response_keywords.text
-                    search_keywords_generated_by_ai = [kw.strip("* ").strip() for kw in search_keywords_text.splitlines() if kw.strip() and not kw.strip().startswith("Please provide")] # AIがエラーを返した場合の対策
-                
-                # 1b. Web検索実行 (Google Custom Search API)　
-                if search_keywords_generated_by_ai:
-                    st.subheader("AIが生成した検索キーワード:")
-                    st.write(search_keywords_generated_by_ai)
-                else:
-                    st.warning("AIによる検索キーワード生成に失敗したか、キーワードがありませんでした。AIの応答を確認してください。")
-                    st.text(search_keywords_text) # AIの応答そのものを表示
-
-                # --- 2. Web検索の実行 (Google Custom Search API) ---
-                if search_keywords_generated_by_ai:
-                    with st.spinner("Google検索を実行し、関連情報を収集中... (ステップ4 - 2/4)"):
-                        google_api_key = st.secrets["GOOGLE_API_KEY"]
-                        search_engine_id = st.secrets["SEARCH_ENGINE_ID"]
-                        service = build("customsearch", "v1", developerKey=google_api_key)
-                        search_snippets = []
-
-                        for keyword in search_keywords_generated_by_ai[:3]:
-                            st.markdown(f"**'{keyword}' でGoogle検索中...**")
-                            try:
-                                res = service.cse().list(q=keyword, cx=search_engine_id, num=2).execute()
-                                if 'items' in res:
-                                    for item in res['items']:
-                                        title = item.get('title', 'タイトルなし')
-                                        link = item.get('link', '#')
-                                        snippet = item.get('snippet', '概要なし').replace('\n', ' ')
-                                        search_snippets.append(f"- タイトル: {title}\n  概要: {snippet}\n  URL: {link}\n")
-                            except Exception as search_e:
-                                st.warning(f"'{keyword}' のGoogle検索中にエラー: {search_e}") # エラーではなく警告
-                        if search_snippets:
-                            web_search_results_summary = "\n---\n".join(search_snippets)
-                else:
-                    web_search_results_summary = "検索キーワードがないか生成に失敗したため、Web検索はスキップされました。"
-
-                # --- 1c.  AIによる最終的な競合分析 (変更なし、web_search_results_summary を使用) ---
-                with st.spinner("Web検索結果を元にAIが最終分析中...(ステップ4 - 3/4)"):
-                     competitor_prompt_final = f"""以下の「技術概要」、「Lean Canvas記載の競合情報」、および「Web検索からの関連情報」に基づいて、主要な競合企業（または代替技術）を特定し、それぞれの特徴、強み、弱み、市場での評判や最近の動向などを詳細に分析してください。
-
-                    # 技術概要:
-                    {tech_summary}
-
-                    # Lean Canvas記載の競合情報（あれば）:
-                    {lc_competitors_input if lc_competitors_input else "特になし"}
-
-                    # Web検索からの関連情報:
-                    {web_search_results_summary if web_search_results_summary else "Web検索結果なし"}
-
-                    # 分析してほしい観点:
-                    * 主要な競合企業/技術名
-                    * 提供している製品/サービス
-                    * 想定されるターゲット顧客
-                    * 強み
-                    * 弱み
-                    * 価格帯やビジネスモデル（推測で可）
-                    * 市場での評判や最近の動向（Web検索結果から推測できる場合）
-
-                    # 出力形式 (マークダウン):
-                    ## 競合分析結果 (Web調査加味)
-                    ### 競合A: [企業名/技術名]
-                    * 製品/サービス: ...
-                    (以下、各観点について記述)
-                    ### 競合B: [企業名/技術名]
-                    ... (同様に)
-                    """
-                response_competitors = model.generate_content(competitor_prompt_final)
-                st.session_state.competitor_analysis_text = response_competitors.text
-            
-            except Exception as e:
-                st.error(f"競合分析プロセス中にエラー: {e}")
-                st.session_state.competitor_analysis_text = "競合分析の生成に失敗"
-                all_analyses_successful_step4 = False
-
-           
-    # --- 2. Moat提案 (まだなければ、かつ競合分析が（一応）終わっていれば) ---
-        if 'moat_ideas_text' not in st.session_state:
-            # Moat生成に必要なコンテキストを取得
-            competitor_analysis_results_for_moat = st.session_state.get('competitor_analysis_text', '(競合分析結果なし)')
-            
-            moat_prompt = f"""以下の情報に基づいて、この事業の持続可能な競争優位性（Moat）となりうる要素を特定し、それを表現する簡潔なステートメント案を1～3個提案してください。なぜそれが競合にとって模倣困難なのか、理由も添えてください。
-
-            # 技術概要:
-            {tech_summary}
-
-            # Lean Canvas - 圧倒的優位性（ユーザー記述）:
-            {lc_unfair_advantage if lc_unfair_advantage else "（記述なし）"}
-
-            # SWOT分析結果:
-            {swot_analysis if swot_analysis else "（SWOT分析結果なし）"}
-
-            # 競合分析結果 (Web調査加味):
-            {competitor_analysis_results_for_moat}
-
-            # 出力形式 (マークダウン):
-            ## Moat（持続可能な競争優位性）の提案
-            **Moat案1:** [Moatを表すステートメント]
-            * 理由: [なぜ模倣困難かの説明]
-            (最大3つまで)
-            """
-            try:
-                with st.spinner("GeminiがMoatを分析中... (ステップ4 - 4/4)"):
-                     response_moat = model.generate_content(moat_prompt)
-                     st.session_state.moat_ideas_text = response_moat.text
-            except Exception as e:
-                st.error(f"Moat生成中にエラー: {e}")
-                st.session_state.moat_ideas_text = "Moatの生成に失敗"
-                all_analyses_successful_step4 = False
-        
-        if all_analyses_successful_step4:
-            st.success("ステップ4のAI分析が完了しました。")
-            st.session_state.step4_analyses_complete = True # 完了フラグを立てる
-        else:
-            st.warning("ステップ4のAI分析中に一部エラーが発生しました。")
-        st.rerun() # 表示を確定させるためにリラン
+    # --- ステップ4のAI分析をここで実行 (まだ結果が無いか、入力が変わっていれば) ---
+    # 競合分析 (検索キーワード生成 → Google検索 → 最終分析) の後に、その結果を使ってMoatを提案する
+    run_pipeline(['competitors', 'moat'], "AIが競合分析とMoat提案を実行中です。これには数分かかることがあります...")
 
     # --- 競合分析セクション (表示と編集) ---
     with st.expander("競合分析", expanded=True):
         st.markdown("主要な競合について、製品・サービス、強み・弱みなどを分析します。")
         # 個別の生成ボタンは削除
-        if 'competitor_analysis_text' in st.session_state:
+        if st.session_state.get('competitor_search_keywords'):
+            st.subheader("AIが生成した検索キーワード:")
+            st.write(st.session_state.competitor_search_keywords)
+        elif artifacts.get('competitor_search_raw'):
+            st.warning("AIによる検索キーワード生成に失敗したか、キーワードがありませんでした。AIの応答を確認してください。")
+            st.text(artifacts['competitor_search_raw']) # AIの応答そのものを表示
+        for competitor_warning in st.session_state.get('competitor_search_warnings', []):
+            st.warning(competitor_warning)
+        if 'competitor_analysis_text' in artifacts:
             st.subheader("AIによる競合分析結果 (Web検索加味)")
-            st.markdown(st.session_state.competitor_analysis_text)
+            st.markdown(artifacts['competitor_analysis_text'])
             st.divider()
         else:
             st.info("競合分析結果を生成中です...") # AI処理中に表示される可能性
@@ -1363,24 +917,17 @@ elif st.session_state.step == 4:
         # 個別の生成ボタンは削除
 
         # AIが生成したMoat案の表示と選択UI
-        if 'moat_ideas_text' in st.session_state:
+        if 'moat_ideas_text' in artifacts:
             st.subheader("AIによるMoat提案（参考にしてください）")
-            raw_moat_text = st.session_state.moat_ideas_text
+            raw_moat_text = artifacts['moat_ideas_text']
             moat_proposals = [] # パース結果を格納するリスト
             if raw_moat_text and raw_moat_text != "Moatの生成に失敗":
-                # (ここにMoat案をパースするロジック - 前回実装したもの)
-                split_parts = re.split(r'(\*\*Moat案\s?\d+:\*\*)', raw_moat_text)
-                current_proposal = ""
-                for i_moat, part_moat in enumerate(split_parts):
-                    if part_moat.startswith("**Moat案"):
-                        if current_proposal: moat_proposals.append(current_proposal.strip())
-                        current_proposal = part_moat
-                    elif current_proposal: current_proposal += part_moat
-                if current_proposal: moat_proposals.append(current_proposal.strip())
+                moat_proposals = split_moat_proposals(raw_moat_text)
             
             if moat_proposals:
+                previous_moats = artifacts.get('selected_ai_moats_text_final', '') # 前回選んだ案はチェック済みで表示
                 for i, proposal_text in enumerate(moat_proposals):
-                    st.checkbox(f"Moat案 {i+1} を検討候補にする", key=f"moat_select_{i}")
+                    st.checkbox(f"Moat案 {i+1} を検討候補にする", value=proposal_text in previous_moats, key=f"moat_select_{i}")
                     st.markdown(proposal_text)
                     st.markdown("---")
             else:
@@ -1391,7 +938,8 @@ elif st.session_state.step == 4:
 
         # ユーザーが最終的なMoatを記述する欄
         st.subheader("最終的なMoatの定義")
-        st.text_area("AIの提案やこれまでの分析を踏まえ、この事業のMoatを定義してください。", height=150, key="moat_definition_user_step4")
+        st.text_area("AIの提案やこれまでの分析を踏まえ、この事業のMoatを定義してください。", height=150,
+                     value=st.session_state.get('final_moat_definition_user', ''), key="moat_definition_user_step4")
 
     st.divider()
     # --- ナビゲーション ---
@@ -1399,45 +947,29 @@ elif st.session_state.step == 4:
     with col_nav1_step4:
         if st.button("ステップ3（深掘り）に戻る", key="back_to_step3_from_4_auto"):
             st.session_state.step = 3
-            # このステップで生成した主要データをクリア
-            if 'competitor_analysis_text' in st.session_state: del st.session_state.competitor_analysis_text
-            if 'moat_ideas_text' in st.session_state: del st.session_state.moat_ideas_text
-            if 'step4_analyses_complete' in st.session_state: del st.session_state.step4_analyses_complete
             st.rerun()
     with col_nav2_step4:
         if st.button("ステップ5（ピッチ資料生成）へ進む", key="goto_step5_from_4_auto"):
             # 選択されたAI Moat案とユーザー定義Moatを保存
             selected_ai_moats = []
-            # (再度Moat案パースロジック - またはsession_stateからパース済みリストを取得)
-            # (上記表示部分の moat_proposals を使うのが理想だが、スコープの問題がある場合は再パース)
-            raw_moat_text_for_saving = st.session_state.get('moat_ideas_text', '')
-            parsed_moat_proposals_for_saving = [] # ここで再度パース処理が必要
+            # (表示時と同じパーサーで分割し直し、チェックされた案を取り出す)
+            raw_moat_text_for_saving = artifacts.get('moat_ideas_text', '')
+            parsed_moat_proposals_for_saving = []
             if raw_moat_text_for_saving and raw_moat_text_for_saving != "Moatの生成に失敗":
-                # (Moat案パースロジックをここに再記述)
-                split_parts_for_saving = re.split(r'(\*\*Moat案\s?\d+:\*\*)', raw_moat_text_for_saving)
-                current_proposal_for_saving = ""
-                for i_save, part_save in enumerate(split_parts_for_saving):
-                    if part_save.startswith("**Moat案"):
-                        if current_proposal_for_saving: parsed_moat_proposals_for_saving.append(current_proposal_for_saving.strip())
-                        current_proposal_for_saving = part_save
-                    elif current_proposal_for_saving: current_proposal_for_saving += part_save
-                if current_proposal_for_saving: parsed_moat_proposals_for_saving.append(current_proposal_for_saving.strip())
+                parsed_moat_proposals_for_saving = split_moat_proposals(raw_moat_text_for_saving)
 
             for i, _proposal_text in enumerate(parsed_moat_proposals_for_saving): # _proposal_textは使わない
                 if st.session_state.get(f"moat_select_{i}", False):
                     selected_ai_moats.append(parsed_moat_proposals_for_saving[i]) # 正しい提案テキストを追加
 
             if selected_ai_moats:
-                st.session_state.selected_ai_moats_text_final = "\n\n".join(selected_ai_moats)
+                artifacts['selected_ai_moats_text_final'] = "\n\n".join(selected_ai_moats)
             else:
-                if 'selected_ai_moats_text_final' in st.session_state: del st.session_state.selected_ai_moats_text_final
+                if 'selected_ai_moats_text_final' in artifacts: del artifacts['selected_ai_moats_text_final']
             
             st.session_state.final_moat_definition_user = st.session_state.get("moat_definition_user_step4", "")
             
             st.session_state.step = 5
-            # 次のステップで自動生成するので関連データをクリア
-            if 'pitch_deck_draft_text' in st.session_state: del st.session_state.pitch_deck_draft_text
-            if 'step4_analyses_complete' in st.session_state: del st.session_state.step4_analyses_complete # このステップの完了フラグもクリア
             st.rerun()
 
 # --- ステップ5: ピッチ資料自動生成 (自動実行) ---
@@ -1446,146 +978,24 @@ elif st.session_state.step == 5:
     st.caption("これまでの分析結果を統合し、ピッチ資料の骨子をAIが自動生成します。")
     st.divider()
 
-    # --- AIによるピッチ資料骨子生成 (まだ結果がなければ自動実行) ---
-    if 'pitch_deck_draft_text' not in st.session_state:
-        st.info("AIがピッチ資料骨子を生成中です... これまでの全情報を集約するため、少々お時間がかかります。")
-
-        # --- 必要な情報をsession_stateから取得 ---
-        tech_summary = st.session_state.get('tech_summary', '(技術概要の情報なし)')
-        selected_target = st.session_state.get('selected_target', '(ターゲット顧客の情報なし)')
-        selected_problems = st.session_state.get('selected_problems', []) # 選択された課題リスト
-        focused_problems_text = "\n".join([f"* {p}" for p in selected_problems]) if selected_problems else "(特に選択/記述された課題なし)"
-        
-        vpc_data = st.session_state.get('vpc_final_data', {}) # 編集後のVPCデータ
-        vpc_text = "\n".join([f"* {key}: {value}" for key, value in vpc_data.items() if value]) if vpc_data else "(VPC情報なし)"
-
-        # Lean Canvas (編集後の各ブロックの値を取得)
-        lc_keys = ["課題", "顧客セグメント", "独自の価値提案", "解決策", "チャネル", "収益の流れ", "コスト構造", "主要指標", "圧倒的優位性"]
-        lean_canvas_content = "## Lean Canvas 内容:\n"
-        for key_lc in lc_keys:
-            session_key_lc = f"lc_{key_lc.replace(' ', '_')}"
-            lean_canvas_content += f"### {key_lc}\n{st.session_state.get(session_key_lc, '(記述なし)')}\n\n"
-        
-        mvp_definition = st.session_state.get('mvp_definition_user_step3', '(MVP定義なし)')
-        swot_analysis = st.session_state.get('swot_analysis_text', '(SWOT分析結果なし)')
-        four_p_analysis = st.session_state.get('four_p_analysis_text', '(4P分析結果なし)')
-        three_c_analysis = st.session_state.get('three_c_analysis_text', '(3C分析結果なし)')
-        financials_ideas = st.session_state.get('financials_ideas_text', '(財務計画初期アイデアなし)')
-        competitor_analysis = st.session_state.get('competitor_analysis_text', '(競合分析結果なし)')
-        
-        # Moat情報 (選択されたAI案とユーザー最終定義の両方を考慮)
-        selected_ai_moats = st.session_state.get('selected_ai_moats_text_final', '')
-        final_user_moat = st.session_state.get('final_moat_definition_user', '') # キー名を合わせる
-        
-        moat_info_for_prompt = ""
-        if selected_ai_moats:
-            moat_info_for_prompt += f"\nAI提案Moat(ユーザー選択):\n{selected_ai_moats}"
-        if final_user_moat: # ユーザー定義Moatを優先または併記
-            moat_info_for_prompt += f"\n最終Moat定義(ユーザー記述):\n{final_user_moat}"
-        if not moat_info_for_prompt: # どちらも無い場合
-            moat_info_for_prompt = "\nMoat（持続可能な競争優位性）:\n(ステップ4で定義されていません)"
-
-        # --- AI呼び出しロジック (ピッチ資料生成用) ---
-        full_context = f"""以下は、ある技術シーズの事業化検討プロセスで整理された情報です。
-        これらの情報を戦略的に統合・要約し、指定された11項目のピッチ資料構成に沿った「発表用の骨子テキスト」を作成してください。
-        各項目の記述には、可能であればその根拠となった分析要素（例：SWOT分析より、市場調査より等）を括弧書きで簡潔に示唆してください。
-
-        # 提供情報サマリー
-        ## 技術概要:
-        {tech_summary}
-
-        ## ターゲット顧客:
-        {selected_target}
-
-        ## 顧客の主要な課題 (ユーザー選抜済):
-        {focused_problems_text}
-
-        ## Value Proposition Canvas:
-        {vpc_text}
-
-        ## Lean Canvas:
-        {lean_canvas_content}
-
-        ## MVP定義:
-        {mvp_definition}
-
-        ## SWOT分析:
-        {swot_analysis}
-
-        ## 4P分析:
-        {four_p_analysis}
-
-        ## 3C分析:
-        {three_c_analysis}
-
-        ## 財務計画（初期アイデア）:
-        {financials_ideas}
-
-        ## 競合分析:
-        {competitor_analysis}
-
-        ## Moat（持続可能な競争優位性）:
-        {moat_info_for_prompt}
-
-        ---
-        # 作成するピッチ資料構成（11項目 - 必ずこの見出しと順番で出力）:
-        ## 1. タイトル
-        [ここに事業タイトル案とキャッチコピー]
-
-        ## 2. 顧客の課題
-        [ここに記述。提供情報の「顧客の主要な課題」を元に、最も重要な課題を2-3点に絞り、箇条書き3点で具体的に記述]
-
-        ## 3. 解決策
-        [ここに記述。技術概要とVPCの「製品・サービス」「ペインリリーバー」「ゲインクリエイター」を元に、課題をどう解決するかを主要なポイントを箇条書きで明確に]
-
-        ## 4. 市場規模
-        [ここに記述。Lean Canvasの市場規模に関する情報を元に、具体的な市場規模と成長性、そのデータソースの示唆を箇条書きで]
-
-        ## 5. 競合
-        [ここに記述。競合分析の結果を元に、主要な競合とその特徴を簡潔に箇条書きで]
-
-        ## 6. 差別化ポイント・優位性（Moat含む）
-        [ここに記述。Moat情報、SWOTの強み、Lean Canvasの圧倒的優位性を元に、競合に対する明確なアドバンテージを箇条書きで簡潔に説明]
-
-        ## 7. ビジネスモデル
-        [ここに記述。Lean Canvasの収益の流れとコスト構造、4Pの価格戦略を元に、主要な収益化の方法を箇条書きで簡潔に説明]
-
-        ## 8. なぜ今か
-        [ここに記述。市場トレンド、技術的進展、社会情勢などを踏まえ、今この事業を始めるべき理由を完結に説明]
-
-        ## 9. なぜ自分（この会社）か
-        [ここに記述。技術的な強み、チームの専門性（あれば）、独自リソースなどを元に、この事業を成功させられる理由を箇条書きで簡潔に説明]
-
-        ## 10. 事業計画の骨子（3年）
-        [ここに記述。MVPから始め、段階的にどのようなマイルストーン（例：ユーザー獲得、製品開発、収益化）を目指すかの概要を箇条書きで簡潔に]
-
-        ## 11. 収支計画の概算（3年）
-        [ここに記述。主要な収益源とコスト構造から、非常に大まかな収益と費用の見通し、必要な初期投資の規模感などを示唆]
-
-        ---
-        各項目の内容は、投資家や経営層に伝えることを意識し、具体的で説得力のあるものにしてください。マークダウン形式で記述してください。
-        """
-
-        try:
-            with st.spinner("Geminiがピッチ資料骨子を全力で生成中..."):
-                response_pitch = model.generate_content(full_context)
-                st.session_state.pitch_deck_draft_text = response_pitch.text
-                st.success("ピッチ資料骨子の生成が完了しました。")
-                st.rerun() # 表示を更新するためにリラン
-        except Exception as e:
-            st.error(f"ピッチ資料骨子生成中にエラー: {e}")
-            st.session_state.pitch_deck_draft_text = "ピッチ資料骨子の生成に失敗しました。"
-            # st.rerun() # エラーでも一度リランしてエラーメッセージを表示させる
+    # --- AIによるピッチ資料骨子生成 (まだ結果が無いか、これまでの分析が変わっていれば自動実行) ---
+    # 大きいセクションはトークン予算内に収まるよう要約してからプロンプトに組み込む。
+    # 生成途中の文章は進捗表示の中に逐次表示される (全文が揃うまで待たせない)
+    pitch_busy = run_pipeline(['pitch'], "AIがピッチ資料骨子を生成中です... これまでの全情報を集約するため、少々お時間がかかります。")
 
     # --- 生成されたピッチ資料骨子の表示 ---
-    if 'pitch_deck_draft_text' in st.session_state:
+    if 'pitch_deck_draft_text' in artifacts and not pitch_busy:
         st.subheader("生成されたピッチ資料骨子（案）")
-        st.markdown(st.session_state.pitch_deck_draft_text)
+        st.markdown(artifacts['pitch_deck_draft_text'])
         # コピーボタン (簡易版)
         if st.button("骨子をクリップボードにコピー", key="copy_pitch_final"):
              st.success("コピーしました！（実際にはテキストを選択してコピーしてください）") # Streamlit単体でのクリップボードアクセスは難しい
-    else:
-        # API呼び出し中や、何らかの理由でまだ結果がない場合に表示
+        # プロンプトに入れた各セクションのトークン数 (要約したセクションも分かるように)
+        if st.session_state.get('pitch_context_report'):
+            with st.expander("生成に使った情報のトークン内訳", expanded=False):
+                st.dataframe(st.session_state.pitch_context_report, hide_index=True)
+    elif not pitch_busy:
+        # 何らかの理由でまだ結果がない場合に表示
         st.info("ピッチ資料骨子を準備中です。")
 
 
@@ -1595,14 +1005,10 @@ elif st.session_state.step == 5:
     with col_nav1_step5:
         if st.button("ステップ4（競合/Moat）に戻る", key="back_to_step4_from_5"): # キー名変更
             st.session_state.step = 4
-            if 'pitch_deck_draft_text' in st.session_state: del st.session_state.pitch_deck_draft_text
             st.rerun()
     with col_nav2_step5:
         if st.button("ステップ6（VCレビュー）へ進む", key="goto_step6_from_5"): # キー名変更
             st.session_state.step = 6
-            # VCレビューはステップ6で自動生成するので、ここではクリア不要
-            if 'vc_review_results_text' in st.session_state:
-                del st.session_state.vc_review_results_text # 前回のVCレビュー結果があればクリア
             st.rerun()
 
 # --- ステップ6: VC/役員レビュー ---
@@ -1612,7 +1018,7 @@ elif st.session_state.step == 6:
     st.divider()
 
     # --- 評価対象ピッチ骨子の取得 ---
-    pitch_draft = st.session_state.get('pitch_deck_draft_text', '')
+    pitch_draft = artifacts.get('pitch_deck_draft_text', '')
 
     if not pitch_draft:
         st.warning("評価対象のピッチ資料骨子が見つかりません。ステップ5で生成してください。")
@@ -1627,47 +1033,15 @@ elif st.session_state.step == 6:
         st.divider()
 
 
-    # --- VC評価の生成 (まだ結果がなければ実行) ---
-    if 'vc_review_results_text' not in st.session_state: # 保存用キーを変更
-        st.info("AI(VC)がピッチ資料をレビュー中です...")
-
-        # プロンプト作成 (VC評価用 - 以前のものと同様)
-        vc_review_prompt = f"""あなたは、革新的な技術シーズの事業化可能性を評価する、経験豊富で厳しい視点を持つベンチャーキャピタリスト（VC）です。ビジネスとしての「儲かるか」「スケールするか」「持続可能か」という観点を最も重視します。
-
-        以下の「ピッチ資料骨子」をVCの視点から厳しく評価し、下記の形式で箇条書きで簡潔にフィードバックを出力してください。
-
-        # 評価対象ピッチ資料骨子:
-        ---
-        {pitch_draft}
-        ---
-
-        # 出力形式:
-        1.  **事業評価スコア（10点満点）:**
-            * ビジネスとしての魅力度、ピッチ内容の完成度を総合的に10点満点で評価し、その主な根拠を箇条書きで簡潔に述べてください。
-        2.  **課題リスト:**
-            * このピッチ内容や事業計画における、特に問題となる点、リスク、さらなる深掘りや改善が必要な点を「課題」として具体的にリストアップしてください。各課題について、なぜそれが問題なのかをVC視点で箇条書きで簡潔に説明してください。
-        3.  **Next Actionリスト:**
-            * 上記の課題を解決し、事業化や資金調達に向けて次に行うべき具体的なアクションを優先度が高い順に提案してください。各アクションについて、それが「LLMに手伝ってもらえること」か「起業家/研究者自身が行う必要があること」かを明記してください。
-
-        フィードバックは具体的かつ建設的であるべきですが、視点は厳しく保ってください。マークダウン形式で記述してください。
-        """
-
-        try:
-            with st.spinner("Gemini(VC)がレビュー中..."):
-                response_vc_review = model.generate_content(vc_review_prompt)
-                st.session_state.vc_review_results_text = response_vc_review.text # 結果を保存
-                st.success("VCレビューが完了しました！")
-                st.rerun() # 表示のために再実行
-        except Exception as e:
-            st.error(f"VCレビュー中にエラーが発生しました: {e}")
-            st.session_state.vc_review_results_text = "AIによるVCレビューに失敗しました。"
+    # --- VC評価の生成 (まだ結果が無いか、ピッチ資料骨子が変わっていれば実行) ---
+    run_pipeline(['vc_review'], "Gemini(VC)がレビュー中...")
 
     # --- VC評価結果の表示 ---
     st.subheader("AI(VC)によるレビュー結果")
-    if 'vc_review_results_text' in st.session_state:
+    if 'vc_review_results_text' in artifacts:
         # !!! 本来はAI応答テキストをパースして項目ごとに表示する !!!
         # (今回は簡易的に応答全体を表示)
-        st.markdown(st.session_state.vc_review_results_text)
+        st.markdown(artifacts['vc_review_results_text'])
     else:
         st.info("VCレビュー結果を生成中です...")
 
@@ -1678,7 +1052,6 @@ elif st.session_state.step == 6:
     with col_nav1_step6:
         if st.button("ステップ5（ピッチ資料生成）に戻る", key="back_to_step5"):
             st.session_state.step = 5
-            if 'vc_review_results_text' in st.session_state: del st.session_state.vc_review_results_text
             st.rerun()
     with col_nav2_step6:
         # アプリケーションの最後に到達
@@ -1690,5 +1063,6 @@ elif st.session_state.step == 6:
              for key in list(st.session_state.keys()):
                  if key != 'step': # step以外を削除する場合（初期化処理に任せる）
                     del st.session_state[key]
+             st.query_params.clear() # 新しいプロジェクトとして始める (前のプロジェクトは保存したまま)
              st.session_state.step = 0
              st.rerun()
\ No newline at end of file
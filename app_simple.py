@@ -1,15 +1,34 @@
 # ------app.pyのシンプル版、技術概要を入れるとピッチ資料を自動作成--------
 
 import streamlit as st
-import google.generativeai as genai
 import os
 # import re # 正規表現モジュールをインポート
 
-# --- APIキーの設定 (変更なし) ---
+from bizdev.gemini import stream_text # ストリーミング表示
+from bizdev.lazy import LazyResource # 重いSDKの遅延読み込み
+from bizdev.ratelimit import get_limiter, limiter_settings # APIクォータ共有のレート制限
+from bizdev.resources import get_model # プロセス内で共有するモデル
+
+# --- APIキーの設定 ---
+# モデルはプロセス内で1つだけ作って全セッションで共有する (bizdev.resources)。
+# Gemini SDK の import とモデル作成は、最初にAIを呼び出す時まで遅らせる (起動直後の画面表示を速くする)
 try:
     api_key = st.secrets["GEMINI_API_KEY"]
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-1.5-flash')
+    llm_cache_ttl_seconds = int(st.secrets.get("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+    llm_cache_max_bytes = int(st.secrets.get("LLM_CACHE_MAX_MB", 200)) * 1024 * 1024
+    # APIクォータはキー単位なので、全セッションの呼び出しをプロセス共通のレート制限に通す ([rate_limits] で設定)
+    rate_limits = limiter_settings(st.secrets)
+    gemini_limiter = get_limiter("gemini", *rate_limits["gemini"])
+    # 一時的なエラー(429/503など)は自動で再試行する。GENERATION_HEDGE = true で遅い呼び出しのヘッジも有効になる
+    generation_options = {
+        "max_attempts": int(st.secrets.get("GENERATION_MAX_ATTEMPTS", 4)),
+        "call_timeout": float(st.secrets.get("GENERATION_CALL_TIMEOUT_SECONDS", 90)),
+        "total_deadline": float(st.secrets.get("GENERATION_DEADLINE_SECONDS", 180)),
+        "hedge": bool(st.secrets.get("GENERATION_HEDGE", False)),
+        "limiter": gemini_limiter,
+    }
+    model = LazyResource(lambda: get_model(api_key, cache_ttl_seconds=llm_cache_ttl_seconds, cache_max_bytes=llm_cache_max_bytes,
+                                           generation_options=generation_options))
 except Exception as e:
     st.error(f"APIキーの設定でエラーが発生しました。st.secretsを確認してください。エラー: {e}")
     st.stop()
@@ -113,10 +132,13 @@ with st.form(key='tech_input_form_simple'):
             """
 
             try:
-                with st.spinner("Geminiが全力でピッチ資料を生成中..."):
-                    response_pitch = model.generate_content(comprehensive_prompt)
-                    st.session_state.simple_pitch_deck_text = response_pitch.text
-                    st.success("ピッチ資料骨子の生成が完了しました！")
+                # 生成途中の文章を逐次表示し、完了後は下の結果表示に置き換える
+                pitch_stream_area = st.empty()
+                with pitch_stream_area.container():
+                    pitch_text = st.write_stream(stream_text(model, comprehensive_prompt))
+                st.session_state.simple_pitch_deck_text = pitch_text
+                pitch_stream_area.empty()
+                st.success("ピッチ資料骨子の生成が完了しました！")
             except Exception as e:
                 st.error(f"ピッチ資料骨子生成中にエラーが発生しました: {e}")
                 st.session_state.simple_pitch_deck_text = "ピッチ資料骨子の生成に失敗しました。"
@@ -0,0 +1,118 @@
+# --- 依存関係プロファイルごとのフットプリント計測 ---
+# requirements ファイル(プロファイル)ごとに以下を計測する。
+#   * インストールサイズ : 新しい venv に pip install したときの site-packages の合計サイズ
+#   * イメージサイズ     : --docker 指定時、python:3.11-slim にインストールしたイメージのサイズ
+#   * 初回描画時のRSS    : そのvenvで app.py を1回描画 (Streamlit AppTest) したときの最大RSS
+#
+# 使い方:
+#   python benchmarks/footprint.py                         # runtime / ingest / transcribe を計測
+#   python benchmarks/footprint.py --baseline-ref 0257673  # 指定コミットの requirements.txt も比較
+#   python benchmarks/footprint.py --docker                # Dockerイメージのサイズも計測
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_PROFILES = {
+    "runtime": "requirements.txt",
+    "ingest": "requirements-ingest.txt",
+    "transcribe": "requirements-transcribe.txt",
+}
+
+# AppTest で app.py を1回描画し、最大RSS(KB)を出力する (APIキーはダミー。AIは呼ばれない)
+RENDER_SCRIPT = """
+import resource
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=120)
+at.secrets["GEMINI_API_KEY"] = "dummy"
+at.run()
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+DOCKERFILE = """FROM python:3.11-slim
+COPY requirements*.txt /app/
+WORKDIR /app
+RUN pip install --no-cache-dir -r {requirements}
+"""
+
+
+def dir_size(path):
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            if not os.path.islink(file_path):
+                total += os.path.getsize(file_path)
+    return total
+
+
+def measure_venv(requirements_path, workdir):
+    """venvを作ってインストールし、(インストールサイズ[bytes], 初回描画RSS[KB]) を返す。"""
+    venv_dir = os.path.join(workdir, "venv")
+    subprocess.run([sys.executable, "-m", "venv", venv_dir], check=True)
+    python = os.path.join(venv_dir, "bin", "python")
+    subprocess.run([python, "-m", "pip", "install", "-q", "--disable-pip-version-check", "-r", requirements_path],
+                   cwd=os.path.dirname(requirements_path), check=True)
+    site_packages = subprocess.run(
+        [python, "-c", "import sysconfig; print(sysconfig.get_paths()['purelib'])"],
+        capture_output=True, text=True, check=True,
+    ).stdout.strip()
+    install_bytes = dir_size(site_packages)
+
+    rss = subprocess.run([python, "-c", RENDER_SCRIPT], cwd=REPO_ROOT, capture_output=True, text=True)
+    rss_kb = int(rss.stdout.strip().splitlines()[-1]) if rss.returncode == 0 else None
+    return install_bytes, rss_kb
+
+
+def measure_image(requirements_name, context_dir, tag):
+    """Dockerイメージをビルドしてサイズ[bytes]を返す。"""
+    with open(os.path.join(context_dir, "Dockerfile"), "w", encoding="utf-8") as f:
+        f.write(DOCKERFILE.format(requirements=requirements_name))
+    subprocess.run(["docker", "build", "-q", "-t", tag, context_dir], check=True, stdout=subprocess.DEVNULL)
+    size = subprocess.run(["docker", "image", "inspect", "-f", "{{.Size}}", tag],
+                          capture_output=True, text=True, check=True).stdout.strip()
+    return int(size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="依存関係プロファイルごとのインストールサイズ・イメージサイズ・RSSを計測する")
+    parser.add_argument("--baseline-ref", help="比較用に、このgit参照時点の requirements.txt も計測する")
+    parser.add_argument("--docker", action="store_true", help="Dockerイメージのサイズも計測する")
+    parser.add_argument("--profiles", nargs="*", help="計測するプロファイル名 (既定: すべて)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # requirements ファイル同士の -r 参照が解決できるよう、まとめて一時ディレクトリへコピーする
+        context_dir = os.path.join(tmp, "context")
+        os.makedirs(context_dir)
+        profiles = {}
+        for name, file_name in DEFAULT_PROFILES.items():
+            if args.profiles and name not in args.profiles:
+                continue
+            shutil.copy(os.path.join(REPO_ROOT, file_name), context_dir)
+            profiles[name] = file_name
+        if args.baseline_ref:
+            baseline = subprocess.run(["git", "show", f"{args.baseline_ref}:requirements.txt"],
+                                      cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout
+            with open(os.path.join(context_dir, "requirements-baseline.txt"), "w", encoding="utf-8") as f:
+                f.write(baseline)
+            profiles[f"baseline ({args.baseline_ref})"] = "requirements-baseline.txt"
+
+        print(f"{'プロファイル':<24}{'インストール':>14}{'初回描画RSS':>14}{'イメージ':>14}")
+        for name, file_name in profiles.items():
+            workdir = tempfile.mkdtemp(dir=tmp)
+            install_bytes, rss_kb = measure_venv(os.path.join(context_dir, file_name), workdir)
+            image = "-"
+            if args.docker:
+                image = f"{measure_image(file_name, context_dir, f'bizdev-footprint-{os.getpid()}') / 1024 ** 2:.0f} MB"
+            rss = f"{rss_kb / 1024:.0f} MB" if rss_kb else "失敗"
+            print(f"{name:<24}{install_bytes / 1024 ** 2:>11.0f} MB{rss:>14}{image:>14}")
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# --- ステップ3 の SWOT・4P・3C: 個別呼び出しとまとめた呼び出しの比較 ---
+# 個別 (swot / four_p / three_c の3回、3Cは SWOT の完了を待つ) と、まとめて1回 (COMBINE_FRAMEWORKS) で、
+# 遅延・呼び出し回数・入出力トークン数を比較する。入力には benchmarks/corpus のサンプル応答を使う。
+# 応答キャッシュは通さないので、実行するたびにAPIを呼び出す (課金に注意)。
+#
+# 使い方:
+#   GEMINI_API_KEY=... python benchmarks/framework_calls.py [--runs 3] [--model gemini-1.5-flash]
+#   python benchmarks/framework_calls.py --estimate   # APIを呼ばずに、呼び出し回数と入力トークン数だけを概算する
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import types
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+sys.path.insert(0, REPO_ROOT)
+
+from bizdev.analyses import Services, build_pipeline # noqa: E402
+from bizdev.context import default_counter # noqa: E402
+from bizdev.parsing import parse_lean_canvas_response, parse_problem_lines, parse_target_options, parse_vpc_response # noqa: E402
+
+TECH_SUMMARY = """
+                技術の名称: 少量データ学習による外観検査AI
+                解決したい課題: 製造現場の目視検査の人手不足とばらつき
+                技術的な特徴・新規性: 良品画像100枚程度から学習でき、既存カメラに後付けできる
+                応用できそうな分野・用途: 精密部品・食品・医療機器の外観検査
+                補足情報: なし
+                """
+
+
+def corpus_text(kind, name):
+    with open(os.path.join(CORPUS_DIR, kind, name + ".md"), encoding="utf-8") as f:
+        return f.read()
+
+
+def sample_state():
+    """ステップ3に入る時点の state をコーパスのサンプル応答から作る。"""
+    _score, lean_canvas = parse_lean_canvas_response(corpus_text("lean_canvas", "standard"))
+    problems = corpus_text("problems", "asterisk")
+    return {
+        'tech_summary': TECH_SUMMARY,
+        'selected_target': parse_target_options(corpus_text("targets", "standard"))[0],
+        'potential_problems': problems,
+        'selected_problems': parse_problem_lines(problems),
+        'vpc_final_data': parse_vpc_response(corpus_text("vpc", "standard")),
+        'lean_canvas_parsed_blocks': lean_canvas,
+        'lean_canvas_final': lean_canvas,
+        'mvp_definition_final': "後付けカメラユニットと学習用の管理画面を、1ライン限定で3か月試験導入する。",
+    }
+
+
+class MeteredModel:
+    """呼び出しごとの遅延と入出力トークン数を記録するラッパー。
+
+    usage_metadata が返る場合はその値を、無い場合は TokenCounter の概算を使う。
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, **kwargs):
+        start = time.perf_counter()
+        response = self.model.generate_content(prompt, **kwargs)
+        text = response.text
+        usage = getattr(response, "usage_metadata", None)
+        counter = default_counter()
+        with self._lock:
+            self.calls.append({
+                "seconds": time.perf_counter() - start,
+                "input_tokens": getattr(usage, "prompt_token_count", None) or counter.count(str(prompt)),
+                "output_tokens": getattr(usage, "candidates_token_count", None) or counter.count(text),
+            })
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class EstimateModel:
+    """APIを呼ばずに、決まった長さのダミー応答を返すモデル (--estimate 用)。"""
+
+    model_name = "estimate"
+
+    def generate_content(self, prompt, **kwargs):
+        # 個別・まとめて のどちらのパーサーでも読める形の応答 (1分析あたり約300字)
+        body = "\n".join(f"* 要素{i}: " + "具体的な分析内容" * 3 for i in range(8))
+        if kwargs.get("generation_config"):
+            return types.SimpleNamespace(text=json.dumps({"swot": body, "four_p": body, "three_c": body}, ensure_ascii=False))
+        return types.SimpleNamespace(text="\n\n".join(f"## {name}分析結果\n{body}" for name in ("SWOT", "4P", "3C")))
+
+
+def run_mode(model, combine, structured):
+    """1回分: ステップ3の SWOT・4P・3C を生成し、(所要秒数, 呼び出しの記録) を返す。"""
+    metered = MeteredModel(model)
+    services = Services(metered, structured_output=structured)
+    pipeline = build_pipeline(combine_frameworks=combine)
+    state = sample_state()
+    start = time.perf_counter()
+    for node, error in pipeline.run(state, ['swot', 'four_p', 'three_c'], services):
+        if error:
+            print(f"  {node.label}: エラー {error}", file=sys.stderr)
+    return time.perf_counter() - start, metered.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SWOT・4P・3C を個別に生成する場合とまとめて生成する場合の遅延・トークン数を比較する")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--model", default="gemini-1.5-flash")
+    parser.add_argument("--no-structured", action="store_true", help="構造化出力(JSON)を使わない")
+    parser.add_argument("--estimate", action="store_true", help="APIを呼ばずに入力トークン数を概算する")
+    args = parser.parse_args()
+
+    if args.estimate:
+        model = EstimateModel()
+    else:
+        import google.generativeai as genai
+        from bizdev.generation import GenerationClient
+
+        genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+        model = GenerationClient(genai.GenerativeModel(args.model))
+
+    print(f"{'構成':<12}{'遅延(秒)':>10}{'呼び出し':>10}{'入力トークン':>14}{'出力トークン':>14}")
+    for label, combine in (("個別 (3回)", False), ("まとめて", True)):
+        latencies, calls, inputs, outputs = [], [], [], []
+        for _ in range(args.runs):
+            seconds, records = run_mode(model, combine, not args.no_structured)
+            latencies.append(seconds)
+            calls.append(len(records))
+            inputs.append(sum(r["input_tokens"] for r in records))
+            outputs.append(sum(r["output_tokens"] for r in records))
+        # --estimate では応答がダミーなので、遅延と出力トークン数は表示しない
+        latency = "-" if args.estimate else f"{statistics.median(latencies):.2f}"
+        output_tokens = "-" if args.estimate else f"{statistics.mean(outputs):.0f}"
+        print(f"{label:<12}{latency:>10}{statistics.mean(calls):>10.1f}{statistics.mean(inputs):>14.0f}{output_tokens:>14}")
+
+
+if __name__ == "__main__":
+    main()
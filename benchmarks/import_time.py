@@ -0,0 +1,78 @@
+# --- import時間のベンチマーク ---
+# app.py の先頭で読み込むモジュール群について、以前の構成 (Gemini SDK / Google APIクライアント /
+# duckduckgo_search を起動時に import) と、現在の構成 (遅延読み込み) の import 時間を比較する。
+# 現在の構成のモジュールは app.py のモジュールレベルの import 文から求める (app.py の変更に追従する)。
+# 毎回新しいPythonプロセスで計測するので、コールドスタート時の差に近い値になる。
+#
+# 使い方: python benchmarks/import_time.py [--runs 5]
+import argparse
+import ast
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILES = {
+    "以前の構成 (起動時に全SDKを import)": [
+        "streamlit",
+        "google.generativeai",
+        "googleapiclient.discovery",
+        "duckduckgo_search",
+    ],
+}
+
+
+def app_imports(path=os.path.join(REPO_ROOT, "app.py")):
+    """app.py がモジュールレベルで import するモジュール (関数内の遅延 import は含めない)。"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def measure(modules, runs):
+    """新しいインタプリタで modules を import する時間(秒)を runs 回計測する。"""
+    code = "import importlib, time\n" \
+           "t = time.perf_counter()\n" \
+           f"for name in {modules!r}:\n" \
+           "    try:\n" \
+           "        importlib.import_module(name)\n" \
+           "    except ImportError:\n" \
+           "        print('missing:' + name)\n" \
+           "print(time.perf_counter() - t)\n"
+    timings = []
+    missing = set()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout
+        lines = out.strip().splitlines()
+        missing.update(line.split(":", 1)[1] for line in lines if line.startswith("missing:"))
+        timings.append(float(lines[-1]))
+    return timings, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app.py の起動時 import 時間を構成ごとに比較する")
+    parser.add_argument("--runs", type=int, default=5, help="構成ごとの計測回数")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    profiles = {**PROFILES, "現在の構成 (遅延読み込み)": app_imports()}
+    for label, modules in profiles.items():
+        timings, missing = measure(modules, args.runs)
+        print(f"{label}: 中央値 {statistics.median(timings) * 1000:.0f} ms"
+              f" (最小 {min(timings) * 1000:.0f} ms / 最大 {max(timings) * 1000:.0f} ms, {args.runs}回)")
+        if missing:
+            print(f"  ※ 未インストールのため計測から除外: {', '.join(sorted(missing))}")
+    print(f"計測時間: {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# --- 同時利用の負荷試験 (APIを使わない再生モード) ---
+# N人のユーザーが同時にステップ0〜6を進める操作を Streamlit AppTest で再現し、
+# ステップごとの待ち時間 (ボタンを押してから分析が全部終わるまで) と、全体の所要時間のパーセンタイルを表示する。
+# AI・検索は BACKEND = "replay" (bizdev.backends) で、録画した応答またはダミーの応答を設定した遅延で返す。
+# 全ユーザーを1つのプロセスで動かすので、Streamlit サーバーと同じく共有リソース
+# (ジョブランナー・レート制限・キャッシュ・共有ストア) を奪い合う状況を計測できる。
+# AppTest はスレッドセーフではないので、スクリプトの実行 (1回数十ミリ秒) は1人ずつ行う。
+# 待ち時間の大半を占める分析はバックグラウンドのジョブとして同時に進む。
+#
+# 使い方:
+#   python benchmarks/load_test.py --users 10 [--recordings .cache/recordings.jsonl] [--latency 2.0 6.0] [--error-rate 0.05]
+#   (録画は BACKEND = "record" でアプリを使うと .cache/recordings.jsonl に保存される)
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from bizdev.metrics import metrics # noqa: E402
+
+APP_PATH = os.path.join(REPO_ROOT, "app.py")
+# AppTest はプロセス共通の Runtime を作っては破棄するので、同時に実行できない
+_script_lock = threading.Lock()
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class User:
+    """1人のユーザーのセッション。AppTest でアプリを操作する。"""
+
+    def __init__(self, index, secrets, run_id, poll_interval=0.2, step_timeout=600):
+        self.index = index
+        self.secrets = secrets
+        self.run_id = run_id
+        self.poll_interval = poll_interval
+        self.step_timeout = step_timeout
+        self.timings = {}  # 操作 -> 秒
+        self.errors = []
+        with _script_lock:
+            self.at = self.new_app()
+            self.at.run()
+
+    def new_app(self, state=None):
+        from streamlit.testing.v1 import AppTest
+
+        at = AppTest.from_file(APP_PATH, default_timeout=self.step_timeout)
+        for key, value in self.secrets.items():
+            at.secrets[key] = value
+        for key, value in (state or {}).items():
+            at.session_state[key] = value
+        return at
+
+    def next_page(self):
+        # AppTest はページが切り替わっても前のページの要素を残すことがあるので、
+        # ウィジェット以外の state を引き継いで作り直す (ブラウザの再読み込みに相当)
+        state = self.at.session_state._state
+        widget_keys = set(state._key_id_mapper._key_id_mapping)
+        values = {key: self.at.session_state[key] for key in state.filtered_state if key not in widget_keys}
+        self.at = self.new_app(values)
+        self.at.run()
+
+    def settle(self):
+        # 実行中の分析が終わるまで再実行する (画面では1秒ごとに進捗のフラグメントが再実行される)
+        deadline = time.time() + self.step_timeout
+        while self.at.session_state['_pipeline_jobs'] if '_pipeline_jobs' in self.at.session_state else False:
+            if time.time() > deadline:
+                raise TimeoutError("分析が時間内に終わりませんでした")
+            time.sleep(self.poll_interval)
+            with _script_lock:
+                self.at.run()
+
+    def timed(self, label, action):
+        started = time.perf_counter()
+        with _script_lock:
+            action()
+            self.next_page()
+        self.settle()
+        self.timings[label] = time.perf_counter() - started
+        self.errors.extend(e.value for e in self.at.exception)
+        self.errors.extend(self.at.session_state['pipeline_errors'].values() if 'pipeline_errors' in self.at.session_state else [])
+
+    def walk(self):
+        at = lambda: self.at # noqa: E731 (next_page で作り直すので毎回取り直す)
+
+        def submit_tech():
+            at().text_input(key='tech_name').input(f"負荷試験用の技術 {self.run_id}-{self.index}")
+            at().text_area(key='problem').input("製造現場の目視検査の人手不足とばらつき")
+            at().text_area(key='features').input("良品画像100枚程度から学習でき、既存カメラに後付けできる")
+            at().text_area(key='areas').input("精密部品・食品・医療機器の外観検査")
+            at().button[0].click().run()
+
+        def choose_target():
+            radio = at().radio(key='target_selection_radio')
+            radio.set_value(radio.options[0]).run()
+            at().button(key='goto_problem_definition').click().run()
+
+        def choose_problems():
+            if at().checkbox:
+                at().checkbox[0].check().run()
+            at().button(key='goto_vpc_from_1_2').click().run()
+
+        def choose_moats():
+            if [c for c in at().checkbox if c.key == 'moat_select_0']:
+                at().checkbox(key='moat_select_0').check().run()
+            at().button(key='goto_step5_from_4_auto').click().run()
+
+        started = time.perf_counter()
+        self.timed("ステップ1 ターゲット案", submit_tech)
+        self.timed("ステップ1.2 課題", choose_target)
+        self.timed("ステップ1.3 VPC", choose_problems)
+        self.timed("ステップ2a Lean Canvas・市場調査", lambda: at().button(key='goto_step2a_from_vpc').click().run())
+        self.timed("ステップ3 深掘り", lambda: at().button(key='goto_step3').click().run())
+        self.timed("ステップ4 競合・Moat", lambda: at().button(key='goto_step4').click().run())
+        self.timed("ステップ5 ピッチ", choose_moats)
+        self.timed("ステップ6 VCレビュー", lambda: at().button(key='goto_step6_from_5').click().run())
+        self.timings["全体"] = time.perf_counter() - started
+        if self.at.session_state.step != 6:
+            self.errors.append(f"ステップ6まで進めませんでした (ステップ {self.at.session_state.step})")
+
+
+def run_user(index, secrets, run_id, ramp_seconds, users):
+    time.sleep(ramp_seconds * index / max(users, 1)) # 同時に始めず、ramp_seconds の間に順に開始する
+    user = User(index, secrets, run_id)
+    try:
+        user.walk()
+    except Exception as e:
+        user.errors.append(repr(e))
+    return user
+
+
+def main():
+    parser = argparse.ArgumentParser(description="N人が同時にステップ0〜6を進めた時の待ち時間を、APIを使わずに計測する")
+    parser.add_argument("--users", type=int, default=5, help="同時に操作するユーザー数")
+    parser.add_argument("--ramp", type=float, default=5.0, help="全ユーザーが開始するまでの秒数")
+    parser.add_argument("--recordings", default=None, help="録画ファイル (JSONL)。無ければダミーの応答を返す")
+    parser.add_argument("--latency", type=float, nargs=2, default=(2.0, 6.0), metavar=("MEDIAN", "P95"),
+                        help="Gemini 1回の遅延の中央値と p95 (秒)")
+    parser.add_argument("--search-latency", type=float, nargs=2, default=(0.3, 1.0), metavar=("MEDIAN", "P95"))
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Gemini の一時エラー (503) の確率")
+    parser.add_argument("--search-error-rate", type=float, default=0.0)
+    parser.add_argument("--time-scale", type=float, default=1.0, help="遅延に掛ける倍率 (0.1 で10倍速)")
+    parser.add_argument("--gemini-rpm", type=float, default=600, help="レート制限 (1分あたり)")
+    args = parser.parse_args()
+
+    secrets = {
+        "BACKEND": "replay",
+        "replay": {
+            "latency_median_seconds": args.latency[0], "latency_p95_seconds": args.latency[1],
+            "search_latency_median_seconds": args.search_latency[0], "search_latency_p95_seconds": args.search_latency[1],
+            "error_rate": args.error_rate, "search_error_rate": args.search_error_rate, "time_scale": args.time_scale,
+        },
+        "rate_limits": {"gemini_rpm": args.gemini_rpm, "gemini_burst": 20, "search_qpm": 600, "search_burst": 20},
+    }
+    if args.recordings:
+        secrets["RECORDINGS_PATH"] = args.recordings
+    # 実行ごとに技術の名称を変え、前回の実行の応答キャッシュに当たらないようにする
+    run_id = uuid.uuid4().hex[:8]
+
+    os.chdir(REPO_ROOT) # .cache/ の場所をアプリと揃える
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        users = list(pool.map(lambda i: run_user(i, secrets, run_id, args.ramp, args.users), range(args.users)))
+    elapsed = time.perf_counter() - started
+
+    labels = list(dict.fromkeys(label for user in users for label in user.timings)) # 途中で失敗したユーザーの分も含める
+    print(f"ユーザー {args.users}人 / 所要 {elapsed:.1f}秒 / 完走 {sum(not u.errors for u in users)}人")
+    print(f"{'操作':<28}{'件数':>6}{'p50(秒)':>10}{'p95(秒)':>10}{'最大(秒)':>10}")
+    for label in labels:
+        values = [u.timings[label] for u in users if label in u.timings]
+        print(f"{label:<28}{len(values):>6}{statistics.median(values):>10.2f}{percentile(values, 0.95):>10.2f}{max(values):>10.2f}")
+
+    rows = [row for row in metrics.summary() if row["種類"] == "gemini"]
+    calls = sum(row["呼び出し"] for row in rows)
+    print(f"Gemini呼び出し {calls}回 / エラー {sum(row['エラー'] for row in rows)}回 / 再試行 {sum(row['再試行'] for row in rows)}回")
+    errors = [(user.index, error) for user in users for error in user.errors]
+    for index, error in errors[:10]:
+        print(f"  ユーザー{index}: {error}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# --- AI応答パーサーのベンチマーク (速度と抽出精度) ---
+# benchmarks/corpus/<種類>/*.md に保存したAI応答を bizdev.parsing の各パーサーにかけ、
+# 1回あたりの処理時間と、同じ名前の .json に保存した期待値との一致率を表示する。
+# モデルを変えた時は、新しいモデルの応答をコーパスに追加して精度が落ちていないかを確認する。
+#
+# 使い方:
+#   python benchmarks/parse_corpus.py [--runs 2000]
+#   python benchmarks/parse_corpus.py --baseline-ref 8d19654   # 指定コミットのパーサーとも比較
+#   python benchmarks/parse_corpus.py --write-expected         # 期待値が無い応答について、現在の結果を期待値として保存
+#                                                              # (保存後に内容を目で確認して修正すること)
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+import types
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+sys.path.insert(0, REPO_ROOT)
+
+# コーパスの種類 -> (パーサー関数名, 結果を期待値と同じ形にする関数)
+KINDS = {
+    "lean_canvas": ("parse_lean_canvas_response", lambda r: {"score_text": r[0], "blocks": r[1]}),
+    "vpc": ("parse_vpc_response", lambda r: r),
+    "targets": ("parse_target_options", lambda r: r),
+    "problems": ("parse_problem_lines", lambda r: r),
+    "moats": ("split_moat_proposals", lambda r: r),
+}
+
+
+def load_corpus():
+    """[(種類, 名前, 応答本文, 期待値 or None)]"""
+    samples = []
+    for kind in KINDS:
+        for path in sorted(glob.glob(os.path.join(CORPUS_DIR, kind, "*.md"))):
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            expected_path = path[:-3] + ".json"
+            expected = None
+            if os.path.exists(expected_path):
+                with open(expected_path, encoding="utf-8") as f:
+                    expected = json.load(f)
+            samples.append((kind, os.path.basename(path)[:-3], text, expected))
+    return samples
+
+
+def load_parsers(ref=None):
+    """現在の bizdev.parsing、または git 参照 ref 時点の bizdev/parsing.py を読み込む。"""
+    if ref is None:
+        from bizdev import parsing
+        return parsing
+    source = subprocess.run(["git", "show", f"{ref}:bizdev/parsing.py"], cwd=REPO_ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    module = types.ModuleType(f"parsing_{ref}")
+    exec(compile(source, f"{ref}:bizdev/parsing.py", "exec"), module.__dict__)
+    return module
+
+
+def accuracy(result, expected):
+    """期待値の項目 (辞書のキー / リストの要素) のうち、完全に一致した割合。"""
+    if isinstance(expected, dict):
+        fields = [accuracy(result.get(k) if isinstance(result, dict) else None, v) for k, v in expected.items()]
+        return sum(fields) / len(fields) if fields else 1.0
+    if isinstance(expected, list):
+        result = result if isinstance(result, list) else []
+        total = max(len(expected), len(result))
+        return sum(1 for a, b in zip(result, expected) if a == b) / total if total else 1.0
+    return 1.0 if result == expected else 0.0
+
+
+def measure(parsers, samples, runs):
+    """種類ごとに (1回あたりのマイクロ秒, 平均一致率, 期待値のある件数) を返す。"""
+    report = {}
+    for kind, (func_name, normalize) in KINDS.items():
+        parse = getattr(parsers, func_name, None)
+        texts = [(text, expected) for k, _name, text, expected in samples if k == kind]
+        if parse is None or not texts:
+            continue # 古いコミットには無いパーサーなど
+        start = time.perf_counter()
+        for _ in range(runs):
+            for text, _expected in texts:
+                parse(text)
+        micros = (time.perf_counter() - start) / (runs * len(texts)) * 1e6
+        scored = [accuracy(normalize(parse(text)), expected) for text, expected in texts if expected is not None]
+        report[kind] = (micros, sum(scored) / len(scored) if scored else None, len(scored))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI応答パーサーの速度と抽出精度をコーパスで計測する")
+    parser.add_argument("--runs", type=int, default=2000, help="1つの応答あたりのパース回数")
+    parser.add_argument("--baseline-ref", help="比較用に、このgit参照時点の bizdev/parsing.py も計測する")
+    parser.add_argument("--write-expected", action="store_true", help="期待値 (.json) が無い応答に、現在のパース結果を期待値として保存する")
+    args = parser.parse_args()
+
+    samples = load_corpus()
+    current = load_parsers()
+    if args.write_expected:
+        for kind, name, text, expected in samples:
+            if expected is None:
+                func_name, normalize = KINDS[kind]
+                path = os.path.join(CORPUS_DIR, kind, name + ".json")
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(normalize(getattr(current, func_name)(text)), f, ensure_ascii=False, indent=2)
+                    f.write("\n")
+                print(f"期待値を保存しました: {os.path.relpath(path, REPO_ROOT)}")
+        samples = load_corpus()
+
+    profiles = {"現在": current}
+    if args.baseline_ref:
+        profiles[f"baseline ({args.baseline_ref})"] = load_parsers(args.baseline_ref)
+
+    reports = {label: measure(parsers, samples, args.runs) for label, parsers in profiles.items()}
+    print(f"コーパス: {len(samples)}件 ({CORPUS_DIR})")
+    print(f"{'パーサー':<14}{'構成':<22}{'µs/回':>10}{'一致率':>10}")
+    for kind in KINDS:
+        for label, report in reports.items():
+            result = report.get(kind)
+            if result is None:
+                continue
+            micros, acc, n = result
+            acc_text = f"{acc:.0%} ({n})" if acc is not None else "-"
+            print(f"{kind:<14}{label:<22}{micros:>10.1f}{acc_text:>10}")
+
+
+if __name__ == "__main__":
+    main()
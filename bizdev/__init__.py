@@ -0,0 +1 @@
+# BizDev アプリ(app.py / app_simple.py)から共通で使う処理をまとめたパッケージ
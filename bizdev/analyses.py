@@ -0,0 +1,837 @@
+# --- 事業化検討の各分析(ノード)の宣言 ---
+# ターゲット案からVCレビューまでの全分析について、読む state のキー・書く state のキー・
+# プロンプトをここにまとめる。実行順序と再生成の判断は bizdev.pipeline が行う。
+# ノードの run はワーカースレッドで呼ばれるので、Streamlit の API は使わない。
+from bizdev.context import ContextAssembler
+from bizdev.context_cache import PrefixedModel
+from bizdev.digests import lean_canvas_text
+from bizdev.gemini import stream_text
+from bizdev.jobs import report_progress
+from bizdev.pipeline import Node, Pipeline
+from bizdev.research import pipelined_search
+from bizdev.structured import (LEAN_CANVAS_FIELDS, FrameworkAnalyses, LeanCanvas, MoatProposals, ProblemList,
+                               TargetIdeas, ValuePropositionCanvas, generate_structured)
+
+# Lean Canvas の9ブロック (パース後のキー名)
+LEAN_CANVAS_KEYS = list(LEAN_CANVAS_FIELDS.values())
+
+# 後続のプロンプトへ要約で埋め込む出力 -> 要約の名前 (作る側と使う側で同じ名前にし、同じ要約を使う)
+DIGEST_NAMES = {
+    'potential_problems': "顧客の課題リスト",
+    'swot_analysis': "SWOT分析",
+    'four_p_analysis_text': "4P分析",
+    'three_c_analysis_text': "3C分析",
+    'financials_ideas_text': "財務計画",
+    'competitor_analysis_text': "競合分析",
+}
+
+
+class Services:
+    """ノードの run が使う外部サービス。
+
+    search_client: SearchClient を返す関数 (検索を使うノードが実行される時だけ呼ばれる)
+    summary_store: 後続ステップ用の要約ストア。None なら常に全文を使う
+    structured_output: True ならパースが必要な分析はJSON(構造化出力)で生成する (失敗時はマークダウンにフォールバック)
+    context_cache: 共通の前提情報を登録するコンテキストキャッシュ (bizdev.context_cache)。None なら前提情報をプロンプトに付けて送る
+    backend_name: model を作ったバックエンド (bizdev.backends) の名前。レプリカ間で結果を共有するキーに使う
+    """
+
+    def __init__(self, model, search_client=None, summary_store=None, pitch_token_budget=8000, structured_output=True,
+                 context_cache=None, backend_name="live"):
+        self.model = model
+        self.backend_name = backend_name
+        self.structured_output = structured_output
+        self.context_cache = context_cache
+        self._search_client = search_client
+        self.summary_store = summary_store
+        self.pitch_token_budget = pitch_token_budget
+
+    def search_client(self):
+        if self._search_client is None:
+            raise RuntimeError("検索クライアントが設定されていません")
+        return self._search_client()
+
+    def digest_or_text(self, key, text):
+        """出力 key の本文 text をプロンプトへ埋め込む用: 要約が必要なら要約 (出来上がるまで待つ)、それ以外は本文。"""
+        if not self.summary_store:
+            return text
+        return self.summary_store.digest(self.model, DIGEST_NAMES[key], text) or text
+
+    def with_preamble(self, preamble):
+        """前提情報 preamble を踏まえて生成するモデル。プロンプトには個別の指示だけを渡せばよい。"""
+        model = self.context_cache.model_for(preamble) if self.context_cache else None
+        return model or PrefixedModel(self.model, preamble)
+
+
+def submit_digests(node, state, services):
+    """ノードの出力のうち後続ステップで何度も使うものについて、要約の作成を先に始めておく。"""
+    if not services.summary_store:
+        return
+    for key in node.digest_outputs:
+        value = state.get(key)
+        text = lean_canvas_text(value) if isinstance(value, dict) else value
+        services.summary_store.submit(services.model, DIGEST_NAMES.get(key, node.label), text)
+
+
+def _generate(key, build_prompt):
+    """プロンプトを1回投げて応答テキストを key に保存するノード用の run 関数を作る。"""
+    def run(inputs, services):
+        return {key: services.model.generate_content(build_prompt(inputs, services)).text}
+    return run
+
+
+def _generate_structured(key, build_prompt, result_class, preamble=False):
+    """_generate と同じく本文を key に保存する。構造化出力が有効ならJSONで生成し、決まった書式の本文にする。
+
+    preamble が True なら、前提情報(プリアンブル)を付けたモデルで生成する (_generate_with_preamble と同じ)。
+    """
+    def run(inputs, services):
+        model = services.with_preamble(project_preamble(inputs)) if preamble else services.model
+        result = generate_structured(model, build_prompt(inputs, services), result_class, services.structured_output)
+        return {key: result.text}
+    return run
+
+
+# --- ステップ0: ターゲット戦略 ---
+def target_prompt(inputs, services):
+    return f"""以下の技術概要に基づいて、事業化が考えられる具体的なターゲット市場セグメント、またはターゲット顧客像のアイデアを3つ提案してください。
+    それぞれのアイデアについて、なぜそれがターゲットとなり得るのか簡単な根拠も添えてください。
+
+    # 技術概要:
+    {inputs['tech_summary']}
+
+    # 出力形式例 (マークダウン):
+    **ターゲット案1: [セグメント名や顧客像]**
+    * 根拠: [簡単な理由]
+
+    **ターゲット案2: [セグメント名や顧客像]**
+    * 根拠: [簡単な理由]
+
+    **ターゲット案3: [セグメント名や顧客像]**
+    * 根拠: [簡単な理由]
+    """
+
+
+# --- ステップ1.2: 課題整理 ---
+def problem_prompt(inputs, services):
+    return f"""あなたは、新規事業のアイデアを検討するコンサルタントです。
+    以下の「技術概要」と、その技術の「ターゲット候補」に関する情報を分析してください。
+    そして、**このターゲット候補が抱えている可能性のある「課題」や「ペイン（悩み、不満、困りごと）」**を、できるだけ具体的に5～10個程度リストアップしてください。
+    この分析は、これまでの会話とは独立した、今回提示された情報のみに基づいて行ってください。
+
+    # 技術概要:
+    {inputs['tech_summary']}
+
+    # ターゲット候補:
+    {inputs['selected_target']}
+
+    # 出力形式 (マークダウンの箇条書き):
+    * [具体的な課題やペイン1]
+    * [具体的な課題やペイン2]
+    * ...
+    """
+
+
+# --- ステップ1.3: Value Proposition Canvas ---
+def vpc_prompt(inputs, services):
+    focused_problems_list = inputs['selected_problems']
+    return f"""あなたは事業開発の専門家です。以下の提供情報**のみ**に基づいて、「Value Proposition Canvas」の6つの構成要素について、具体的なアイデアを提案・記述してください。過去の会話の文脈は考慮せず、今回提示された情報だけで判断してください。
+
+    # 提供情報
+    ## 技術概要:
+    {inputs['tech_summary']}
+
+    ## ターゲット候補:
+    {inputs['selected_target']}
+
+    ## ターゲットの【主要な】課題リスト (ユーザー選抜済):
+    {chr(10).join([f'* {p}' for p in focused_problems_list]) if focused_problems_list else "(ユーザーによって特に選択された課題はありません。ターゲット候補全般の一般的な課題を考慮してください。)"}
+
+    # 作成するVPCの構成要素と記述内容の指示:
+    1.  **顧客のジョブ (Customer Jobs):** ターゲット顧客が達成しようとしていること、解決したい仕事は何か？
+    2.  **顧客のペイン (Customer Pains):** 顧客が現状感じている不満、障害、リスクは何か？（上記の【主要な】課題リストを最重要の参考情報として具体的に）
+    3.  **顧客のゲイン (Customer Gains):** 顧客が期待する成果、メリット、喜びは何か？
+    4.  **製品・サービス (Products & Services):** あなたの技術を元にした具体的な製品やサービス案は？
+    5.  **ペインリリーバー (Pain Relievers):** その製品・サービスが、どのように顧客のペインを取り除くか？
+    6.  **ゲインクリエイター (Gain Creators):** その製品・サービスが、どのように顧客のゲインを生み出すか？
+
+    # 出力形式 (各要素を以下の見出しで明確に区切ってください):
+    ## 顧客のジョブ (Customer Jobs)
+    [ここに具体的な記述を複数箇条書きで]
+
+    ## 顧客のペイン (Customer Pains)
+    [ここに具体的な記述を複数箇条書きで]
+
+    ## 顧客のゲイン (Customer Gains)
+    [ここに具体的な記述を複数箇条書きで]
+
+    ## 製品・サービス (Products & Services)
+    [ここに具体的な記述を複数箇条書きで]
+
+    ## ペインリリーバー (Pain Relievers)
+    [ここに具体的な記述を複数箇条書きで]
+
+    ## ゲインクリエイター (Gain Creators)
+    [ここに具体的な記述を複数箇条書きで]
+
+    マークダウン形式で記述してください。
+    """
+
+
+def run_vpc(inputs, services):
+    vpc = generate_structured(services.model, vpc_prompt(inputs, services), ValuePropositionCanvas, services.structured_output)
+    return {'vpc_draft_text': vpc.text, 'parsed_vpc_blocks': vpc.blocks}
+
+
+# --- ステップ2a: Lean Canvas (市場調査のWeb検索つき) ---
+def market_keyword_prompt(inputs, services):
+    return f"""以下の「技術概要」と「ターゲット顧客」に基づいて、この事業が参入する可能性のある市場の「市場規模」「最新トレンド」「主要な顧客セグメントの詳細」を調査するための効果的なGoogle検索キーワードを3つ提案してください。キーワードのみを箇条書きで出力してください。
+
+    # 技術概要:
+    {inputs['tech_summary']}
+
+    # ターゲット顧客:
+    {inputs['selected_target']}
+    """
+
+
+def lean_canvas_prompt(inputs, services, web_search_for_market_summary):
+    return f"""以下の情報に基づいて、Lean Canvasの9つの構成要素のドラフトを作成してください。
+    特に「顧客セグメント」と、市場規模を示唆する「主要指標」の項目については、提供された「市場調査のWeb検索結果」を最大限活用してください。
+    さらに、作成したドラフト全体について、事業アイデアの初期段階としての「品質スコア」を100点満点で採点し、その主な理由も記述してください。
+    **最終的な出力は、必ずLean Canvasの9ブロック全てと品質スコアを含めてください。**
+
+    # 技術概要:
+    {inputs['tech_summary']}
+
+    # ターゲット顧客:
+    {inputs['selected_target']}
+
+    # Value Proposition Canvas の内容:
+    {inputs['vpc_final_data']}
+
+    # 市場調査のWeb検索結果 (これを参考に市場規模や顧客セグメントを具体化):
+    {web_search_for_market_summary if web_search_for_market_summary else "（Web検索結果なし。一般的な知識で補完してください。）"}
+
+    # 作成するLean Canvasの構成要素 (9項目全て記述必須):
+    1. 課題 (Problem)
+    2. 顧客セグメント (Customer Segments)
+    3. 独自の価値提案 (Unique Value Proposition)
+    4. 解決策 (Solution)
+    5. チャネル (Channels)
+    6. 収益の流れ (Revenue Streams)
+    7. コスト構造 (Cost Structure)
+    8. 主要指標 (Key Metrics)
+    9. 圧倒的優位性 (Unfair Advantage)
+
+    # 品質スコアの評価観点: (前回と同じ)
+    # ...
+
+    # 出力形式 (マークダウン、各項目を見出しで明確に区切る):
+    ## Lean Canvas Draft
+    ### 1. 課題
+    [記述]
+    ### 2. 顧客セグメント
+    [記述]
+    ... (9まですべて) ...
+
+    ## 品質スコア
+    **スコア:** [点数]/100
+    **根拠:** [簡単な理由]
+    """
+
+
+def run_lean_canvas(inputs, services):
+    # 1, 2. キーワード生成をストリーミングで受け取り、確定したキーワードから順に検索を開始する
+    keywords = []
+    warnings = []
+    web_search_for_market_summary = ""
+    try:
+        market_research = pipelined_search(stream_text(services.model, market_keyword_prompt(inputs, services)),
+                                           services.search_client(), max_keywords=3, num=2) # 上位3キーワード、各2件
+        keywords = market_research.keywords
+        market_search_snippets = []
+        for keyword, items, search_e in market_research.results:
+            if search_e:
+                warnings.append(f"'{keyword}' の市場情報検索中にエラー: {search_e}")
+            for item in items:
+                title = item.get('title', '')
+                snippet = item.get('snippet', '').replace('\n', ' ')
+                market_search_snippets.append(f"- {title}: {snippet}")
+        web_search_for_market_summary = "\n".join(market_search_snippets)
+    except Exception as e:
+        warnings.append(f"市場調査用キーワード生成・Web検索中にエラー: {e}")
+
+    if not keywords:
+        web_search_for_market_summary = "市場調査のためのキーワードが生成されなかったため、Web検索はスキップされました。"
+
+    # 3. Web検索の結果を渡して Lean Canvas を作成・評価する
+    lean_canvas = generate_structured(services.model, lean_canvas_prompt(inputs, services, web_search_for_market_summary),
+                                      LeanCanvas, services.structured_output)
+    return {
+        'market_search_keywords': keywords,
+        'market_search_warnings': warnings,
+        'lean_canvas_raw_output': lean_canvas.text,
+        'lean_canvas_score_text': lean_canvas.score_text,
+        'lean_canvas_parsed_blocks': lean_canvas.blocks,
+    }
+
+
+# --- ステップ3以降の共通の前提情報 ---
+# ステップ3以降の分析はどれも技術概要・ターゲット・Lean Canvas を前提にする。これらをプロンプト先頭の
+# 共通部分 (プリアンブル) にまとめ、各分析のプロンプトには個別の指示だけを書く。
+# プリアンブルはコンテキストキャッシュ (bizdev.context_cache) に1回だけ登録でき、以降の呼び出しでは送らずに済む。
+# キャッシュを使わない場合も、先頭が同じプロンプトになるのでモデル側の暗黙のキャッシュが効きやすい。
+PREAMBLE_INPUTS = {'tech_summary': '', 'selected_target': '', 'lean_canvas_final': {}}
+
+
+def project_preamble(inputs):
+    lean_canvas = inputs['lean_canvas_final']
+    return f"""あなたは新規事業の事業化を支援する専門家です。以下はこの事業アイデアの前提情報です。この後の指示では、この前提情報を踏まえて回答してください。
+
+    # 技術概要:
+    {inputs['tech_summary']}
+
+    # ターゲット顧客:
+    {inputs['selected_target']}
+
+    # Lean Canvas:
+    {lean_canvas_text(lean_canvas) if lean_canvas else "（Lean Canvasの情報は提供されていません）"}
+    """
+
+
+def _generate_with_preamble(key, build_prompt):
+    """_generate と同じく本文を key に保存する。プロンプトは前提情報(プリアンブル)と個別の指示に分けて送る。"""
+    def run(inputs, services):
+        model = services.with_preamble(project_preamble(inputs))
+        return {key: model.generate_content(build_prompt(inputs, services)).text}
+    return run
+
+
+# --- ステップ3: 深掘り分析 ---
+def mvp_prompt(inputs, services):
+    return f"""
+    前提情報 (特にLean Canvasの課題・解決策・独自の価値提案) を元に、実現可能で価値検証に適したMVP（Minimum Viable Product）のアイデアを2～3個提案してください。それぞれのMVPについて、主要な機能、ターゲットユーザー、検証したい仮説を簡潔に記述してください。
+
+    # 出力形式 (マークダウン):
+    **MVP案1:**
+    * 主要機能: ...
+    * ターゲットユーザー（初期）: ...
+    * 検証したい仮説: ...
+
+    **MVP案2:**
+    ... (同様に)
+    """
+
+
+def swot_prompt(inputs, services):
+    return f"""前提情報を元に、この事業アイデアに関するSWOT分析（強み、弱み、機会、脅威）を行ってください。内部環境と外部環境の両面から、具体的な要素をリストアップしてください。
+
+    # 出力形式 (マークダウン):
+    ## SWOT分析結果
+    * **強み (Strengths):**
+        * [要素1]
+        * [要素2]
+    * **弱み (Weaknesses):**
+        * [要素1]
+        * [要素2]
+    * **機会 (Opportunities):**
+        * [要素1]
+        * [要素2]
+    * **脅威 (Threats):**
+        * [要素1]
+        * [要素2]
+    """
+
+
+def four_p_prompt(inputs, services):
+    mvp_definition = inputs['mvp_definition_final'] or '(未定義)' # MVP定義も参照 (ユーザー記述)
+    return f"""前提情報とMVP定義に基づいて、この事業アイデアの4P分析を行い、具体的な戦略案を提案してください。
+
+    # MVP定義 (ユーザー記述):
+    {mvp_definition}
+
+    # 分析する4P項目と指示:
+    * **Product（製品・サービス）:** MVP案を踏まえ、どのような製品/サービス形態、品質、デザイン、ブランド名などが考えられるか？
+    * **Price（価格）:** どのような価格設定（例：買い切り、サブスク）、価格帯、割引戦略などが考えられるか？ 顧客の価値認識やコスト構造も考慮。
+    * **Place（流通・チャネル）:** Lean Canvasのチャネル案を元に、どのように顧客に製品/サービスを届けるか？（例：直販、代理店、オンライン）
+    * **Promotion（販促・プロモーション）:** どのようにターゲット顧客に製品/サービスを知ってもらい、購入を促すか？（例：広告、広報、Webマーケティング、展示会）
+
+    # 出力形式 (マークダウン):
+    ## 4P分析結果
+    ### Product（製品・サービス）
+    * [提案1]
+    * [提案2]
+    ### Price（価格）
+    * [提案1]
+    * [提案2]
+    ### Place（流通・チャネル）
+    * [提案1]
+    * [提案2]
+    ### Promotion（販促・プロモーション）
+    * [提案1]
+    * [提案2]
+    """
+
+
+def three_c_prompt(inputs, services):
+    # 必要なコンテキストを収集 (技術概要・ターゲット・Lean Canvas は前提情報に含まれる)
+    potential_problems = services.digest_or_text('potential_problems', inputs['potential_problems'])
+    swot_analysis = services.digest_or_text('swot_analysis', inputs['swot_analysis']) # SWOT結果も活用
+
+    return f"""前提情報と以下の追加情報に基づいて、3C分析（顧客、競合、自社）を行ってください。各要素について、重要なポイントを整理し、簡潔に記述してください。
+
+    # 追加情報
+    ## 顧客の課題リスト（AI提案）:
+    {potential_problems}
+
+    ## Value Proposition Canvas:
+    {inputs['vpc_final_data']}
+
+    ## SWOT分析結果:
+    {swot_analysis}
+
+    # 分析すべき3C項目と指示:
+    * **Customer（顧客）:** ターゲット顧客は誰か？市場規模やニーズは？（既存情報を統合・整理）
+    * **Competitor（競合）:** 主要な競合は誰か？競合の強み・弱みは？（既存情報に加え、推測や一般的な知見も加味）
+    * **Company（自社）:** 自社の強み・弱みは？（技術、リソース、SWOTなどを考慮） どうすれば競合に勝てるか？
+
+    # 出力形式 (マークダウン):
+    ## 3C分析結果
+    ### Customer（顧客）
+    * [分析結果1]
+    * [分析結果2]
+    ### Competitor（競合）
+    * [分析結果1]
+    * [分析結果2]
+    ### Company（自社）
+    * [分析結果1]
+    * [分析結果2]
+    """
+
+
+def financials_prompt(inputs, services):
+    four_p_analysis = services.digest_or_text('four_p_analysis_text', inputs['four_p_analysis_text']) # 4P分析結果も参照 (4Pの完了後に呼ばれる)
+
+    return f"""前提情報 (特にLean Canvasの解決策・収益の流れ・コスト構造) と以下の4P分析結果に基づいて、この事業アイデアの初期段階における財務計画の「骨子」を提案してください。これは詳細な予測ではなく、主要な要素と考え方を整理するものです。
+
+    # 4P分析結果 (抜粋):
+    {four_p_analysis} # 価格戦略などが参考になる可能性
+
+    # 提案してほしい項目と指示:
+    * **主要な収益源 (Revenue Streams):** Lean Canvasのアイデアを元に、考えられる具体的な収益源をリストアップ。
+    * **主要なコスト構造 (Cost Structure):** Lean Canvasのアイデアを元に、主な変動費・固定費の項目をリストアップ。
+    * **初期の財務的考慮事項 (Initial Financial Considerations):** 価格設定の考え方、初期投資の主な項目、資金調達の必要性、最初に追うべき財務指標（例：損益分岐点、CAC）など、この段階で意識すべき点をいくつか提案。
+
+    # 出力形式 (マークダウン):
+    ## 財務計画（初期アイデア）
+    ### 主要な収益源
+    * [アイデア1]
+    * [アイデア2]
+    ### 主要なコスト構造
+    * [アイデア1]
+    * [アイデア2]
+    ### 初期の財務的考慮事項
+    * [ポイント1]
+    * [ポイント2]
+    """
+
+
+# --- ステップ3 (まとめて生成): SWOT・4P・3C を1回の呼び出しで ---
+# 3つの分析は前提情報に加えて課題リスト・VPCなど、ほぼ同じ情報をプロンプトに含む。
+# まとめて1回で生成すると、共通部分の入力トークンと呼び出しごとのオーバーヘッドを1回分にできる。
+# (MVP定義を編集すると、4Pだけでなく3つとも作り直しになる)
+def frameworks_prompt(inputs, services):
+    mvp_definition = inputs['mvp_definition_final'] or '(未定義)'
+    return f"""前提情報と以下の追加情報に基づいて、この事業アイデアの SWOT分析・4P分析・3C分析 を行ってください。
+    3C分析では、同じ回答の中で行ったSWOT分析の結果も踏まえてください。
+
+    # 追加情報
+    ## 顧客の課題リスト（AI提案）:
+    {services.digest_or_text('potential_problems', inputs['potential_problems'])}
+
+    ## Value Proposition Canvas:
+    {inputs['vpc_final_data']}
+
+    ## MVP定義 (ユーザー記述):
+    {mvp_definition}
+
+    # 分析の指示
+    ## SWOT分析
+    内部環境と外部環境の両面から、強み (Strengths)・弱み (Weaknesses)・機会 (Opportunities)・脅威 (Threats) の具体的な要素をリストアップ。
+
+    ## 4P分析
+    * **Product（製品・サービス）:** MVP案を踏まえ、どのような製品/サービス形態、品質、デザイン、ブランド名などが考えられるか？
+    * **Price（価格）:** どのような価格設定（例：買い切り、サブスク）、価格帯、割引戦略などが考えられるか？ 顧客の価値認識やコスト構造も考慮。
+    * **Place（流通・チャネル）:** Lean Canvasのチャネル案を元に、どのように顧客に製品/サービスを届けるか？（例：直販、代理店、オンライン）
+    * **Promotion（販促・プロモーション）:** どのようにターゲット顧客に製品/サービスを知ってもらい、購入を促すか？（例：広告、広報、Webマーケティング、展示会）
+
+    ## 3C分析
+    * **Customer（顧客）:** ターゲット顧客は誰か？市場規模やニーズは？（既存情報を統合・整理）
+    * **Competitor（競合）:** 主要な競合は誰か？競合の強み・弱みは？（既存情報に加え、推測や一般的な知見も加味）
+    * **Company（自社）:** 自社の強み・弱みは？（技術、リソース、SWOTなどを考慮） どうすれば競合に勝てるか？
+
+    # 出力形式 (マークダウン、3つの分析を以下の見出しで区切る):
+    ## SWOT分析結果
+    * **強み (Strengths):**
+        * [要素1]
+    * **弱み (Weaknesses):**
+        * [要素1]
+    * **機会 (Opportunities):**
+        * [要素1]
+    * **脅威 (Threats):**
+        * [要素1]
+
+    ## 4P分析結果
+    ### Product（製品・サービス）
+    * [提案1]
+    ### Price（価格）
+    * [提案1]
+    ### Place（流通・チャネル）
+    * [提案1]
+    ### Promotion（販促・プロモーション）
+    * [提案1]
+
+    ## 3C分析結果
+    ### Customer（顧客）
+    * [分析結果1]
+    ### Competitor（競合）
+    * [分析結果1]
+    ### Company（自社）
+    * [分析結果1]
+    """
+
+
+def run_frameworks(inputs, services):
+    # 構造化出力では各分析の本文を別々の項目で受け取る (見出し "## X分析結果" はこちらで付ける)
+    model = services.with_preamble(project_preamble(inputs))
+    result = generate_structured(model, frameworks_prompt(inputs, services), FrameworkAnalyses, services.structured_output)
+    return {
+        'swot_analysis': result.sections["SWOT"],
+        'four_p_analysis_text': result.sections["4P"],
+        'three_c_analysis_text': result.sections["3C"],
+    }
+
+
+# --- ステップ4: 競合分析 (Web検索あり) と Moat ---
+def competitor_keyword_prompt(inputs, services):
+    # Lean Canvas に競合のブロックは無いので、競合との差を書く「圧倒的優位性」を手がかりにする
+    unfair_advantage = inputs['lean_canvas_final'].get('圧倒的優位性', '')
+    return f"""あなたは市場調査の専門家です。
+    以下の「技術概要」と「Lean Canvasの圧倒的優位性」のみに基づいて、詳細な競合分析を行うために効果的かつ具体的なGoogle検索キーワードを3～5個提案してください。
+    これまでの会話の文脈は考慮せず、今回提示された情報だけで判断してください。
+    キーワードのみを箇条書きで出力してください。
+
+    # 技術概要:
+    {inputs['tech_summary']}
+
+    # Lean Canvasの圧倒的優位性（あれば）:
+    {unfair_advantage if unfair_advantage else "特になし"}
+    """
+
+
+def competitor_prompt(inputs, services, web_search_results_summary):
+    return f"""前提情報 (技術概要・Lean Canvasの圧倒的優位性など) と以下の「Web検索からの関連情報」に基づいて、主要な競合企業（または代替技術）を特定し、それぞれの特徴、強み、弱み、市場での評判や最近の動向などを詳細に分析してください。
+
+    # Web検索からの関連情報:
+    {web_search_results_summary if web_search_results_summary else "Web検索結果なし"}
+
+    # 分析してほしい観点:
+    * 主要な競合企業/技術名
+    * 提供している製品/サービス
+    * 想定されるターゲット顧客
+    * 強み
+    * 弱み
+    * 価格帯やビジネスモデル（推測で可）
+    * 市場での評判や最近の動向（Web検索結果から推測できる場合）
+
+    # 出力形式 (マークダウン):
+    ## 競合分析結果 (Web調査加味)
+    ### 競合A: [企業名/技術名]
+    * 製品/サービス: ...
+    (以下、各観点について記述)
+    ### 競合B: [企業名/技術名]
+    ... (同様に)
+    """
+
+
+def run_competitors(inputs, services):
+    # キーワード生成をストリーミングで受け取り、確定したキーワードから順にGoogle検索を開始する
+    research = pipelined_search(stream_text(services.model, competitor_keyword_prompt(inputs, services)),
+                                services.search_client(), max_keywords=3, num=2)
+    warnings = []
+    web_search_results_summary = ""
+    if research.keywords:
+        search_snippets = []
+        for keyword, items, search_e in research.results:
+            if search_e:
+                warnings.append(f"'{keyword}' のGoogle検索中にエラー: {search_e}") # エラーではなく警告
+            for item in items:
+                title = item.get('title', 'タイトルなし')
+                link = item.get('link', '#')
+                snippet = item.get('snippet', '概要なし').replace('\n', ' ')
+                search_snippets.append(f"- タイトル: {title}\n  概要: {snippet}\n  URL: {link}\n")
+        if search_snippets:
+            web_search_results_summary = "\n---\n".join(search_snippets)
+    else:
+        web_search_results_summary = "検索キーワードがないか生成に失敗したため、Web検索はスキップされました。"
+
+    model = services.with_preamble(project_preamble(inputs))
+    response = model.generate_content(competitor_prompt(inputs, services, web_search_results_summary))
+    return {
+        'competitor_search_keywords': research.keywords,
+        'competitor_search_raw': research.raw_text,
+        'competitor_search_warnings': warnings,
+        'competitor_analysis_text': response.text,
+    }
+
+
+def moat_prompt(inputs, services):
+    swot_analysis = inputs['swot_analysis']
+    return f"""前提情報 (特にLean Canvasの圧倒的優位性) と以下の分析結果に基づいて、この事業の持続可能な競争優位性（Moat）となりうる要素を特定し、それを表現する簡潔なステートメント案を1～3個提案してください。なぜそれが競合にとって模倣困難なのか、理由も添えてください。
+
+    # SWOT分析結果:
+    {services.digest_or_text('swot_analysis', swot_analysis) if swot_analysis else "（SWOT分析結果なし）"}
+
+    # 競合分析結果 (Web調査加味):
+    {inputs['competitor_analysis_text']}
+
+    # 出力形式 (マークダウン):
+    ## Moat（持続可能な競争優位性）の提案
+    **Moat案1:** [Moatを表すステートメント]
+    * 理由: [なぜ模倣困難かの説明]
+    (最大3つまで)
+    """
+
+
+# --- ステップ5: ピッチ資料 ---
+def build_pitch_prompt(inputs, services):
+    """ピッチ資料生成のプロンプトと、各セクションのトークン内訳を返す。
+
+    大きいセクションはトークン予算に収まるよう要約して組み込む (要約にAIを呼ぶことがある)。
+    """
+    selected_problems = inputs['selected_problems']
+    focused_problems_text = "\n".join([f"* {p}" for p in selected_problems]) if selected_problems else "(特に選択/記述された課題なし)"
+
+    vpc_data = inputs['vpc_final_data'] # 編集後のVPCデータ
+    vpc_text = "\n".join([f"* {key}: {value}" for key, value in vpc_data.items() if value]) if vpc_data else "(VPC情報なし)"
+
+    # Lean Canvas (ステップ2aで編集した各ブロックの値)
+    lean_canvas = inputs['lean_canvas_final']
+    lean_canvas_content = "## Lean Canvas 内容:\n"
+    for key_lc in LEAN_CANVAS_KEYS:
+        lean_canvas_content += f"### {key_lc}\n{lean_canvas.get(key_lc) or '(記述なし)'}\n\n"
+
+    # Moat情報 (選択されたAI案とユーザー最終定義の両方を考慮)
+    selected_ai_moats = inputs['selected_ai_moats_text_final']
+    final_user_moat = inputs['final_moat_definition_user']
+    moat_info_for_prompt = ""
+    if selected_ai_moats:
+        moat_info_for_prompt += f"\nAI提案Moat(ユーザー選択):\n{selected_ai_moats}"
+    if final_user_moat: # ユーザー定義Moatを優先または併記
+        moat_info_for_prompt += f"\n最終Moat定義(ユーザー記述):\n{final_user_moat}"
+    if not moat_info_for_prompt: # どちらも無い場合
+        moat_info_for_prompt = "\nMoat（持続可能な競争優位性）:\n(ステップ4で定義されていません)"
+
+    context_assembler = ContextAssembler(services.model, budget_tokens=services.pitch_token_budget,
+                                         summary_store=services.summary_store, digest_names=DIGEST_NAMES.values())
+    pitch_context, report = context_assembler.assemble([
+        ("技術概要", inputs['tech_summary']),
+        ("ターゲット顧客", inputs['selected_target']),
+        ("顧客の主要な課題", focused_problems_text),
+        ("Value Proposition Canvas", vpc_text),
+        ("Lean Canvas", lean_canvas_content),
+        ("MVP定義", inputs['mvp_definition_final'] or '(MVP定義なし)'),
+        (DIGEST_NAMES['swot_analysis'], inputs['swot_analysis']),
+        (DIGEST_NAMES['four_p_analysis_text'], inputs['four_p_analysis_text']),
+        (DIGEST_NAMES['three_c_analysis_text'], inputs['three_c_analysis_text']),
+        (DIGEST_NAMES['financials_ideas_text'], inputs['financials_ideas_text']),
+        (DIGEST_NAMES['competitor_analysis_text'], inputs['competitor_analysis_text']),
+        ("Moat", moat_info_for_prompt),
+    ])
+
+    prompt = f"""以下は、ある技術シーズの事業化検討プロセスで整理された情報です。
+    これらの情報を戦略的に統合・要約し、指定された11項目のピッチ資料構成に沿った「発表用の骨子テキスト」を作成してください。
+    各項目の記述には、可能であればその根拠となった分析要素（例：SWOT分析より、市場調査より等）を括弧書きで簡潔に示唆してください。
+
+    # 提供情報サマリー
+    ## 技術概要:
+    {pitch_context['技術概要']}
+
+    ## ターゲット顧客:
+    {pitch_context['ターゲット顧客']}
+
+    ## 顧客の主要な課題 (ユーザー選抜済):
+    {pitch_context['顧客の主要な課題']}
+
+    ## Value Proposition Canvas:
+    {pitch_context['Value Proposition Canvas']}
+
+    ## Lean Canvas:
+    {pitch_context['Lean Canvas']}
+
+    ## MVP定義:
+    {pitch_context['MVP定義']}
+
+    ## SWOT分析:
+    {pitch_context['SWOT分析']}
+
+    ## 4P分析:
+    {pitch_context['4P分析']}
+
+    ## 3C分析:
+    {pitch_context['3C分析']}
+
+    ## 財務計画（初期アイデア）:
+    {pitch_context['財務計画']}
+
+    ## 競合分析:
+    {pitch_context['競合分析']}
+
+    ## Moat（持続可能な競争優位性）:
+    {pitch_context['Moat']}
+
+    ---
+    # 作成するピッチ資料構成（11項目 - 必ずこの見出しと順番で出力）:
+    ## 1. タイトル
+    [ここに事業タイトル案とキャッチコピー]
+
+    ## 2. 顧客の課題
+    [ここに記述。提供情報の「顧客の主要な課題」を元に、最も重要な課題を2-3点に絞り、箇条書き3点で具体的に記述]
+
+    ## 3. 解決策
+    [ここに記述。技術概要とVPCの「製品・サービス」「ペインリリーバー」「ゲインクリエイター」を元に、課題をどう解決するかを主要なポイントを箇条書きで明確に]
+
+    ## 4. 市場規模
+    [ここに記述。Lean Canvasの市場規模に関する情報を元に、具体的な市場規模と成長性、そのデータソースの示唆を箇条書きで]
+
+    ## 5. 競合
+    [ここに記述。競合分析の結果を元に、主要な競合とその特徴を簡潔に箇条書きで]
+
+    ## 6. 差別化ポイント・優位性（Moat含む）
+    [ここに記述。Moat情報、SWOTの強み、Lean Canvasの圧倒的優位性を元に、競合に対する明確なアドバンテージを箇条書きで簡潔に説明]
+
+    ## 7. ビジネスモデル
+    [ここに記述。Lean Canvasの収益の流れとコスト構造、4Pの価格戦略を元に、主要な収益化の方法を箇条書きで簡潔に説明]
+
+    ## 8. なぜ今か
+    [ここに記述。市場トレンド、技術的進展、社会情勢などを踏まえ、今この事業を始めるべき理由を完結に説明]
+
+    ## 9. なぜ自分（この会社）か
+    [ここに記述。技術的な強み、チームの専門性（あれば）、独自リソースなどを元に、この事業を成功させられる理由を箇条書きで簡潔に説明]
+
+    ## 10. 事業計画の骨子（3年）
+    [ここに記述。MVPから始め、段階的にどのようなマイルストーン（例：ユーザー獲得、製品開発、収益化）を目指すかの概要を箇条書きで簡潔に]
+
+    ## 11. 収支計画の概算（3年）
+    [ここに記述。主要な収益源とコスト構造から、非常に大まかな収益と費用の見通し、必要な初期投資の規模感などを示唆]
+
+    ---
+    各項目の内容は、投資家や経営層に伝えることを意識し、具体的で説得力のあるものにしてください。マークダウン形式で記述してください。
+    """
+    return prompt, report
+
+
+def run_pitch(inputs, services):
+    prompt, report = build_pitch_prompt(inputs, services)
+    # 生成途中の文章をジョブの途中経過として公開する (画面側が逐次表示する)
+    pitch_text = ""
+    for chunk in stream_text(services.model, prompt):
+        pitch_text += chunk
+        report_progress(pitch_text)
+    return {'pitch_deck_draft_text': pitch_text, 'pitch_context_report': report}
+
+
+# --- ステップ6: VCレビュー ---
+def vc_review_prompt(inputs, services):
+    return f"""あなたは、革新的な技術シーズの事業化可能性を評価する、経験豊富で厳しい視点を持つベンチャーキャピタリスト（VC）です。ビジネスとしての「儲かるか」「スケールするか」「持続可能か」という観点を最も重視します。
+
+    以下の「ピッチ資料骨子」をVCの視点から厳しく評価し、下記の形式で箇条書きで簡潔にフィードバックを出力してください。
+
+    # 評価対象ピッチ資料骨子:
+    ---
+    {inputs['pitch_deck_draft_text']}
+    ---
+
+    # 出力形式:
+    1.  **事業評価スコア（10点満点）:**
+        * ビジネスとしての魅力度、ピッチ内容の完成度を総合的に10点満点で評価し、その主な根拠を箇条書きで簡潔に述べてください。
+    2.  **課題リスト:**
+        * このピッチ内容や事業計画における、特に問題となる点、リスク、さらなる深掘りや改善が必要な点を「課題」として具体的にリストアップしてください。各課題について、なぜそれが問題なのかをVC視点で箇条書きで簡潔に説明してください。
+    3.  **Next Actionリスト:**
+        * 上記の課題を解決し、事業化や資金調達に向けて次に行うべき具体的なアクションを優先度が高い順に提案してください。各アクションについて、それが「LLMに手伝ってもらえること」か「起業家/研究者自身が行う必要があること」かを明記してください。
+
+    フィードバックは具体的かつ建設的であるべきですが、視点は厳しく保ってください。マークダウン形式で記述してください。
+    """
+
+
+# --- ノード一覧 ---
+# inputs の既定値は、キーが state に無い場合にプロンプトへ入る値
+NODES = [
+    Node('targets', {'tech_summary': ''}, ['target_strategy_ideas'],
+         _generate_structured('target_strategy_ideas', target_prompt, TargetIdeas), label="ターゲット戦略"),
+    Node('problems', {'tech_summary': '', 'selected_target': ''}, ['potential_problems'],
+         _generate_structured('potential_problems', problem_prompt, ProblemList), label="顧客の課題リスト",
+         failure={'potential_problems': "課題リストの生成に失敗しました。"}, digest_outputs=['potential_problems']),
+    Node('vpc', {'tech_summary': '', 'selected_target': '', 'selected_problems': []},
+         ['vpc_draft_text', 'parsed_vpc_blocks'], run_vpc, label="VPCドラフト",
+         failure={'vpc_draft_text': "VPCドラフトの生成に失敗しました。", 'parsed_vpc_blocks': {}}),
+    Node('lean_canvas', {'tech_summary': '', 'selected_target': '', 'vpc_final_data': {}},
+         ['market_search_keywords', 'market_search_warnings', 'lean_canvas_raw_output', 'lean_canvas_score_text', 'lean_canvas_parsed_blocks'],
+         run_lean_canvas, label="Lean Canvas"),
+    Node('mvp', dict(PREAMBLE_INPUTS), ['mvp_ideas_text'],
+         _generate_with_preamble('mvp_ideas_text', mvp_prompt), label="MVP案",
+         failure={'mvp_ideas_text': "MVP案の生成に失敗"}),
+    Node('swot', dict(PREAMBLE_INPUTS), ['swot_analysis'],
+         _generate_with_preamble('swot_analysis', swot_prompt), label="SWOT分析",
+         failure={'swot_analysis': "SWOT分析の生成に失敗"}, digest_outputs=['swot_analysis']),
+    Node('four_p', {**PREAMBLE_INPUTS, 'mvp_definition_final': ''},
+         ['four_p_analysis_text'], _generate_with_preamble('four_p_analysis_text', four_p_prompt), label="4P分析",
+         failure={'four_p_analysis_text': "4P分析の生成に失敗"}, digest_outputs=['four_p_analysis_text']),
+    Node('three_c', {**PREAMBLE_INPUTS, 'potential_problems': '', 'vpc_final_data': {}, 'swot_analysis': ''},
+         ['three_c_analysis_text'], _generate_with_preamble('three_c_analysis_text', three_c_prompt), label="3C分析",
+         failure={'three_c_analysis_text': "3C分析の生成に失敗"}, digest_outputs=['three_c_analysis_text']),
+    Node('financials', {**PREAMBLE_INPUTS, 'four_p_analysis_text': ''},
+         ['financials_ideas_text'], _generate_with_preamble('financials_ideas_text', financials_prompt), label="財務計画（初期）",
+         failure={'financials_ideas_text': "財務計画（初期）の生成に失敗"}, digest_outputs=['financials_ideas_text']),
+    Node('competitors', dict(PREAMBLE_INPUTS),
+         ['competitor_search_keywords', 'competitor_search_raw', 'competitor_search_warnings', 'competitor_analysis_text'],
+         run_competitors, label="競合分析",
+         failure={'competitor_search_keywords': [], 'competitor_search_raw': '', 'competitor_search_warnings': [],
+                  'competitor_analysis_text': "競合分析の生成に失敗"},
+         digest_outputs=['competitor_analysis_text']),
+    Node('moat', {**PREAMBLE_INPUTS, 'swot_analysis': '', 'competitor_analysis_text': '(競合分析結果なし)'},
+         ['moat_ideas_text'], _generate_structured('moat_ideas_text', moat_prompt, MoatProposals, preamble=True), label="Moat提案",
+         failure={'moat_ideas_text': "Moatの生成に失敗"}),
+    Node('pitch', {'tech_summary': '(技術概要の情報なし)', 'selected_target': '(ターゲット顧客の情報なし)',
+                   'selected_problems': [], 'vpc_final_data': {}, 'lean_canvas_final': {}, 'mvp_definition_final': '',
+                   'swot_analysis': '(SWOT分析結果なし)', 'four_p_analysis_text': '(4P分析結果なし)',
+                   'three_c_analysis_text': '(3C分析結果なし)', 'financials_ideas_text': '(財務計画初期アイデアなし)',
+                   'competitor_analysis_text': '(競合分析結果なし)', 'selected_ai_moats_text_final': '',
+                   'final_moat_definition_user': ''},
+         ['pitch_deck_draft_text', 'pitch_context_report'], run_pitch, label="ピッチ資料骨子",
+         failure={'pitch_deck_draft_text': "ピッチ資料骨子の生成に失敗しました。", 'pitch_context_report': []}),
+    Node('vc_review', {'pitch_deck_draft_text': ''}, ['vc_review_results_text'],
+         _generate('vc_review_results_text', vc_review_prompt), label="VCレビュー",
+         failure={'vc_review_results_text': "AIによるVCレビューに失敗しました。"}),
+]
+
+# SWOT・4P・3C をまとめて1回で生成するノード。swot / four_p / three_c の名前でも参照できる
+FRAMEWORKS_NODE = Node('frameworks', {**PREAMBLE_INPUTS, 'potential_problems': '', 'vpc_final_data': {}, 'mvp_definition_final': ''},
+                       ['swot_analysis', 'four_p_analysis_text', 'three_c_analysis_text'], run_frameworks,
+                       label="SWOT・4P・3C分析",
+                       failure={'swot_analysis': "SWOT分析の生成に失敗", 'four_p_analysis_text': "4P分析の生成に失敗",
+                                'three_c_analysis_text': "3C分析の生成に失敗"},
+                       digest_outputs=['swot_analysis', 'four_p_analysis_text', 'three_c_analysis_text'],
+                       aliases=['swot', 'four_p', 'three_c'])
+
+
+def build_pipeline(combine_frameworks=False):
+    """分析のパイプラインを作る。combine_frameworks なら SWOT・4P・3C を1回の呼び出しにまとめる。"""
+    if not combine_frameworks:
+        return Pipeline(NODES)
+    return Pipeline([node for node in NODES if node.name not in FRAMEWORKS_NODE.aliases] + [FRAMEWORKS_NODE],
+                    variant="combine_frameworks")
+
+
+pipeline = build_pipeline()
@@ -0,0 +1,183 @@
+# --- セッションの大きな文字列の共有ストア ---
+# 各セッションの session_state には、AIの分析結果 (マークダウン) がいくつも置かれる。
+# 同時に使うユーザーが増えるとサーバーのメモリがその分だけ増えるので、大きな文字列は
+# プロセス共通の BlobStore に圧縮して1回だけ保存し、session_state には参照 (BlobRef) だけを置く。
+# 同じ本文 (応答キャッシュから返った結果など) は全セッションで1つを共有する。
+# メモリ上の合計が上限を超えたら、最近使われていないものからディスク (DiskCache) へ移す。
+# session_state を直接読むと BlobRef が返るので、分析結果は ArtifactState を通して読み書きする。
+import hashlib
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+
+from bizdev.cache import open_cache
+from bizdev.resources import registry
+
+
+class BlobRef:
+    """BlobStore に保存した文字列への参照。"""
+
+    __slots__ = ("blob_id", "chars")
+
+    def __init__(self, blob_id, chars):
+        self.blob_id = blob_id
+        self.chars = chars
+
+    def __repr__(self):
+        return f"BlobRef({self.blob_id[:12]}, {self.chars}字)"
+
+
+class BlobStore:
+    """文字列を本文のハッシュで1回だけ、圧縮して保存する。
+
+    max_memory_bytes: メモリ上に置く圧縮後の合計サイズ。超えたら最近使われていないものから spill へ移す
+    spill: 溢れた文字列の保存先 (DiskCache)。None なら溢れた文字列は破棄する
+    """
+
+    def __init__(self, max_memory_bytes=64 * 1024 * 1024, spill=None, level=6):
+        self.max_memory_bytes = max_memory_bytes
+        self.spill = spill
+        self.level = level
+        self.memory_bytes = 0
+        self.puts = 0
+        self.shared = 0  # 既に保存済みの本文だった (複製せずに済んだ) 回数
+        self.spilled = 0  # ディスクへ移した回数
+        self.reloaded = 0  # ディスクからメモリへ戻した回数
+        self._blobs = OrderedDict()  # blob_id -> 圧縮済みの本文 (古く使われたものが先頭)
+        self._lock = threading.Lock()
+
+    def put(self, text):
+        blob_id = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            self.puts += 1
+            if blob_id in self._blobs:
+                self._blobs.move_to_end(blob_id)
+                self.shared += 1
+            else:
+                self._add(blob_id, zlib.compress(text.encode("utf-8"), self.level))
+        return BlobRef(blob_id, len(text))
+
+    def get(self, ref):
+        """参照先の文字列。ディスクからも期限切れなどで消えていれば None。"""
+        with self._lock:
+            data = self._blobs.get(ref.blob_id)
+            if data is not None:
+                self._blobs.move_to_end(ref.blob_id)
+                return zlib.decompress(data).decode("utf-8")
+        text = self.spill.get(ref.blob_id) if self.spill is not None else None
+        if text is not None:
+            with self._lock:
+                # よく使われる文字列はメモリへ戻す
+                if ref.blob_id not in self._blobs:
+                    self._add(ref.blob_id, zlib.compress(text.encode("utf-8"), self.level))
+                    self.reloaded += 1
+        return text
+
+    def contains(self, ref):
+        with self._lock:
+            if ref.blob_id in self._blobs:
+                return True
+        return self.spill is not None and self.spill.get(ref.blob_id) is not None
+
+    def _add(self, blob_id, data):
+        self._blobs[blob_id] = data
+        self.memory_bytes += len(data)
+        while self.memory_bytes > self.max_memory_bytes and len(self._blobs) > 1:
+            old_id, old_data = self._blobs.popitem(last=False)
+            self.memory_bytes -= len(old_data)
+            if self.spill is not None:
+                self.spill.set(old_id, zlib.decompress(old_data).decode("utf-8"))
+                self.spilled += 1
+
+    def stats(self):
+        with self._lock:
+            return {"blobs": len(self._blobs), "memory_bytes": self.memory_bytes, "puts": self.puts,
+                    "shared": self.shared, "spilled": self.spilled, "reloaded": self.reloaded}
+
+
+class ArtifactState:
+    """session_state のビュー。keys の大きな文字列は BlobStore に置き、読む時に本文へ戻す。
+
+    パイプライン・プロジェクトの保存など、state を辞書として扱う処理には session_state の代わりにこれを渡す。
+    min_chars より短い文字列と、文字列以外の値はそのまま session_state に置く。
+    """
+
+    def __init__(self, state, store, keys, min_chars=1000):
+        self.state = state
+        self.store = store
+        self.keys = set(keys)
+        self.min_chars = min_chars
+
+    def __getitem__(self, key):
+        value = self.state[key]
+        if isinstance(value, BlobRef):
+            value = self.store.get(value)
+            if value is None:
+                raise KeyError(key) # 保存期限が切れた。無いものとして作り直させる
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        if key not in self.state:
+            return False
+        value = self.state[key]
+        return not isinstance(value, BlobRef) or self.store.contains(value)
+
+    def __setitem__(self, key, value):
+        if key in self.keys and isinstance(value, str) and len(value) >= self.min_chars:
+            value = self.store.put(value)
+        self.state[key] = value
+
+    def __delitem__(self, key):
+        del self.state[key]
+
+    def pop(self, key, *default):
+        if key not in self.state:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self.get(key, *default)
+        del self.state[key]
+        return value
+
+
+def deep_size(value):
+    """値がメモリ上で占めるおおよそのバイト数 (入れ子の dict / list も数える)。"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(k) + deep_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(deep_size(v) for v in value)
+    return size
+
+
+def memory_report(state):
+    """セッションの state のキーごとのメモリ使用量。大きい順の [{キー, 保持方法, 文字数, バイト数}]。
+
+    BlobStore に置いた文字列はセッションでは参照分しか数えない (本文は全セッションで共有)。
+    """
+    rows = []
+    for key in list(state.keys()):
+        value = state[key]
+        if isinstance(value, BlobRef):
+            rows.append({"キー": key, "保持方法": "共有ストア", "文字数": value.chars, "バイト数": sys.getsizeof(value)})
+        else:
+            chars = len(value) if isinstance(value, str) else None
+            rows.append({"キー": key, "保持方法": "セッション", "文字数": chars, "バイト数": deep_size(value)})
+    return sorted(rows, key=lambda row: row["バイト数"], reverse=True)
+
+
+def get_blob_store(max_memory_mb=64, spill_ttl_seconds=7 * 24 * 3600, spill_max_mb=1024):
+    """プロセス内で1つの BlobStore を返す。溢れた文字列は .cache/session_blobs.sqlite3 に置く。"""
+    def create():
+        spill = open_cache("session_blobs", ttl_seconds=spill_ttl_seconds, max_bytes=spill_max_mb * 1024 * 1024)
+        return BlobStore(max_memory_bytes=max_memory_mb * 1024 * 1024, spill=spill)
+    store = registry.get("session_blobs", create)
+    store.max_memory_bytes = max_memory_mb * 1024 * 1024
+    return store
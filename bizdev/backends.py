@@ -0,0 +1,397 @@
+# --- AI・検索のバックエンド (本番のAPI / 応答の録画と再生) ---
+# モデル (generate_content) と検索サービス (cse().list) は Backend から作る。
+#   "live"   google.generativeai と Google Custom Search API (既定)
+#   "record" live と同じだが、応答を録画ファイル (JSONL) に追記する
+#   "replay" APIキーなしで、録画した応答を返すローカルの代替。遅延の分布とエラー率を設定でき、
+#            負荷試験 (benchmarks/load_test.py) や、APIを使わない動作確認に使う
+#
+# 録画は1行1件の JSON:
+#   {"kind": "gemini", "step": 分析名, "key": プロンプトのハッシュ, "json": 構造化出力か, "text": 本文}
+#   {"kind": "search", "step": 分析名, "key": クエリのハッシュ, "items": [...]}
+# 再生ではハッシュが一致する応答を返し、無ければ同じ分析 (bizdev.metrics.current_step) の録画を順に返す。
+# それも無ければ、構造化出力はスキーマから作ったJSON、それ以外は各パーサーが読める汎用のマークダウンを返す。
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+import types
+
+from bizdev.cache import make_key
+from bizdev.context import default_counter
+from bizdev.metrics import current_step
+from bizdev.resources import registry
+
+
+class LiveBackend:
+    """本番のAPI。"""
+
+    name = "live"
+
+    def generative_model(self, api_key, model_name):
+        import google.generativeai as genai # 重いSDKは最初にモデルを作る時に読み込む
+
+        # configure() はクライアント(gRPCチャネル)を作り直すので、再接続もこの経路で行われる
+        genai.configure(api_key=api_key)
+        return genai.GenerativeModel(model_name)
+
+    def search_service(self, api_key):
+        from googleapiclient.discovery import build # 検索を使うステップで初めて読み込む (起動時間短縮)
+
+        return build("customsearch", "v1", developerKey=api_key, cache_discovery=False)
+
+
+def _is_json(generation_config):
+    if generation_config is None:
+        return False
+    if isinstance(generation_config, dict):
+        return generation_config.get("response_mime_type") == "application/json"
+    return getattr(generation_config, "response_mime_type", None) == "application/json"
+
+
+def _response_text(response):
+    try:
+        return response.text
+    except ValueError:
+        return ""
+
+
+class _Recorder:
+    """録画ファイルへの追記 (複数スレッドから呼ばれる)。"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write(self, entry):
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.count += 1
+
+
+class _RecordingModel:
+    def __init__(self, model, recorder):
+        self.model = model
+        self.recorder = recorder
+        self.model_name = getattr(model, "model_name", "")
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        entry = {"kind": "gemini", "step": current_step(), "key": make_key("replay", str(prompt)),
+                 "json": _is_json(generation_config)}
+        response = self.model.generate_content(prompt, generation_config=generation_config, stream=stream, **kwargs)
+        if stream:
+            return self._recording_stream(response, entry)
+        text = _response_text(response)
+        if text:
+            self.recorder.write({**entry, "text": text})
+        return response
+
+    def _recording_stream(self, chunks, entry):
+        texts = []
+        for chunk in chunks:
+            texts.append(_response_text(chunk))
+            yield chunk
+        if any(texts):
+            self.recorder.write({**entry, "text": "".join(texts)})
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class _RecordingRequest:
+    def __init__(self, request, recorder, query):
+        self.request = request
+        self.recorder = recorder
+        self.query = query
+
+    def execute(self, **kwargs):
+        res = self.request.execute(**kwargs)
+        self.recorder.write({"kind": "search", "step": current_step(), "key": make_key("replay", self.query),
+                             "items": res.get('items', [])})
+        return res
+
+
+class _RecordingSearchService:
+    def __init__(self, service, recorder):
+        self.service = service
+        self.recorder = recorder
+
+    def cse(self):
+        return self
+
+    def list(self, q, **kwargs):
+        return _RecordingRequest(self.service.cse().list(q=q, **kwargs), self.recorder, q)
+
+
+class RecordingBackend(LiveBackend):
+    """本番のAPIを呼び、応答を path (JSONL) に追記する。"""
+
+    name = "record"
+
+    def __init__(self, path):
+        self.recorder = _Recorder(path)
+
+    def generative_model(self, api_key, model_name):
+        return _RecordingModel(super().generative_model(api_key, model_name), self.recorder)
+
+    def search_service(self, api_key):
+        return _RecordingSearchService(super().search_service(api_key), self.recorder)
+
+    def stats(self):
+        return {"recorded": self.recorder.count}
+
+
+class LatencyDistribution:
+    """対数正規分布の遅延 (秒)。中央値と p95 で指定する。"""
+
+    def __init__(self, median_seconds, p95_seconds=None):
+        self.median_seconds = median_seconds
+        p95_seconds = p95_seconds if p95_seconds is not None else median_seconds
+        # p95 = 中央値 * exp(1.645σ)
+        self.sigma = math.log(p95_seconds / median_seconds) / 1.645 if median_seconds > 0 and p95_seconds > median_seconds else 0.0
+
+    def sample(self, rng):
+        if self.median_seconds <= 0:
+            return 0.0
+        return self.median_seconds * math.exp(rng.gauss(0, self.sigma)) if self.sigma else self.median_seconds
+
+
+# 録画が無い場合の汎用のマークダウン (ターゲット案・課題・Moat案・SWOT/4P/3C などのパーサーが読める形)
+SYNTHETIC_MARKDOWN = """**ターゲット案1: 中堅製造業の品質保証部門**
+* 根拠: 検査工程の人手不足が深刻で、導入の意思決定が早い。
+
+**ターゲット案2: 食品工場の生産技術部門**
+* 根拠: 異物混入の検査を自動化したい需要がある。
+
+* 検査員の確保が難しく、検査工程がボトルネックになっている
+* 目視検査の判定基準が検査員ごとにばらつく
+
+**Moat案1:** 現場ごとの検査データの蓄積
+* 理由: 導入先が増えるほど学習データが増え、後発が追いつきにくい。
+
+## SWOT分析結果
+* 強み: 少量データで学習できる
+
+## 4P分析結果
+* 製品: 後付けの検査ユニット
+
+## 3C分析結果
+* 顧客: 人手不足に悩む製造現場
+"""
+
+
+def _synthetic_json(schema, label="項目", index=1):
+    """JSONスキーマ (dict) の形をした値を作る。文字列は空にしない (結果クラスの検証に通す)。"""
+    kind = schema.get("type") if isinstance(schema, dict) else None
+    if kind == "object":
+        return {key: _synthetic_json(sub, key, index) for key, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [_synthetic_json(schema.get("items", {}), label, i) for i in range(1, 4)]
+    if kind in ("integer", "number"):
+        return index
+    if kind == "boolean":
+        return True
+    return f"{label}の例{index}: 再生用の応答です。"
+
+
+class ReplayResponse:
+    """GenerativeModel の応答と同じく .text と usage_metadata を持つ。"""
+
+    def __init__(self, text, prompt_tokens=0, output_tokens=0):
+        self.text = text
+        self.usage_metadata = types.SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=output_tokens)
+
+
+class ReplayModel:
+    """ReplayBackend の応答を、設定した遅延とエラー率で返すモデル。"""
+
+    def __init__(self, backend, model_name):
+        self.backend = backend
+        # 本番の応答キャッシュと混ざらないよう、モデル名を分ける
+        self.model_name = f"replay/{model_name}"
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        backend = self.backend
+        latency = backend.delay(backend.latency)
+        backend.maybe_fail(latency)
+        entry = backend.lookup("gemini", make_key("replay", str(prompt)), current_step(), json=_is_json(generation_config))
+        if entry is not None:
+            text = entry["text"]
+        elif _is_json(generation_config):
+            schema = generation_config.get("response_schema") if isinstance(generation_config, dict) \
+                else getattr(generation_config, "response_schema", None)
+            text = json.dumps(_synthetic_json(schema or {}), ensure_ascii=False)
+        else:
+            text = SYNTHETIC_MARKDOWN
+        counter = default_counter()
+        prompt_tokens, output_tokens = counter.count(str(prompt)), counter.count(text)
+        if stream:
+            return self._stream(text, latency, prompt_tokens, output_tokens)
+        time.sleep(latency)
+        return ReplayResponse(text, prompt_tokens, output_tokens)
+
+    def _stream(self, text, latency, prompt_tokens, output_tokens, chunks=8):
+        # 遅延の 1/3 で最初のチャンクを返し、残りを均等に返す
+        size = max(1, math.ceil(len(text) / chunks))
+        parts = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+        time.sleep(latency / 3)
+        for i, part in enumerate(parts):
+            if i:
+                time.sleep(latency * 2 / 3 / max(len(parts) - 1, 1))
+            last = i == len(parts) - 1
+            yield ReplayResponse(part, prompt_tokens if last else 0, output_tokens if last else 0)
+
+    def count_tokens(self, contents):
+        return types.SimpleNamespace(total_tokens=default_counter().count(str(contents)))
+
+
+class _ReplayRequest:
+    def __init__(self, backend, query, num):
+        self.backend = backend
+        self.query = query
+        self.num = num
+
+    def execute(self, **kwargs):
+        backend = self.backend
+        latency = backend.delay(backend.search_latency)
+        backend.maybe_fail(latency, search=True)
+        time.sleep(latency)
+        entry = backend.lookup("search", make_key("replay", self.query), current_step())
+        if entry is not None:
+            return {"items": entry["items"][:self.num]}
+        return {"items": [{"title": f"{self.query} - 検索結果{i}", "snippet": f"{self.query} に関する再生用の検索結果です。",
+                           "link": f"https://example.com/replay/{i}"} for i in range(1, self.num + 1)]}
+
+
+class _ReplaySearchService:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def cse(self):
+        return self
+
+    def list(self, q, cx=None, num=10, **kwargs):
+        return _ReplayRequest(self.backend, q, num)
+
+
+class ReplayBackend:
+    """録画した応答を返すローカルの代替。
+
+    path: 録画ファイル (JSONL)。None または存在しなければ、汎用の応答だけを返す
+    latency / search_latency: 1回の呼び出しの遅延 (LatencyDistribution)
+    error_rate / search_error_rate: 一時的なエラー (Gemini は 503、検索は接続エラー) を返す確率
+    time_scale: 遅延に掛ける倍率 (0 で待たない)
+    """
+
+    name = "replay"
+
+    def __init__(self, path=None, latency=None, search_latency=None, error_rate=0.0, search_error_rate=0.0,
+                 time_scale=1.0, seed=None):
+        self.path = path
+        self.latency = latency or LatencyDistribution(2.0, 6.0)
+        self.search_latency = search_latency or LatencyDistribution(0.3, 1.0)
+        self.error_rate = error_rate
+        self.search_error_rate = search_error_rate
+        self.time_scale = time_scale
+        self.calls = 0
+        self.errors = 0
+        self.exact = 0  # ハッシュが一致した録画を返した回数
+        self.by_step = 0  # 同じ分析の録画を返した回数
+        self.synthetic = 0  # 汎用の応答を返した回数
+        self._exact = {}  # (kind, key) -> 録画
+        self._steps = {}  # (kind, step, json) -> 録画のリスト
+        self._cycles = {}  # (kind, step, json) -> 録画を順に返すイテレータ
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def load(self, path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                kind, json_flag = entry.get("kind"), bool(entry.get("json"))
+                self._exact[(kind, entry.get("key"))] = entry
+                self._steps.setdefault((kind, entry.get("step"), json_flag), []).append(entry)
+
+    def generative_model(self, api_key, model_name):
+        return ReplayModel(self, model_name)
+
+    def search_service(self, api_key):
+        return _ReplaySearchService(self)
+
+    def delay(self, distribution):
+        with self._lock:
+            return distribution.sample(self._rng) * self.time_scale
+
+    def maybe_fail(self, latency, search=False):
+        with self._lock:
+            self.calls += 1
+            failed = self._rng.random() < (self.search_error_rate if search else self.error_rate)
+            if failed:
+                self.errors += 1
+        if not failed:
+            return
+        time.sleep(latency / 3) # エラーも多少の時間をかけて返る
+        if search:
+            raise ConnectionError("replay: 模擬的な接続エラー")
+        from google.api_core import exceptions as api_exceptions
+
+        raise api_exceptions.ServiceUnavailable("replay: 模擬的な一時エラー")
+
+    def lookup(self, kind, key, step, json=False):
+        with self._lock:
+            entry = self._exact.get((kind, key))
+            if entry is not None and (kind != "gemini" or bool(entry.get("json")) == json):
+                self.exact += 1
+                return entry
+            group = (kind, step, json)
+            if group in self._steps:
+                self.by_step += 1
+                if group not in self._cycles:
+                    self._cycles[group] = itertools.cycle(self._steps[group])
+                return next(self._cycles[group])
+            self.synthetic += 1
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "errors": self.errors, "exact": self.exact, "by_step": self.by_step,
+                    "synthetic": self.synthetic, "recordings": len(self._exact)}
+
+
+def backend_settings(settings):
+    """st.secrets (または同じキーの辞書) の BACKEND と [replay] セクションから get_backend() の引数を作る。"""
+    section = settings.get("replay", {})
+    return {
+        "name": str(settings.get("BACKEND", "live")).lower(),
+        "path": settings.get("RECORDINGS_PATH", os.path.join(".cache", "recordings.jsonl")),
+        "latency": LatencyDistribution(float(section.get("latency_median_seconds", 2.0)),
+                                       float(section.get("latency_p95_seconds", 6.0))),
+        "search_latency": LatencyDistribution(float(section.get("search_latency_median_seconds", 0.3)),
+                                              float(section.get("search_latency_p95_seconds", 1.0))),
+        "error_rate": float(section.get("error_rate", 0.0)),
+        "search_error_rate": float(section.get("search_error_rate", 0.0)),
+        "time_scale": float(section.get("time_scale", 1.0)),
+    }
+
+
+def get_backend(name="live", path=None, **replay_options):
+    """name ("live" / "record" / "replay") のバックエンドをプロセス内で1つだけ作って返す。"""
+    if name == "replay":
+        return registry.get(("backend", name, path), lambda: ReplayBackend(path, **replay_options))
+    if name == "record":
+        return registry.get(("backend", name, path), lambda: RecordingBackend(path or os.path.join(".cache", "recordings.jsonl")))
+    if name != "live":
+        raise ValueError(f"不明なバックエンドです: {name}")
+    return registry.get(("backend", name), LiveBackend)
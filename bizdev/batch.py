@@ -0,0 +1,261 @@
+# --- 技術シーズの一括処理 (画面なし) ---
+# CSVの1行を1つの技術シーズとして、アプリと同じ分析(bizdev.analyses)を
+# ターゲット案 → 課題 → VPC → Lean Canvas → 深掘り → 競合 → Moat → ピッチ → VCレビュー まで実行する。
+# 画面でユーザーが選ぶ箇所 (ターゲット・課題・Moat案) は自動で選ぶ。
+#
+#   python -m bizdev.batch seeds.csv --output results.jsonl --concurrency 4
+#
+# CSVの列: tech_name, problem, features, areas, free_text (任意), id (任意), target (任意: ターゲットを指定する場合)
+# APIキーは環境変数 GEMINI_API_KEY / GOOGLE_API_KEY / SEARCH_ENGINE_ID から読む。
+# 結果は1シーズ終わるごとに JSONL へ追記するので、途中で落ちても同じコマンドで続きから再開できる
+# (成功済みのIDは飛ばす。途中まで進んでいたシーズも応答キャッシュにより生成済みの分はAPIを呼ばない)。
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from bizdev.analyses import LEAN_CANVAS_KEYS, Services, build_pipeline, pipeline
+from bizdev.backends import backend_settings, get_backend
+from bizdev.cache import make_key, open_cache
+from bizdev.context_cache import get_context_cache
+from bizdev.digests import get_summary_store
+from bizdev.lazy import LazyResource
+from bizdev.metrics import metrics, start_metrics_server
+from bizdev.parsing import parse_problem_lines, parse_target_options, split_moat_proposals
+from bizdev.ratelimit import (PRIORITY_BATCH, PriorityContextCache, PriorityModel, PrioritySearchClient, get_limiter,
+                              limiter_settings)
+from bizdev.resources import get_model
+from bizdev.search import get_search_client
+from bizdev.shared import use_shared_store
+
+# 画面のステップに対応する実行段階。各段階のあとに、画面でユーザーが行う選択を自動で行う
+STAGES = [
+    ['targets'],
+    ['problems'],
+    ['vpc'],
+    ['lean_canvas'],
+    ['mvp', 'swot', 'four_p', 'three_c', 'financials', 'competitors', 'moat'],
+    ['pitch'],
+    ['vc_review'],
+]
+
+# 結果の1行に含める state のキー (全ノードの出力と、自動で選んだ内容)
+RESULT_KEYS = [key for node in pipeline.nodes.values() for key in node.outputs] + [
+    'selected_target', 'selected_problems', 'vpc_final_data', 'lean_canvas_final', 'selected_ai_moats_text_final',
+]
+
+
+def tech_summary(row):
+    """ステップ0の入力フォームと同じ形式の技術概要。"""
+    return f"""
+                技術の名称: {row.get('tech_name', '')}
+                解決したい課題: {row.get('problem', '')}
+                技術的な特徴・新規性: {row.get('features', '')}
+                応用できそうな分野・用途: {row.get('areas', '')}
+                補足情報: {row.get('free_text') or 'なし'}
+                """
+
+
+def seed_id(row):
+    """id 列が無ければ、入力内容のハッシュをIDにする (行の並べ替えや追加をしても再開できる)。"""
+    if row.get('id'):
+        return str(row['id'])
+    return make_key("seed", [row.get(k, '') for k in ('tech_name', 'problem', 'features', 'areas', 'free_text')])[:16]
+
+
+def choose(state, stage, row):
+    """段階 stage の出力から、画面でユーザーが行う選択を自動で行う。"""
+    if stage == ['targets']:
+        options = parse_target_options(state.get('target_strategy_ideas', ''))
+        state['selected_target'] = row.get('target') or (options[0] if options else state.get('target_strategy_ideas', ''))
+    elif stage == ['problems']:
+        state['selected_problems'] = parse_problem_lines(state.get('potential_problems', ''))
+    elif stage == ['vpc']:
+        state['vpc_final_data'] = dict(state.get('parsed_vpc_blocks', {}))
+    elif stage == ['lean_canvas']:
+        lc_parsed = state.get('lean_canvas_parsed_blocks', {})
+        state['lean_canvas_final'] = {key_lc: lc_parsed.get(key_lc, "") for key_lc in LEAN_CANVAS_KEYS}
+    elif 'moat' in stage:
+        state['selected_ai_moats_text_final'] = "\n\n".join(split_moat_proposals(state.get('moat_ideas_text', '')))
+
+
+def run_seed(row, services, node_workers=3, pipeline=pipeline):
+    """1つのシーズについて全段階を実行し、結果の1行 (dict) を返す。"""
+    started = time.time()
+    state = {'tech_summary': tech_summary(row)}
+    errors = {}
+    completed = False
+    for stage in STAGES:
+        failed = False
+        for node, error in pipeline.run(state, stage, services, max_workers=node_workers):
+            if error:
+                errors[node.name] = f"{node.label}の生成中にエラー: {error}"
+                failed = True
+        if failed or any(pipeline.is_stale(state, pipeline[name]) for name in stage):
+            # 失敗した分析の出力は失敗時の既定値 (または無し) なので、それを元に選択・後続の分析を行わない
+            break
+        choose(state, stage, row)
+    else:
+        completed = True
+
+    result = {'id': seed_id(row), 'tech_name': row.get('tech_name', '')}
+    # 失敗した分析が1つでもあれば failed とし、再実行時にやり直す (finished_ids)
+    result['status'] = "ok" if completed and not errors else "failed"
+    result['errors'] = errors
+    result['seconds'] = round(time.time() - started, 1)
+    result.update({key: state[key] for key in RESULT_KEYS if key in state})
+    return result
+
+
+def read_seeds(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return list(csv.DictReader(f))
+
+
+def finished_ids(jsonl_path):
+    """既に成功している(=再実行しない)シーズのID。"""
+    ids = set()
+    if not os.path.exists(jsonl_path):
+        return ids
+    with open(jsonl_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue # 書き込み中に落ちた最後の行など
+            if record.get('status') == "ok":
+                ids.add(record['id'])
+    return ids
+
+
+def write_parquet(jsonl_path, parquet_path):
+    """JSONLの結果を Parquet に変換する。同じIDが複数行あれば最後の行を使う。"""
+    import pyarrow as pa # streamlit の依存として入っている
+    import pyarrow.parquet as pq
+
+    records = {}
+    with open(jsonl_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[record['id']] = record
+    # 辞書やリストの列はシーズごとに形が違うので、JSON文字列として保存する
+    rows = [{k: json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v for k, v in r.items()}
+            for r in records.values()]
+    pq.write_table(pa.Table.from_pylist(rows), parquet_path)
+
+
+def build_services(gemini_rpm, search_qpm):
+    """環境変数のAPIキーから、アプリと同じ構成のモデルと検索クライアントを作る。"""
+    # SHARED_STORE_URL=redis://... で、アプリのレプリカと応答キャッシュ・レート制限を共有する
+    use_shared_store(os.environ.get("SHARED_STORE_URL", ""))
+    # BACKEND=replay で録画した応答を再生する (APIキー不要)。[replay] の設定は REPLAY_<項目名> の環境変数で指定する
+    replay_section = {key[len("REPLAY_"):].lower(): value for key, value in os.environ.items() if key.startswith("REPLAY_")}
+    backend = get_backend(**backend_settings({**os.environ, "replay": replay_section}))
+    default_key = "replay" if backend.name == "replay" else ""
+    api_key = os.environ["GEMINI_API_KEY"] if backend.name != "replay" else os.environ.get("GEMINI_API_KEY", default_key)
+    google_api_key = os.environ.get("GOOGLE_API_KEY", default_key)
+    search_engine_id = os.environ.get("SEARCH_ENGINE_ID", default_key)
+    rate_limits = limiter_settings({"rate_limits": {"gemini_rpm": gemini_rpm, "search_qpm": search_qpm}})
+    generation_options = {
+        "max_attempts": int(os.environ.get("GENERATION_MAX_ATTEMPTS", 4)),
+        "call_timeout": float(os.environ.get("GENERATION_CALL_TIMEOUT_SECONDS", 90)),
+        "total_deadline": float(os.environ.get("GENERATION_DEADLINE_SECONDS", 180)),
+        "limiter": get_limiter("gemini", *rate_limits["gemini"]),
+    }
+    price_per_mtok = (float(os.environ.get("GEMINI_PRICE_INPUT_PER_MTOK", 0.075)),
+                      float(os.environ.get("GEMINI_PRICE_OUTPUT_PER_MTOK", 0.30)))
+    # 生成・検索はバッチ用の優先度で行う (画面操作中のユーザーの呼び出しを先に通す)
+    model = PriorityModel(LazyResource(lambda: get_model(api_key, generation_options=generation_options,
+                                                         price_per_mtok=price_per_mtok, backend=backend)), PRIORITY_BATCH)
+    # CONTEXT_CACHE=gemini で、ステップ3以降に共通の前提情報をコンテキストキャッシュに登録する (アプリと同じ設定)
+    context_cache_mode = os.environ.get("CONTEXT_CACHE", "off").lower()
+    if context_cache_mode == "gemini" and backend.name == "replay":
+        context_cache_mode = "local"
+    context_cache = get_context_cache(
+        context_cache_mode, api_key=api_key, model=model,
+        model_name=os.environ.get("CONTEXT_CACHE_MODEL", "models/gemini-1.5-flash-001"),
+        ttl_seconds=int(os.environ.get("CONTEXT_CACHE_TTL_SECONDS", 3600)),
+        min_tokens=int(os.environ.get("CONTEXT_CACHE_MIN_TOKENS", 32768)),
+        generation_options=generation_options, llm_cache=open_cache("gemini_responses"), price_per_mtok=price_per_mtok)
+
+    def make_search_client():
+        if not google_api_key or not search_engine_id:
+            raise KeyError("環境変数 GOOGLE_API_KEY と SEARCH_ENGINE_ID を設定してください")
+        return PrioritySearchClient(get_search_client(google_api_key, search_engine_id, backend=backend,
+                                                      limiter=get_limiter("search", *rate_limits["search"])), PRIORITY_BATCH)
+
+    return Services(model, search_client=make_search_client, summary_store=get_summary_store(),
+                    pitch_token_budget=int(os.environ.get("PITCH_CONTEXT_TOKEN_BUDGET", 8000)),
+                    structured_output=os.environ.get("STRUCTURED_OUTPUT", "true").lower() != "false",
+                    context_cache=PriorityContextCache(context_cache, PRIORITY_BATCH) if context_cache else None,
+                    backend_name=backend.name)
+
+
+def run_batch(seeds, services, jsonl_path, concurrency=4, node_workers=3, pipeline=pipeline, log=sys.stderr):
+    """未処理のシーズを concurrency 件ずつ並列に処理し、終わったものから jsonl_path へ追記する。"""
+    done_ids = finished_ids(jsonl_path)
+    todo = [row for row in seeds if seed_id(row) not in done_ids]
+    print(f"{len(seeds)}件中 {len(seeds) - len(todo)}件は処理済み。{len(todo)}件を処理します。", file=log)
+
+    started = time.time()
+    lock = threading.Lock()
+    counts = {"ok": 0, "failed": 0}
+    with open(jsonl_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(run_seed, row, services, node_workers, pipeline): row for row in todo}
+        for future in as_completed(futures):
+            row = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'id': seed_id(row), 'tech_name': row.get('tech_name', ''), 'status': "failed",
+                          'errors': {'batch': repr(e)}}
+            with lock:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                counts[result['status']] += 1
+            finished = counts["ok"] + counts["failed"]
+            per_hour = finished / max(time.time() - started, 1e-9) * 3600
+            print(f"[{finished}/{len(todo)}] {result['id']} {result['status']} ({per_hour:.1f} シーズ/時)", file=log)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="技術シーズのCSVをまとめて分析し、結果を JSONL / Parquet で出力する")
+    parser.add_argument("seeds", help="シーズのCSV (列: tech_name, problem, features, areas, free_text, id, target)")
+    parser.add_argument("--output", default="results.jsonl", help="出力先 (.jsonl または .parquet)")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時に処理するシーズ数")
+    parser.add_argument("--node-workers", type=int, default=3, help="1シーズ内で同時に実行する分析数")
+    parser.add_argument("--gemini-rpm", type=float, default=float(os.environ.get("GEMINI_RPM", 60)), help="Gemini呼び出し回数の上限 (1分あたり)")
+    parser.add_argument("--search-qpm", type=float, default=float(os.environ.get("SEARCH_QPM", 60)), help="Google検索回数の上限 (1分あたり)")
+    args = parser.parse_args(argv)
+
+    # Parquet は最後にまとめて書くので、途中経過(再開用)は隣の JSONL に追記する
+    parquet_path = args.output if args.output.endswith(".parquet") else None
+    jsonl_path = parquet_path + ".jsonl" if parquet_path else args.output
+
+    if os.environ.get("METRICS_PORT"):
+        # 長時間の一括処理を Prometheus から監視できるようにする
+        start_metrics_server(int(os.environ["METRICS_PORT"]))
+    services = build_services(args.gemini_rpm, args.search_qpm)
+    # COMBINE_FRAMEWORKS=true で SWOT・4P・3C を1回の呼び出しでまとめて生成する
+    batch_pipeline = build_pipeline(combine_frameworks=os.environ.get("COMBINE_FRAMEWORKS", "false").lower() == "true")
+    counts = run_batch(read_seeds(args.seeds), services, jsonl_path, concurrency=args.concurrency,
+                       node_workers=args.node_workers, pipeline=batch_pipeline)
+    if parquet_path:
+        write_parquet(jsonl_path, parquet_path)
+    print(f"完了: 成功 {counts['ok']}件 / 失敗 {counts['failed']}件 → {args.output}", file=sys.stderr)
+    calls = [row for row in metrics.summary() if row["種類"] == "gemini"]
+    print(f"Gemini呼び出し {sum(row['呼び出し'] for row in calls)}回 / 概算コスト ${sum(row['概算コスト(USD)'] for row in calls):.4f}",
+          file=sys.stderr)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
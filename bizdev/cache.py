@@ -0,0 +1,161 @@
+# --- ローカルディスク上の永続キャッシュ (SQLite) ---
+# 同じ入力に対するAPI応答を再利用するための汎用キャッシュ。
+# TTLで期限切れを判定し、合計サイズが上限を超えたら最も古く参照されたものから削除する (LRU)。
+# 共有ストア (bizdev.shared) を設定している場合は、同じインターフェースの SharedCache を使い、全レプリカで共有する。
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache")
+
+_open_caches = {}  # path -> DiskCache, ("shared", 名前) -> SharedCache (プロセス内で共有)
+_open_caches_lock = threading.Lock()
+
+
+def make_key(*parts):
+    """任意の値の組からキャッシュキー(sha256)を作る。"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=repr)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """文字列値を保存するSQLiteキャッシュ。ヒット/ミス数を数える。"""
+
+    def __init__(self, path, ttl_seconds=7 * 24 * 3600, max_bytes=200 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # 並列実行中のワーカースレッドからも使うので、ロックで直列化して1接続を共有する
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        """値を返す。無い、または期限切れなら None。"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _evict(self):
+        # 合計サイズが上限を超えていれば、最後に参照された時刻が古いものから削除
+        if self.max_bytes is None:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": total}
+
+
+class SharedCache:
+    """共有ストア (Redis 互換) に置くキャッシュ。DiskCache と同じインターフェース。
+
+    期限切れは Redis の EXPIRE に任せる。合計サイズの上限は Redis 側の maxmemory と
+    maxmemory-policy (allkeys-lru など) で設定する。件数・サイズは数えない (stats() では None)。
+    """
+
+    def __init__(self, store, name, ttl_seconds=7 * 24 * 3600):
+        self.store = store
+        self.prefix = f"bizdev:cache:{name}:"
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = self.store.get(self.prefix + key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.store.set(self.prefix + key, value, ex=self.ttl_seconds)
+
+    def delete(self, key):
+        self.store.delete(self.prefix + key)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": None, "bytes": None}
+
+
+def open_cache(name, ttl_seconds=7 * 24 * 3600, max_bytes=200 * 1024 * 1024, cache_dir=None):
+    """名前ごとにプロセス内で1つの DiskCache を返す (Streamlitの再実行をまたいで共有される)。
+
+    共有ストアを設定している場合は SharedCache を返す。
+    """
+    from bizdev.shared import get_shared_store
+
+    store = get_shared_store()
+    if store is not None:
+        with _open_caches_lock:
+            cache = _open_caches.get(("shared", name))
+            if cache is None or cache.store is not store:
+                cache = SharedCache(store, name, ttl_seconds=ttl_seconds)
+                _open_caches[("shared", name)] = cache
+            cache.ttl_seconds = ttl_seconds
+            return cache
+    path = os.path.join(cache_dir or DEFAULT_CACHE_DIR, f"{name}.sqlite3")
+    with _open_caches_lock:
+        cache = _open_caches.get(path)
+        if cache is None:
+            cache = DiskCache(path, ttl_seconds=ttl_seconds, max_bytes=max_bytes)
+            _open_caches[path] = cache
+        else:
+            cache.ttl_seconds = ttl_seconds
+            cache.max_bytes = max_bytes
+        return cache
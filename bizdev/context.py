@@ -0,0 +1,157 @@
+# --- プロンプトのトークン予算管理とコンテキスト圧縮 ---
+# ステップ5のように多数の分析結果を1つのプロンプトへ連結すると、入力が際限なく大きくなり
+# 遅延とコストが増える。セクションごとにトークン数を数えて予算を配分し、予算を超える
+# セクションだけを要約して差し替える。要約は応答キャッシュを通るので、同じ内容なら再利用される。
+from concurrent.futures import ThreadPoolExecutor
+
+
+_default_counter = None
+
+
+def default_counter():
+    """プロセス内で共有する TokenCounter (エンコーディングの読み込みは1回だけ行う)。"""
+    global _default_counter
+    if _default_counter is None:
+        _default_counter = TokenCounter()
+    return _default_counter
+
+
+class TokenCounter:
+    """tiktoken でトークン数を数える。使えない環境では文字数からの概算にする。"""
+
+    def __init__(self, encoding_name="cl100k_base"):
+        try:
+            import tiktoken
+
+            self._encoding = tiktoken.get_encoding(encoding_name)
+        except Exception:
+            self._encoding = None  # 未インストール、またはエンコーディングを取得できない場合
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        # 概算: 日本語は概ね1文字1トークン、英数字は4文字1トークン程度
+        ascii_chars = sum(1 for c in text if ord(c) < 128)
+        return (len(text) - ascii_chars) + ascii_chars // 4 + 1
+
+    def truncate(self, text, max_tokens):
+        """先頭から max_tokens トークン分だけ残す。"""
+        if self.count(text) <= max_tokens:
+            return text
+        if self._encoding is not None:
+            return self._encoding.decode(self._encoding.encode(text)[:max_tokens])
+        ratio = max_tokens / max(1, self.count(text))
+        return text[:int(len(text) * ratio)]
+
+
+def allocate_budget(token_counts, budget, min_tokens=0):
+    """各セクションへのトークン配分を決める (水位合わせ方式)。
+
+    予算の均等割りより小さいセクションはそのまま全量を割り当て、余った予算を
+    大きいセクションで均等に分ける。戻り値は token_counts と同じ並びの配分リスト。
+    配分の合計は budget を超えない (全セクションに min_tokens を配れない場合は、最低配分を均等割りまで下げる)。
+    """
+    if token_counts and len(token_counts) * min_tokens > budget:
+        min_tokens = budget // len(token_counts)
+    allocation = [0] * len(token_counts)
+    remaining = budget
+    unresolved = sorted(range(len(token_counts)), key=lambda i: token_counts[i])
+    while unresolved:
+        share = max(min_tokens, remaining // len(unresolved))
+        index = unresolved[0]
+        if token_counts[index] <= share:
+            allocation[index] = token_counts[index]
+            remaining -= token_counts[index]
+            unresolved.pop(0)
+        else:
+            # 残りは全て均等割りより大きいので、同じ配分で打ち切る
+            for index in unresolved:
+                allocation[index] = share
+            break
+    return allocation
+
+
+SUMMARY_PROMPT = """以下は事業化検討資料の「{name}」セクションです。
+ピッチ資料の作成に使うため、重要な事実・数値・固有名詞・結論を残したまま、日本語でおよそ{chars}文字以内に要約してください。
+見出しや前置きは付けず、箇条書きで出力してください。
+
+# {name}:
+{text}
+"""
+
+
+class ContextAssembler:
+    """セクションごとのトークン予算に収まるよう、大きいセクションを要約してプロンプト用テキストを組み立てる。
+
+    model: 要約に使うモデル (応答キャッシュ付きのもの)
+    budget_tokens: 全セクション合計のトークン予算 (指示文などの固定部分は含まない)
+    summary_store: SummaryStore。digest_names のセクションは、ステップ出力の要約が予算に収まればそれを使う
+    digest_names: ステップ出力の要約と同じ名前のセクション (bizdev.analyses の DIGEST_NAMES)
+    """
+
+    def __init__(self, model, budget_tokens, counter=None, min_section_tokens=150, max_workers=4, summary_store=None,
+                 digest_names=()):
+        self.model = model
+        self.summary_store = summary_store
+        self.digest_names = set(digest_names)
+        self.budget_tokens = budget_tokens
+        self.counter = counter or default_counter()
+        self.min_section_tokens = min_section_tokens
+        self.max_workers = max_workers
+
+    def _compact(self, name, text, max_tokens):
+        if self.summary_store is not None and name in self.digest_names:
+            # 作成中なら待つ (タイミングで要約を使うかどうかが変わらないように)
+            digest = self.summary_store.digest(self.model, name, text)
+            if digest and self.counter.count(digest) <= max_tokens:
+                return digest
+        chars_per_token = len(text) / max(1, self.counter.count(text))
+        prompt = SUMMARY_PROMPT.format(name=name, chars=int(max_tokens * chars_per_token * 0.9), text=text)
+        try:
+            summary = self.model.generate_content(prompt).text.strip()
+        except Exception:
+            summary = text  # 要約に失敗した場合は切り詰めだけ行う
+        # 要約が指定より長く返ってきても予算は超えないようにする
+        return self.counter.truncate(summary, max_tokens)
+
+    def assemble(self, sections):
+        """sections: (セクション名, テキスト) のリスト。
+
+        戻り値: ({セクション名: プロンプトに入れるテキスト}, レポート)。
+        レポートはセクションごとの {"セクション", "元のトークン数", "使用トークン数", "要約"} のリスト。
+        """
+        names = [name for name, _text in sections]
+        texts = [text or "" for _name, text in sections]
+        counts = [self.counter.count(text) for text in texts]
+        allocation = allocate_budget(counts, self.budget_tokens, self.min_section_tokens)
+
+        assembled = dict(zip(names, texts))
+        over_budget = [i for i, count in enumerate(counts) if count > allocation[i]]
+        if over_budget:
+            from bizdev.metrics import current_step, step_scope # metrics がこのモジュールを import するので遅延させる
+
+            step = current_step()
+
+            def compact(i):
+                # 要約も呼び出し元のステップの呼び出しとして記録・再生する
+                with step_scope(step):
+                    return self._compact(names[i], texts[i], allocation[i])
+
+            # 予算超過のセクションは並列に要約する
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {i: pool.submit(compact, i) for i in over_budget}
+                for i, future in futures.items():
+                    assembled[names[i]] = future.result()
+
+        report = [
+            {
+                "セクション": name,
+                "元のトークン数": counts[i],
+                "使用トークン数": self.counter.count(assembled[name]),
+                "要約": i in over_budget,
+            }
+            for i, name in enumerate(names)
+        ]
+        return assembled, report
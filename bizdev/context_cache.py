@@ -0,0 +1,159 @@
+# --- 共通の前提情報 (プリアンブル) のコンテキストキャッシュ ---
+# ステップ3以降の分析は、どれも同じ前提情報 (技術概要・ターゲット・Lean Canvas) をプロンプトの先頭に含む
+# (bizdev.analyses.project_preamble)。Gemini のコンテキストキャッシュ (CachedContent) に前提情報を1回だけ登録すると、
+# 以降の呼び出しでは個別の指示だけを送ればよく、入力トークンの課金と最初の応答までの時間を減らせる。
+#
+# CONTEXT_CACHE の設定:
+#   "off"    キャッシュを使わず、前提情報をプロンプトの先頭に付けて送る (既定)。
+#            先頭が毎回同じになるので、モデル側の暗黙のキャッシュが効く場合もある
+#   "gemini" Gemini の CachedContent に登録する。前提情報のトークン数がモデルの最小値
+#            (CONTEXT_CACHE_MIN_TOKENS) に満たない、または登録に失敗した場合は "off" と同じ動作になる
+#   "local"  APIを使わない代替。登録・再利用の回数と送らずに済んだトークン数を数えるだけで、
+#            実際には前提情報を付けて送る (オフラインでの確認・テスト用)
+import datetime
+import threading
+import time
+
+from bizdev.cache import make_key
+from bizdev.context import default_counter
+from bizdev.resources import registry
+
+
+class PrefixedModel:
+    """前提情報をプロンプトの先頭に付けて送るモデルのラッパー (コンテキストキャッシュを使わない場合)。"""
+
+    def __init__(self, model, preamble):
+        self.model = model
+        self.preamble = preamble
+
+    def generate_content(self, prompt, **kwargs):
+        return self.model.generate_content(self.preamble + "\n" + prompt, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class _CacheEntry:
+    def __init__(self, model, expires_at):
+        self.model = model
+        self.expires_at = expires_at
+
+
+class GeminiContextCache:
+    """前提情報ごとに Gemini の CachedContent を1つ作り、それを参照するモデルを返す。
+
+    CachedContent はバージョン付きのモデル名 (例: models/gemini-1.5-flash-001) でしか作れず、
+    モデルごとに最小トークン数がある (gemini-1.5 系は 32,768)。
+    作成したキャッシュは ttl_seconds で期限切れになるので、少し前に作り直す。
+    """
+
+    def __init__(self, api_key, model_name="models/gemini-1.5-flash-001", ttl_seconds=3600, min_tokens=32768,
+                 generation_options=None, llm_cache=None, price_per_mtok=(0.075, 0.30)):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.generation_options = generation_options or {}
+        self.llm_cache = llm_cache
+        self.price_per_mtok = price_per_mtok
+        self.created = 0  # 作成した CachedContent の数
+        self.hits = 0  # 作成済みのキャッシュを再利用した回数
+        self.skipped = 0  # トークン数が足りず、キャッシュを使わなかった回数
+        self.last_error = None
+        self._entries = {}  # 前提情報のハッシュ -> _CacheEntry (キャッシュを使わない場合は model が None)
+        self._lock = threading.Lock()
+
+    def model_for(self, preamble):
+        """preamble を登録済みのモデルを返す。キャッシュを使えない場合は None。"""
+        key = make_key("preamble", self.model_name, preamble)
+        with self._lock:
+            # 同じ前提情報のキャッシュを並列に作らないよう、作成中もロックを持つ
+            entry = self._entries.get(key)
+            if entry is not None and time.time() < entry.expires_at:
+                if entry.model is None:
+                    self.skipped += 1
+                else:
+                    self.hits += 1
+                return entry.model
+            try:
+                model = self._create(preamble, key)
+            except Exception as e:
+                # 作成に失敗したら、しばらくは作り直さずに前提情報を付けて送る
+                self.last_error = repr(e)
+                model = None
+            if model is None:
+                self.skipped += 1
+            # 期限の1分前には作り直す (期限切れのキャッシュを参照するとエラーになる)
+            self._entries[key] = _CacheEntry(model, time.time() + max(self.ttl_seconds - 60, 0))
+            return model
+
+    def _create(self, preamble, key):
+        import google.generativeai as genai
+        from google.generativeai import caching
+        from bizdev.gemini import CachedModel
+        from bizdev.generation import GenerationClient
+        from bizdev.metrics import InstrumentedModel
+
+        genai.configure(api_key=self.api_key)
+        if genai.GenerativeModel(self.model_name).count_tokens(preamble).total_tokens < self.min_tokens:
+            return None
+        cached_content = caching.CachedContent.create(model=self.model_name, display_name=f"bizdev-{key[:16]}",
+                                                      contents=[preamble], ttl=datetime.timedelta(seconds=self.ttl_seconds))
+        self.created += 1
+        model = GenerationClient(genai.GenerativeModel.from_cached_content(cached_content), **self.generation_options)
+        if self.llm_cache is not None:
+            # 応答キャッシュのキーに前提情報を含める (個別の指示だけでは別の前提情報の応答と区別できない)
+            model = CachedModel(model, self.llm_cache, namespace=key)
+        # キャッシュ済みの前提情報の料金は通常の入力より安いが、計測では通常の料金で概算する
+        return InstrumentedModel(model, price_per_mtok=self.price_per_mtok)
+
+    def stats(self):
+        return {"created": self.created, "hits": self.hits, "skipped": self.skipped, "last_error": self.last_error}
+
+
+class LocalContextCache:
+    """Gemini のコンテキストキャッシュのオフライン用の代替。
+
+    前提情報の登録と再利用を記録し、キャッシュがあれば送らずに済んだトークン数を数える。
+    返すモデルは前提情報を付けて model に送る。
+    """
+
+    def __init__(self, model, counter=None):
+        self.model = model
+        self.counter = counter or default_counter()
+        self.created = 0
+        self.hits = 0
+        self.tokens_saved = 0
+        self._tokens = {}  # 前提情報のハッシュ -> トークン数
+        self._lock = threading.Lock()
+
+    def model_for(self, preamble):
+        key = make_key("preamble", preamble)
+        with self._lock:
+            if key in self._tokens:
+                self.hits += 1
+                self.tokens_saved += self._tokens[key]
+            else:
+                self.created += 1
+                self._tokens[key] = self.counter.count(preamble)
+        return PrefixedModel(self.model, preamble)
+
+    def stats(self):
+        return {"created": self.created, "hits": self.hits, "tokens_saved": self.tokens_saved}
+
+
+def get_context_cache(mode, api_key=None, model=None, model_name="models/gemini-1.5-flash-001", ttl_seconds=3600,
+                      min_tokens=32768, generation_options=None, llm_cache=None, price_per_mtok=(0.075, 0.30)):
+    """CONTEXT_CACHE の設定 mode に応じたコンテキストキャッシュを返す ("off" なら None)。
+
+    キャッシュはプロセス内で共有する (同じ前提情報は全セッションで1つのキャッシュを使う)。
+    """
+    if mode == "gemini":
+        return registry.get(("context_cache", api_key, model_name),
+                            lambda: GeminiContextCache(api_key, model_name=model_name, ttl_seconds=ttl_seconds,
+                                                       min_tokens=min_tokens, generation_options=generation_options,
+                                                       llm_cache=llm_cache, price_per_mtok=price_per_mtok))
+    if mode == "local":
+        # 登録・再利用の回数を再実行をまたいで数えるため、これもプロセス内で共有する
+        return registry.get(("context_cache", "local", api_key), lambda: LocalContextCache(model))
+    return None
@@ -0,0 +1,105 @@
+# --- ステップ出力の要約(ダイジェスト)ストア ---
+# SWOT・競合分析・Lean Canvas などの出力は、後続ステップのプロンプトへ何度も全文で埋め込まれる。
+# 出力が作られた時点でバックグラウンドで短い要約を1回だけ作っておき、後続のプロンプトでは
+# 要約を使う (間に合っていなければ出来上がるのを待つ)。要約は本文のハッシュをキーに保存するので、
+# 本文(またはユーザーの編集)が変わった時だけ作り直される。
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+
+from bizdev.cache import make_key, open_cache
+from bizdev.metrics import step_scope
+from bizdev.resources import registry
+
+DIGEST_PROMPT = """以下は事業化検討の「{name}」の結果です。後続の分析で参照するための要約を作成してください。
+重要な事実・数値・固有名詞・結論は必ず残し、日本語でおよそ{max_chars}文字以内の箇条書きにしてください。
+見出しや前置きは不要です。
+
+# {name}:
+{text}
+"""
+
+
+class SummaryStore:
+    """本文のハッシュをキーに要約を保存する。
+
+    min_chars より短い本文は要約せずにそのまま使う (要約しても短くならないため)。
+    要約の内容はモデルと名前で変わるので、どちらもキーに含める (バックエンドをまたいで使い回さない)。
+    """
+
+    def __init__(self, cache, max_chars=600, min_chars=1200, max_workers=2):
+        self.cache = cache
+        self.max_chars = max_chars
+        self.min_chars = min_chars
+        self._pending = {}  # key -> Future (作成中の要約)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="digest")
+
+    def _key(self, model, name, text):
+        return make_key("digest", getattr(model, "model_name", ""), name, text, self.max_chars)
+
+    def needs_digest(self, text):
+        return bool(text) and len(text) >= self.min_chars
+
+    def _start(self, key):
+        # 作成中の Future と、呼び出し側で作成する必要があるか。ロックを持って呼ぶ
+        future = self._pending.get(key)
+        if future is not None:
+            return future, False
+        future = self._pending[key] = Future()
+        return future, True
+
+    def submit(self, model, name, text):
+        """要約がまだ無ければバックグラウンドで作成を開始する。すぐに戻る。"""
+        if not self.needs_digest(text):
+            return
+        key = self._key(model, name, text)
+        with self._lock:
+            if self.cache.get(key) is not None:
+                return
+            future, owner = self._start(key)
+        if owner:
+            self._pool.submit(self._create, model, name, text, key, future)
+
+    def _create(self, model, name, text, key, future):
+        try:
+            with step_scope("digest"):
+                digest = model.generate_content(DIGEST_PROMPT.format(name=name, max_chars=self.max_chars, text=text)).text.strip()
+            if digest:
+                self.cache.set(key, digest)
+            future.set_result(digest or None)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def digest(self, model, name, text):
+        """本文の要約を返す。まだ無ければ作成を待つ (作成中ならその完了を、未着手ならこのスレッドで作る)。
+
+        要約が不要な短い本文や、作成に失敗した場合は None。
+        作成のタイミングによって要約と本文のどちらを使うかが変わらないよう、プロンプトへ埋め込む側はこれを使う。
+        """
+        if not self.needs_digest(text):
+            return None
+        key = self._key(model, name, text)
+        digest = self.cache.get(key)
+        if digest is not None:
+            return digest
+        with self._lock:
+            future, owner = self._start(key)
+        if owner:
+            self._create(model, name, text, key, future)
+        try:
+            return future.result()
+        except Exception:
+            return None
+
+
+def get_summary_store():
+    """プロセス内で共有する SummaryStore を返す。要約は30日間ディスクに保存する。"""
+    return registry.get(("digests",), lambda: SummaryStore(open_cache("digests", ttl_seconds=30 * 24 * 3600)))
+
+
+def lean_canvas_text(blocks):
+    """Lean Canvas のブロック辞書をプロンプト用テキストにする (ステップ3の4P分析と同じ形式)。"""
+    return "\n".join([f"### {k}\n{v}" for k, v in blocks.items()])
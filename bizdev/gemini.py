@@ -0,0 +1,95 @@
+# --- Gemini呼び出しのラッパー ---
+# GenerativeModel と同じ generate_content(...) を持ち、応答をキャッシュから返せるようにする。
+from bizdev.cache import make_key
+
+
+class CachedResponse:
+    """キャッシュから返す応答。GenerativeModelの応答と同じく .text で本文を取得できる。"""
+
+    def __init__(self, text, from_cache=False):
+        self.text = text
+        self.from_cache = from_cache
+
+
+class CachingStream:
+    """ストリーミング応答をそのまま流しつつ、最後まで受信できたら全文をキャッシュに保存する。"""
+
+    def __init__(self, chunks, on_complete):
+        self.chunks = chunks
+        self.on_complete = on_complete
+
+    def __iter__(self):
+        texts = []
+        for chunk in self.chunks:
+            texts.append(_chunk_text(chunk))
+            yield chunk
+        if any(texts):
+            self.on_complete("".join(texts))
+
+
+def _chunk_text(chunk):
+    # 本文を含まないチャンク (終了理由のみ等) は .text が ValueError になるので空文字扱い
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+def stream_text(model, prompt, **kwargs):
+    """generate_content(..., stream=True) の本文を順に返すジェネレータ。st.write_stream にそのまま渡せる。"""
+    received = False
+    for chunk in model.generate_content(prompt, stream=True, **kwargs):
+        text = _chunk_text(chunk)
+        if text:
+            received = True
+            yield text
+    if not received:
+        raise ValueError("Geminiから本文が返されませんでした。")
+
+
+def _config_for_key(generation_config):
+    # GenerationConfig オブジェクトでも dict でも同じキーになるように正規化
+    if generation_config is None:
+        return None
+    if isinstance(generation_config, dict):
+        return generation_config
+    return {k: v for k, v in vars(generation_config).items() if v is not None}
+
+
+class CachedModel:
+    """(モデル名, プロンプト, 生成設定) のハッシュをキーに応答をキャッシュする GenerativeModel ラッパー。
+
+    namespace: プロンプト以外に応答を左右するもの (コンテキストキャッシュの前提情報など) の識別子。キーに含める
+    """
+
+    def __init__(self, model, cache, namespace=""):
+        self.model = model
+        self.cache = cache
+        self.namespace = namespace
+        self.model_name = getattr(model, "model_name", "")
+
+    def cache_key(self, prompt, generation_config=None):
+        if self.namespace:
+            return make_key(self.model_name, self.namespace, prompt, _config_for_key(generation_config))
+        return make_key(self.model_name, prompt, _config_for_key(generation_config))
+
+    def generate_content(self, prompt, generation_config=None, **kwargs):
+        key = self.cache_key(prompt, generation_config)
+        cached_text = self.cache.get(key)
+        if cached_text is not None:
+            response = CachedResponse(cached_text, from_cache=True)
+            # ストリーミング指定時は、キャッシュ済みの全文を1チャンクとして返す
+            return [response] if kwargs.get("stream") else response
+
+        if kwargs.get("stream"):
+            chunks = self.model.generate_content(prompt, generation_config=generation_config, **kwargs)
+            return CachingStream(chunks, lambda text: self.cache.set(key, text))
+
+        response = self.model.generate_content(prompt, generation_config=generation_config, **kwargs)
+        text = response.text  # ブロックされた応答などはここで例外になり、キャッシュされない
+        self.cache.set(key, text)
+        return CachedResponse(text)
+
+    def __getattr__(self, name):
+        # count_tokens など、その他の属性は元のモデルへ委譲
+        return getattr(self.model, name)
@@ -0,0 +1,193 @@
+# --- 生成呼び出しの共通クライアント (リトライ・期限・ヘッジ) ---
+# 一時的な 429 / 503 などで分析全体を失わないよう、全ての generate_content 呼び出しを
+# ジッター付き指数バックオフで再試行する。遅延が過去の p95 を超えた呼び出しには、
+# 任意で同じリクエストをもう1本投げ (ヘッジ)、先に返ってきた方を使う。
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from google.api_core import exceptions as api_exceptions
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, stop_after_delay, wait_random_exponential
+
+from bizdev.metrics import current_step, note_retry, step_scope
+from bizdev.ratelimit import PRIORITY_NORMAL
+
+# 再試行すれば成功する見込みのあるエラー
+# (レート制限の待ちの期限切れ bizdev.ratelimit.RateLimitTimeout は含めない。再試行するとまた待ち行列に並ぶ)
+RETRYABLE_ERRORS = (
+    api_exceptions.TooManyRequests,  # 429
+    api_exceptions.ResourceExhausted,  # 429 (gRPC)
+    api_exceptions.ServiceUnavailable,  # 503
+    api_exceptions.InternalServerError,  # 500
+    api_exceptions.DeadlineExceeded,  # 504
+    ConnectionError,
+    TimeoutError,
+)
+
+
+def is_retryable(error):
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+class GenerationClient:
+    """GenerativeModel をラップし、generate_content にリトライ・呼び出し期限・ヘッジを付ける。
+
+    max_attempts: 1回の呼び出しあたりの最大試行回数
+    call_timeout: 1試行あたりの期限(秒)。request_options の timeout として渡す
+    total_deadline: 再試行を含めた全体の期限(秒)。これを過ぎたら再試行しない
+    hedge: True なら、過去の遅延の hedge_percentile を超えた時点で同じリクエストを追加で投げる
+    hedge_workers: 同時に投げられるヘッジの数。全部使用中の時はヘッジせずに本命を待つ
+    limiter: RateLimiter。各試行(ヘッジの追加分を含む)の前にトークンを取得する
+    """
+
+    def __init__(self, model, max_attempts=4, call_timeout=90, total_deadline=180, initial_wait=1, max_wait=20,
+                 hedge=False, hedge_percentile=0.95, hedge_min_samples=20, hedge_workers=8, limiter=None):
+        self.model = model
+        self.limiter = limiter
+        self.model_name = getattr(model, "model_name", "")
+        self.max_attempts = max_attempts
+        self.call_timeout = call_timeout
+        self.total_deadline = total_deadline
+        self.initial_wait = initial_wait
+        self.max_wait = max_wait
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.retries = 0  # 再試行した回数 (プロセス内の累計)
+        self.hedged = 0  # ヘッジのために追加で投げた回数
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self._hedge_pool = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="gemini-hedge") if hedge else None
+        self._hedge_slots = threading.BoundedSemaphore(hedge_workers)  # 実行中のヘッジの数 (プールの空き)
+
+    def _retrying(self):
+        return Retrying(
+            stop=stop_after_attempt(self.max_attempts) | stop_after_delay(self.total_deadline),
+            wait=wait_random_exponential(multiplier=self.initial_wait, max=self.max_wait),
+            retry=retry_if_exception(is_retryable),
+            before_sleep=self._count_retry,
+            reraise=True,
+        )
+
+    def _count_retry(self, _retry_state):
+        note_retry() # 呼び出しごとの計測 (bizdev.metrics)
+        with self._lock:
+            self.retries += 1
+
+    def _request_kwargs(self, kwargs):
+        # 呼び出し側が request_options を指定していなければ、1試行あたりの期限を設定する
+        kwargs = dict(kwargs)
+        if self.call_timeout and "request_options" not in kwargs:
+            kwargs["request_options"] = {"timeout": self.call_timeout}
+        return kwargs
+
+    def hedge_threshold(self):
+        """ヘッジを開始する待ち時間(秒)。サンプル不足の間は None。"""
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile))]
+
+    def _acquire(self, priority):
+        if self.limiter is not None:
+            self.limiter.acquire(priority=priority, timeout=self.total_deadline)
+
+    def _call_once(self, prompt, kwargs, priority):
+        self._acquire(priority)
+        started = time.monotonic()
+        threshold = self.hedge_threshold() if self.hedge and self._hedge_pool is not None else None
+        if threshold is None:
+            response = self.model.generate_content(prompt, **kwargs)
+        else:
+            response = self._call_hedged(prompt, kwargs, threshold, priority)
+        with self._lock:
+            self._latencies.append(time.monotonic() - started)
+        return response
+
+    def _call_hedged(self, prompt, kwargs, threshold, priority):
+        # 本命はプールを通さずにすぐ始める (プールの待ち行列の時間が遅延に乗らないように)。
+        # 呼び出し元のスレッドは、ヘッジした時にどちらか早い方を受け取れるよう待つだけにする
+        primary = Future()
+        step = current_step()
+        threading.Thread(target=self._fulfil, args=(primary, step, prompt, kwargs), daemon=True, name="gemini-primary").start()
+        done, _ = wait([primary], timeout=threshold)
+        if done:
+            return primary.result()
+
+        # p95 を超えても返ってこないので、同じリクエストをもう1本投げて早い方を使う。
+        # プールに空きが無ければ (他の呼び出しのヘッジで埋まっていれば) 待ち行列に入れず、ヘッジしない
+        backup = self._submit_backup(step, prompt, kwargs, priority)
+        if backup is None:
+            return primary.result()
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    error = e  # もう片方が成功する可能性があるので待つ
+        raise error
+
+    def _generate_in_step(self, step, prompt, kwargs):
+        # 別のスレッドでも呼び出し元のステップの呼び出しとして扱う (録画・再生の照合と計測が step を使う)
+        with step_scope(step):
+            return self.model.generate_content(prompt, **kwargs)
+
+    def _fulfil(self, future, step, prompt, kwargs):
+        try:
+            future.set_result(self._generate_in_step(step, prompt, kwargs))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _submit_backup(self, step, prompt, kwargs, priority):
+        pool = self._hedge_pool
+        if pool is None or not self._hedge_slots.acquire(blocking=False):
+            return None
+        try:
+            self._acquire(priority)
+            backup = pool.submit(self._generate_in_step, step, prompt, kwargs)
+        except Exception:
+            # レート制限の待ちが期限切れ、またはレジストリで作り直されてプールが止まった
+            self._hedge_slots.release()
+            return None
+        backup.add_done_callback(lambda _: self._hedge_slots.release())
+        with self._lock:
+            self.hedged += 1
+        return backup
+
+    def generate_content(self, prompt, stream=False, priority=PRIORITY_NORMAL, **kwargs):
+        kwargs = self._request_kwargs(kwargs)
+        if stream:
+            return self._open_stream(prompt, kwargs, priority)
+        return self._retrying()(self._call_once, prompt, kwargs, priority)
+
+    def _open_stream(self, prompt, kwargs, priority):
+        # ストリーミングは最初のチャンクを受け取るまでを再試行の対象にする
+        # (途中まで表示した後のエラーはそのまま呼び出し元へ返す)
+        def first_chunk():
+            self._acquire(priority)
+            chunks = iter(self.model.generate_content(prompt, stream=True, **kwargs))
+            return chunks, next(chunks, None)
+
+        chunks, first = self._retrying()(first_chunk)
+
+        def stream():
+            if first is not None:
+                yield first
+            yield from chunks
+
+        return stream()
+
+    def close(self):
+        """ヘッジ用のスレッドプールを止める (レジストリで作り直されて使われなくなった時)。実行中の呼び出しはそのまま終わる。"""
+        pool, self._hedge_pool = self._hedge_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def __getattr__(self, name):
+        # count_tokens など、その他の属性は元のモデルへ委譲
+        return getattr(self.model, name)
@@ -0,0 +1,165 @@
+# --- バックグラウンドのジョブ実行 ---
+# 生成処理をスクリプトスレッドで実行すると、ウィジェット操作や st.rerun() による再実行で
+# 中断されたり、最初からやり直しになったりする。ジョブはプロセス共通のスレッドプールで実行し、
+# 状態と結果はスクリプトの実行とは別にここで保持する。画面側はジョブIDで結果を取りに来る。
+# 複数のレプリカで動かす場合は、run_once() で同じ処理を全レプリカで1回だけ実行し、結果を共有する。
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import json
+import threading
+import time
+import uuid
+
+from bizdev.resources import registry
+from bizdev.shared import get_shared_store
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_local = threading.local()
+
+
+class Job:
+    """1件のジョブの状態。progress は実行中の途中経過 (ストリーミング中の文章など)。"""
+
+    def __init__(self, job_id, owner, name):
+        self.id = job_id
+        self.owner = owner
+        self.name = name
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.progress = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def done(self):
+        return self.status in (DONE, FAILED)
+
+
+class JobRunner:
+    """ジョブを受け付けてスレッドプールで実行し、ジョブIDで状態を引けるようにする。
+
+    結果を取りに来ないまま keep_seconds 秒以上たった完了済みジョブは捨てる
+    (セッションが閉じられた場合など)。
+    """
+
+    def __init__(self, max_workers=16, keep_seconds=3600):
+        self.keep_seconds = keep_seconds
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+
+    def submit(self, owner, name, fn, *args):
+        """fn(*args) をバックグラウンドで実行し、ジョブIDを返す。すぐに戻る。"""
+        with self._lock:
+            self._expire()
+            job = Job(f"job-{next(self._ids)}", owner, name)
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, fn, args)
+        return job.id
+
+    def _run(self, job, fn, args):
+        _local.job = job
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = fn(*args)
+            job.status = DONE
+        except Exception as e:
+            job.error = e
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            _local.job = None
+
+    def _expire(self):
+        cutoff = time.time() - self.keep_seconds
+        for job_id in [j.id for j in self._jobs.values() if j.done() and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """ジョブを返す。捨てられたジョブや、プロセスの再起動前のジョブIDなら None。"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def discard(self, job_id):
+        """結果を受け取ったジョブを破棄する。"""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def jobs_for(self, owner):
+        with self._lock:
+            return [job for job in self._jobs.values() if job.owner == owner]
+
+    def stats(self):
+        """管理表示用: 状態ごとのジョブ数。"""
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+
+def report_progress(value):
+    """実行中のジョブの途中経過を更新する。ジョブの外から呼ばれた場合は何もしない。"""
+    job = getattr(_local, "job", None)
+    if job is not None:
+        job.progress = value
+
+
+def current_owner():
+    """実行中のジョブの持ち主 (ジョブの外から呼ばれた場合は None)。"""
+    job = getattr(_local, "job", None)
+    return job.owner if job is not None else None
+
+
+def run_once(key, fn, *args, lease_seconds=600, keep_seconds=3600, poll_interval=0.5, wait_seconds=300):
+    """fn(*args) を、共有ストアを使う全レプリカで key ごとに1回だけ実行して結果を返す。
+
+    他のレプリカ (または同じプロセスの別のジョブ) が同じ key を実行中なら、その結果を待って返す。
+    実行していたレプリカが落ちた場合は、lease_seconds 後に引き継いで実行する。
+    wait_seconds 待っても結果が出なければ、待つのをやめて自分でも実行する (ロックは取らない)。
+    結果は JSON にして keep_seconds 秒保存する (JSON にできない結果と失敗は保存しない)。
+    共有ストアを設定していなければ fn(*args) を呼ぶだけ。
+    """
+    store = get_shared_store()
+    if store is None:
+        return fn(*args)
+    result_key, lock_key = f"bizdev:job:result:{key}", f"bizdev:job:lock:{key}"
+    token = uuid.uuid4().hex
+    deadline = time.time() + wait_seconds
+    while True:
+        stored = store.get(result_key)
+        if stored is not None:
+            return json.loads(stored)
+        if store.set(lock_key, token, nx=True, ex=lease_seconds):
+            break
+        if time.time() >= deadline:
+            # 実行中のレプリカが遅い・止まっている。利用者を待たせ続けず、ここで実行する
+            return _run_and_store(store, result_key, keep_seconds, fn, *args)
+        time.sleep(poll_interval)
+    try:
+        return _run_and_store(store, result_key, keep_seconds, fn, *args)
+    finally:
+        # 期限切れで他に引き継がれたロックは消さない
+        if store.get(lock_key) == token:
+            store.delete(lock_key)
+
+
+def _run_and_store(store, result_key, keep_seconds, fn, *args):
+    result = fn(*args)
+    try:
+        store.set(result_key, json.dumps(result, ensure_ascii=False), ex=keep_seconds)
+    except (TypeError, ValueError):
+        pass
+    return result
+
+
+def get_job_runner(max_workers=16):
+    """プロセス内で共有するジョブランナーを返す。"""
+    return registry.get(("jobs",), lambda: JobRunner(max_workers=max_workers))
@@ -0,0 +1,19 @@
+# --- 重いSDKの遅延読み込み ---
+# Streamlitはページ操作のたびにスクリプト全体を再実行するため、起動直後に不要なSDKを
+# importしないようにする。実際に属性へアクセスされた時点で初めて factory を呼ぶ。
+
+
+class LazyResource:
+    """最初に属性へアクセスされた時に factory() を呼び、その結果へ処理を委譲するプロキシ。"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._resource = None
+
+    def load(self):
+        if self._resource is None:
+            self._resource = self._factory()
+        return self._resource
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
@@ -0,0 +1,279 @@
+# --- AI・検索呼び出しの計測 ---
+# Gemini と Google検索の呼び出しごとに、どの分析(ステップ)からの呼び出しか・入出力トークン数・
+# 最初の応答までの時間・全体の遅延・キャッシュヒット・再試行回数・概算コストを記録する。
+# 集計はプロセス内で共有し、管理ページ (p50/p95) と Prometheus 形式のエンドポイントから参照する。
+# 呼び出し元のステップは step_scope() で設定する (パイプラインがノードを実行する時に設定している)。
+import contextlib
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bizdev.context import default_counter
+from bizdev.resources import registry
+
+# ヒストグラムのバケット (秒)
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+UNKNOWN_STEP = "(その他)"
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def step_scope(step):
+    """このスレッドでの呼び出しを step の呼び出しとして記録する。"""
+    previous = getattr(_local, "step", None)
+    _local.step = step
+    try:
+        yield
+    finally:
+        _local.step = previous
+
+
+def current_step():
+    return getattr(_local, "step", None) or UNKNOWN_STEP
+
+
+def note_retry():
+    """実行中の呼び出しの再試行を数える (GenerationClient が再試行の前に呼ぶ)。"""
+    record = getattr(_local, "call", None)
+    if record is not None:
+        record.retries += 1
+
+
+class CallRecord:
+    """1回の呼び出しの記録。kind は "gemini" / "search"。"""
+
+    def __init__(self, kind, step):
+        self.kind = kind
+        self.step = step
+        self.started_at = time.time()
+        self.latency = None
+        self.ttft = None  # 最初のチャンクまでの秒数 (ストリーミングでない呼び出しは latency と同じ)
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.cache_hit = False
+        self.retries = 0
+        self.error = None
+        self.cost = 0.0
+
+
+class _Series:
+    """(kind, step) ごとの累計とヒストグラム。"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.ttft_buckets = [0] * len(LATENCY_BUCKETS)
+        self.ttft_sum = 0.0
+        self.ttft_count = 0
+
+
+def _observe(buckets, value):
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if value <= bound:
+            buckets[i] += 1
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class CallMetrics:
+    """呼び出しの記録の集計。パーセンタイルは直近 window 件から求める。"""
+
+    def __init__(self, window=5000):
+        self._series = {}
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        with self._lock:
+            series = self._series.setdefault((record.kind, record.step), _Series())
+            series.calls += 1
+            series.errors += record.error is not None
+            series.cache_hits += record.cache_hit
+            series.retries += record.retries
+            series.prompt_tokens += record.prompt_tokens
+            series.output_tokens += record.output_tokens
+            series.cost += record.cost
+            if record.latency is not None:
+                _observe(series.latency_buckets, record.latency)
+                series.latency_sum += record.latency
+            if record.ttft is not None:
+                _observe(series.ttft_buckets, record.ttft)
+                series.ttft_sum += record.ttft
+                series.ttft_count += 1
+            self._recent.append(record)
+
+    def summary(self):
+        """管理ページ用: (kind, step) ごとの呼び出し数・p50/p95・トークン数・キャッシュヒット率など。"""
+        with self._lock:
+            recent = list(self._recent)
+            series = dict(self._series)
+        rows = []
+        for (kind, step), s in sorted(series.items()):
+            latencies = [r.latency for r in recent if r.kind == kind and r.step == step and r.latency is not None]
+            ttfts = [r.ttft for r in recent if r.kind == kind and r.step == step and r.ttft is not None]
+            rows.append({
+                "種類": kind, "ステップ": step, "呼び出し": s.calls, "エラー": s.errors,
+                "p50遅延(秒)": _percentile(latencies, 0.5), "p95遅延(秒)": _percentile(latencies, 0.95),
+                "p50初回応答(秒)": _percentile(ttfts, 0.5), "p95初回応答(秒)": _percentile(ttfts, 0.95),
+                "入力トークン": s.prompt_tokens, "出力トークン": s.output_tokens,
+                "キャッシュヒット率": s.cache_hits / s.calls if s.calls else None,
+                "再試行": s.retries, "概算コスト(USD)": round(s.cost, 4),
+            })
+        return rows
+
+    def prometheus_text(self):
+        """Prometheus のテキスト形式 (exposition format) の集計。"""
+        with self._lock:
+            series = sorted(self._series.items())
+        lines = []
+
+        def counter(name, help_text, attr):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (kind, step), s in series:
+                lines.append(f'{name}{{kind="{kind}",step="{_escape(step)}"}} {getattr(s, attr)}')
+
+        def histogram(name, help_text, buckets_attr, sum_attr, count_attr):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (kind, step), s in series:
+                labels = f'kind="{kind}",step="{_escape(step)}"'
+                for bound, count in zip(LATENCY_BUCKETS, getattr(s, buckets_attr)):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {getattr(s, count_attr)}')
+                lines.append(f"{name}_sum{{{labels}}} {getattr(s, sum_attr)}")
+                lines.append(f"{name}_count{{{labels}}} {getattr(s, count_attr)}")
+
+        counter("bizdev_calls_total", "Number of Gemini / search calls.", "calls")
+        counter("bizdev_call_errors_total", "Number of failed calls.", "errors")
+        counter("bizdev_cache_hits_total", "Calls answered from the response cache.", "cache_hits")
+        counter("bizdev_retries_total", "Retries of transient errors.", "retries")
+        counter("bizdev_prompt_tokens_total", "Prompt tokens sent.", "prompt_tokens")
+        counter("bizdev_output_tokens_total", "Output tokens received.", "output_tokens")
+        counter("bizdev_cost_usd_total", "Estimated cost in USD.", "cost")
+        histogram("bizdev_call_latency_seconds", "Call latency.", "latency_buckets", "latency_sum", "calls")
+        histogram("bizdev_time_to_first_token_seconds", "Time to the first streamed chunk.",
+                  "ttft_buckets", "ttft_sum", "ttft_count")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = CallMetrics()
+
+
+def _usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None, None
+    return getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None)
+
+
+def _response_text(response):
+    try:
+        return response.text
+    except ValueError:
+        return ""
+
+
+class InstrumentedModel:
+    """generate_content の呼び出しを計測して metrics に記録するラッパー (モデルの一番外側に置く)。
+
+    price_per_mtok: (入力, 出力) 100万トークンあたりの料金 (USD)。キャッシュから返した応答は0
+    """
+
+    def __init__(self, model, price_per_mtok=(0.075, 0.30)):
+        self.model = model
+        self.price_per_mtok = price_per_mtok
+        self.model_name = getattr(model, "model_name", "")
+
+    def generate_content(self, prompt, **kwargs):
+        record = CallRecord("gemini", current_step())
+        started = time.perf_counter()
+        _local.call = record
+        try:
+            response = self.model.generate_content(prompt, **kwargs)
+        except Exception as e:
+            record.error = type(e).__name__
+            record.latency = time.perf_counter() - started
+            metrics.record(record)
+            raise
+        finally:
+            _local.call = None
+        if kwargs.get("stream"):
+            return self._metered_stream(response, record, prompt, started)
+        record.latency = record.ttft = time.perf_counter() - started
+        self._finish(record, prompt, _response_text(response), response)
+        return response
+
+    def _metered_stream(self, chunks, record, prompt, started):
+        texts = []
+        last = None
+        try:
+            for chunk in chunks:
+                if record.ttft is None:
+                    record.ttft = time.perf_counter() - started
+                texts.append(_response_text(chunk))
+                last = chunk
+                yield chunk
+        except Exception as e:
+            record.error = type(e).__name__
+            raise
+        finally:
+            # 途中で読むのをやめた場合も、そこまでの分を記録する
+            record.latency = time.perf_counter() - started
+            self._finish(record, prompt, "".join(texts), last)
+
+    def _finish(self, record, prompt, text, response):
+        record.cache_hit = bool(getattr(response, "from_cache", False))
+        prompt_tokens, output_tokens = _usage(response)
+        counter = default_counter()
+        record.prompt_tokens = prompt_tokens or counter.count(str(prompt))
+        record.output_tokens = output_tokens or counter.count(text)
+        if not record.cache_hit:
+            record.cost = (record.prompt_tokens * self.price_per_mtok[0] + record.output_tokens * self.price_per_mtok[1]) / 1e6
+        metrics.record(record)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # アクセスごとのログは出さない
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """http://<host>:<port>/metrics で Prometheus 形式の集計を返すサーバーを、プロセス内で1回だけ起動する。"""
+    def create():
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        return server
+    return registry.get(("metrics_server", host, port), create)
@@ -0,0 +1,105 @@
+# --- AI応答のパース関数 ---
+# アプリ本体・パイプラインのノード・一括処理から使う。
+# 見出し・箇条書き・スコア行の正規表現はモジュール読み込み時に1回だけコンパイルし、
+# 本文は見出しの位置で区切って1回の走査で読み取る (行ごと・見出しごとの比較を繰り返さない)。
+# 精度と速度は benchmarks/parse_corpus.py で、保存したAI応答のコーパスに対して計測できる。
+import re
+
+# "### 1. 課題 (Problem)" のような番号付き見出し (Lean Canvas)
+_NUMBERED_HEADING = re.compile(r"^[ \t]*###\s*\d+\.[ \t]*(.*?)[ \t]*$", re.MULTILINE)
+# 見出し名から除く "(Problem)" / "（Problem）" などの括弧書き
+_PARENTHESIZED = re.compile(r"\(.*?\)|（.*?）")
+# "**スコア:** 80/100" / "**スコア: 80/100**" / "スコア: 80 / 100"
+_SCORE_LINE = re.compile(r"スコア(?:\*\*)?[:：](?:\*\*)?\s*(\d+)\s*/\s*100")
+# "**根拠:** ..." 以降の全文
+_RATIONALE = re.compile(r"根拠(?:\*\*)?[:：](?:\*\*)?\s*(.*)", re.DOTALL)
+# "* 課題" / "- 課題" / "・課題" / "1. 課題" 形式の箇条書き
+_BULLET = re.compile(r"^[ \t]*(?:[*\-・]|\d+[.)])[ \t]*(.+?)[ \t]*$", re.MULTILINE)
+# "**Moat案1:**" / "**Moat案 1**:"
+_MOAT_HEADING = re.compile(r"\*\*Moat案\s?\d+(?::\*\*|\*\*:)")
+
+# VPCの6ブロック: 表示名 -> プロンプトで指定した見出し形式 "## 見出し名 (英語名)"
+VPC_HEADINGS = {
+    "顧客のジョブ": "顧客のジョブ (Customer Jobs)",
+    "ペイン": "顧客のペイン (Customer Pains)",
+    "ゲイン": "顧客のゲイン (Customer Gains)",
+    "製品・サービス": "製品・サービス (Products & Services)",
+    "ペインリリーバー": "ペインリリーバー (Pain Relievers)",
+    "ゲインクリエイター": "ゲインクリエイター (Gain Creators)",
+}
+_VPC_HEADING = re.compile(r"^[ \t]*## (" + "|".join(re.escape(h) for h in VPC_HEADINGS.values()) + r").*$", re.MULTILINE)
+_VPC_NAMES = {heading: name for name, heading in VPC_HEADINGS.items()}
+
+
+def _sections(pattern, text):
+    """pattern に一致した見出しごとに (見出しの match, 次の見出しまでの本文) を返す。"""
+    matches = list(pattern.finditer(text))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        yield match, text[match.end():end]
+
+
+def parse_lean_canvas_response(text):
+    """Lean Canvas の応答から (スコア文字列, {ブロック名: 本文}) を返す。"""
+    # 1. 品質スコア部分を抽出・分離
+    draft_section, _, score_section = text.partition("## 品質スコア")
+    score = "N/A"
+    rationale = "N/A"
+    if score_section:
+        draft_section = draft_section.strip() # スコアより前がドラフト
+        score_match = _SCORE_LINE.search(score_section)
+        rationale_match = _RATIONALE.search(score_section)
+        score = score_match.group(1) if score_match else "N/A"
+        rationale = rationale_match.group(1).strip() if rationale_match else "N/A"
+    score_text = f"スコア: {score}/100\n根拠: {rationale}"
+
+    # 2. "### X. 見出し名" ごとに区切り、見出し名から括弧書きを除いたものをキーにする
+    parsed_blocks = {}
+    for heading, content_block in _sections(_NUMBERED_HEADING, draft_section):
+        parsed_blocks[_PARENTHESIZED.sub("", heading.group(1)).strip()] = content_block.strip()
+    if not parsed_blocks:
+        # もしブロック抽出がうまくいかなかった場合
+        parsed_blocks["解析エラー"] = draft_section # 解析できなかった部分全体を入れる
+
+    return score_text, parsed_blocks # スコア文字列とブロック辞書を返す
+
+
+def parse_vpc_response(text):
+    """VPCの応答から {ブロック名: 本文} を返す。見つからないブロックは空文字。"""
+    parsed_vpc_blocks = {}
+    if text: # textがNoneや空の場合は全て空文字
+        for heading, content in _sections(_VPC_HEADING, text):
+            name = _VPC_NAMES[heading.group(1)]
+            if content.strip() or name not in parsed_vpc_blocks: # 同じ見出しが重複した場合は本文のある方
+                parsed_vpc_blocks[name] = content.strip()
+    return {name: parsed_vpc_blocks.get(name, "") for name in VPC_HEADINGS}
+
+
+# --- ターゲット案・課題リスト・Moat案の抽出 ---
+def parse_target_options(text):
+    """「**ターゲット案X: ...**」で始まる行 (タイトル行全体) を抽出する。"""
+    # 行頭の比較だけで済むので正規表現は使わない (この方が速い)
+    return [line.strip() for line in text.splitlines() if line.lstrip().startswith("**ターゲット案")]
+
+
+def parse_problem_lines(text):
+    """課題リストの応答から課題を1行ずつ取り出す (箇条書きの記号や太字の '*' は除く)。"""
+    problem_lines = [line.strip('* ') for line in _BULLET.findall(text)]
+    problem_lines = [line for line in problem_lines if line.strip('-_ ')] # 区切り線 "---" などは除く
+    if not problem_lines: # 箇条書きでない形式なら、空行以外をそのまま使う
+        problem_lines = [line.strip() for line in text.splitlines() if line.strip()]
+    return problem_lines
+
+
+def split_moat_proposals(text):
+    """Moat提案の応答を "**Moat案X:**" ごとの提案に分割する。"""
+    return [(heading.group(0) + body).strip() for heading, body in _sections(_MOAT_HEADING, text)]
+
+
+# "## SWOT分析結果" / "## 4P分析結果" / "## 3C分析結果" (深掘り分析をまとめて生成した応答)
+_FRAMEWORK_HEADING = re.compile(r"^[ \t]*## (SWOT|4P|3C)分析結果.*$", re.MULTILINE)
+
+
+def split_framework_sections(text):
+    """SWOT・4P・3Cをまとめて生成した応答を {"SWOT": 本文, "4P": ..., "3C": ...} に分割する (本文は見出しを含む)。"""
+    return {heading.group(1): (heading.group(0).strip() + body).strip() for heading, body in _sections(_FRAMEWORK_HEADING, text)}
@@ -0,0 +1,234 @@
+# --- 分析の依存グラフを実行するパイプラインエンジン ---
+# 各分析(ノード)は「読む state のキー」と「書く state のキー」を宣言する。
+# エンジンは宣言から依存関係を求め、独立したノードは同時に実行し、
+# 入力が前回の生成時から変わったノードだけを作り直す。
+# Streamlitの session_state はスクリプトスレッドからのみ触る前提なので、
+# 入力の読み出しと結果の保存は呼び出し元(スクリプトスレッド)で行い、
+# ワーカースレッドには入力のコピーだけを渡す。
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from bizdev.cache import make_key
+from bizdev.jobs import run_once
+from bizdev.metrics import step_scope
+
+# ノードごとに「最後に生成した時の入力のハッシュ」を保存する state のキー
+FINGERPRINTS_KEY = "_pipeline_fingerprints"
+# バックグラウンドで実行中のノード {ノード名: (ジョブID, 入力)}
+JOBS_KEY = "_pipeline_jobs"
+# failure を持たないノードが失敗した時の入力のハッシュ。同じ入力では自動で再実行しない
+FAILED_KEY = "_pipeline_failed"
+
+
+class Node:
+    """1つの分析を表す。
+
+    inputs: 読む state のキーと、キーが無い場合の既定値 ({キー: 既定値})
+    outputs: run が返し、state へ保存されるキー
+    run: (入力の辞書, services) を受け取り {出力キー: 値} を返す関数。ワーカースレッドで呼ばれる
+    failure: 失敗時に保存する {出力キー: 値}。None の場合は何も保存しない (advance() では入力が変わるか再試行されるまで再実行しない)
+    digest_outputs: 後続ステップ用に要約を作っておく出力キー
+    aliases: このノードが代わりに作る他のノードの名前 (複数の分析を1回の呼び出しにまとめたノードなど)
+    """
+
+    def __init__(self, name, inputs, outputs, run, label="", failure=None, digest_outputs=(), aliases=()):
+        self.name = name
+        self.inputs = dict(inputs)
+        self.outputs = tuple(outputs)
+        self.run = run
+        self.label = label or name
+        self.failure = failure
+        self.digest_outputs = tuple(digest_outputs)
+        self.aliases = tuple(aliases)
+
+
+def _run_node(node, inputs, services, job_key):
+    # ノード内のAI・検索の呼び出しを、このノードの呼び出しとして計測する (bizdev.metrics)
+    with step_scope(node.name):
+        # 複数のレプリカで動かす場合、同じ入力・同じ生成方法のノードは1回だけ実行して結果を共有する (bizdev.jobs)
+        return run_once(job_key, node.run, inputs, services)
+
+
+class Pipeline:
+    """ノードの集合。出力キーから、そのキーを作るノードを引けるようにしておく。"""
+
+    def __init__(self, nodes, variant=""):
+        self.variant = variant  # 生成方法の違い (分析をまとめるかなど)。レプリカ間で結果を共有するキーに含める
+        self.nodes = {}
+        self.producers = {}  # 出力キー -> ノード
+        self.aliases = {}  # 別名 -> ノード名
+        for node in nodes:
+            if node.name in self.nodes:
+                raise ValueError(f"ノード名が重複しています: {node.name}")
+            self.nodes[node.name] = node
+            for alias in node.aliases:
+                self.aliases[alias] = node.name
+            for key in node.outputs:
+                if key in self.producers:
+                    raise ValueError(f"出力キー {key} を複数のノードが作っています")
+                self.producers[key] = node
+
+    def __getitem__(self, name):
+        return self.nodes[self.aliases.get(name, name)]
+
+    def resolve(self, names):
+        """別名をノード名に置き換え、重複を除いた names を返す (順序は保つ)。"""
+        resolved = []
+        for name in names:
+            name = self.aliases.get(name, name)
+            if name not in resolved:
+                resolved.append(name)
+        return resolved
+
+    def read_inputs(self, state, node):
+        return {key: state.get(key, default) for key, default in node.inputs.items()}
+
+    def fingerprint(self, node, inputs):
+        return make_key("pipeline", node.name, inputs)
+
+    def job_key(self, node, inputs, services):
+        """レプリカ間で結果を共有するキー。入力が同じでも、バックエンド・生成方法が違えば別の結果とする。"""
+        return make_key(self.fingerprint(node, inputs), services.backend_name, services.structured_output, self.variant)
+
+    def is_stale(self, state, node):
+        """出力が揃っていないか、入力が前回の生成時から変わっていれば True。"""
+        if any(key not in state for key in node.outputs):
+            return True
+        recorded = state.get(FINGERPRINTS_KEY, {}).get(node.name)
+        return recorded != self.fingerprint(node, self.read_inputs(state, node))
+
+    def stale_nodes(self, state, names):
+        return [self.nodes[name] for name in self.resolve(names) if self.is_stale(state, self.nodes[name])]
+
+    def store(self, state, node, outputs, inputs):
+        """ノードの出力を state へ保存し、生成に使った入力のハッシュを記録する。"""
+        for key, value in outputs.items():
+            state[key] = value
+        fingerprints = dict(state.get(FINGERPRINTS_KEY, {}))
+        fingerprints[node.name] = self.fingerprint(node, inputs)
+        state[FINGERPRINTS_KEY] = fingerprints
+
+    def upstream(self, node, among):
+        """among のうち、node が入力として読むキーを作るノード。"""
+        return [self.producers[key] for key in node.inputs if key in self.producers and self.producers[key] in among]
+
+    def blocked_nodes(self, state, failed_marks=None):
+        """failure を持たずに失敗し、入力が変わっていないノード (出力が無いので、これに依存するノードは実行しない)。"""
+        marks = state.get(FAILED_KEY, {}) if failed_marks is None else failed_marks
+        return [node for name, node in self.nodes.items()
+                if name in marks and marks[name] == self.fingerprint(node, self.read_inputs(state, node))]
+
+    def run(self, state, names, services, max_workers=5, on_tick=None, tick_interval=0.5):
+        """names のうち作り直しが必要なノードを、依存関係を守りながら並列に実行する。
+
+        完了したものから順に結果を state へ書き込み、(node, error) を yield する。
+        error は成功時 None。失敗時は node.failure を保存したうえで例外を返す。
+        on_tick: 完了待ちの間 tick_interval 秒ごとにスクリプトスレッドで呼ばれる関数 (待ち行列の表示など)
+        """
+        pending = self.stale_nodes(state, names)
+        running = {}  # future -> (node, inputs)
+        failed = self.blocked_nodes(state)  # 出力を保存せずに失敗したノード (これに依存するノードは実行しない)
+
+        def ready(node):
+            # 今回実行するノードのうち、まだ終わっていないものの出力を読まなければ実行可能
+            unfinished = pending + [n for n, _ in running.values()]
+            return not self.upstream(node, unfinished)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while pending or running:
+                ready_nodes = [n for n in pending if ready(n)]
+                for node in ready_nodes:
+                    pending.remove(node)
+                    broken = self.upstream(node, failed)
+                    if broken:
+                        # 既定値の入力で実行しないよう、失敗として扱う
+                        failed.append(node)
+                        yield node, RuntimeError(f"{broken[0].label}の生成に失敗したため実行できません")
+                        continue
+                    inputs = self.read_inputs(state, node)
+                    running[pool.submit(_run_node, node, inputs, services, self.job_key(node, inputs, services))] = (node, inputs)
+
+                if ready_nodes and not running:
+                    continue  # 実行しなかったノードに依存するノードを見直す
+                if not running:
+                    # 依存関係が循環している場合など。残りは実行できない
+                    raise ValueError(f"依存関係を解決できないノードがあります: {[n.name for n in pending]}")
+
+                done, _ = wait(running, timeout=tick_interval if on_tick else None, return_when=FIRST_COMPLETED)
+                if not done and on_tick:
+                    on_tick()
+                for future in done:
+                    node, inputs = running.pop(future)
+                    try:
+                        self.store(state, node, future.result(), inputs)
+                        yield node, None
+                    except Exception as e:
+                        if node.failure is not None:
+                            self.store(state, node, node.failure, inputs)
+                        else:
+                            failed.append(node)
+                        yield node, e
+
+    def job_id(self, state, name):
+        """name のノードをバックグラウンドで実行中ならジョブIDを返す。"""
+        entry = state.get(JOBS_KEY, {}).get(self.aliases.get(name, name))
+        return entry[0] if entry else None
+
+    def busy(self, state, names):
+        return any(name in state.get(JOBS_KEY, {}) for name in self.resolve(names))
+
+    def invalidate(self, state, name):
+        """name のノードを次回必ず作り直す (再試行ボタンなど)。"""
+        name = self.aliases.get(name, name)
+        for key in (FINGERPRINTS_KEY, FAILED_KEY):
+            marks = dict(state.get(key, {}))
+            marks.pop(name, None)
+            state[key] = marks
+
+    def advance(self, state, names, services, runner, owner):
+        """バックグラウンド実行を1回分進める。スクリプトスレッドから何度でも呼んでよい。
+
+        実行中のジョブのうち終わったものの結果を state へ保存し、names のうち作り直しが必要で
+        依存するノードが終わっているものを runner へ投入する。すぐに戻る。
+        今回結果を保存したノードの [(node, error)] を返す (names 以外のノードも含む)。
+        """
+        jobs = dict(state.get(JOBS_KEY, {}))
+        failed_marks = dict(state.get(FAILED_KEY, {}))
+        finished = []
+        for name, (job_id, inputs) in list(jobs.items()):
+            job = runner.get(job_id)
+            if job is None:
+                # プロセスの再起動などでジョブが失われた。下で投入し直す
+                del jobs[name]
+            elif job.done():
+                del jobs[name]
+                runner.discard(job_id)
+                node = self.nodes[name]
+                if job.error is None:
+                    self.store(state, node, job.result, inputs)
+                    failed_marks.pop(name, None)
+                else:
+                    if node.failure is not None:
+                        self.store(state, node, node.failure, inputs)
+                    else:
+                        failed_marks[name] = self.fingerprint(node, inputs)
+                finished.append((node, job.error))
+
+        def blocked(node):
+            # 同じ入力で失敗したばかりのノードは、入力が変わるか再試行されるまで投入しない
+            return failed_marks.get(node.name) == self.fingerprint(node, self.read_inputs(state, node))
+
+        pending = [node for node in self.stale_nodes(state, names) if node.name not in jobs and not blocked(node)]
+        running = [self.nodes[name] for name in jobs]
+        # 失敗したままのノードに依存するノードは、既定値の入力で実行しないよう投入しない (pending に残るので、その先も投入されない)
+        failed = self.blocked_nodes(state, failed_marks)
+        for node in list(pending):
+            if not self.upstream(node, pending + running + failed):
+                pending.remove(node)
+                inputs = self.read_inputs(state, node)
+                jobs[node.name] = (runner.submit(owner, node.label, _run_node, node, inputs, services,
+                                                 self.job_key(node, inputs, services)), inputs)
+                running.append(node)
+
+        state[JOBS_KEY] = jobs
+        state[FAILED_KEY] = failed_marks
+        return finished
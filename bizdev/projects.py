@@ -0,0 +1,259 @@
+# --- プロジェクトの永続化 (ステップの入力・出力のチェックポイント) ---
+# session_state はメモリ上にしかないので、コンテナの再起動や接続の切断で生成済みの分析がすべて失われる。
+# 各ステップの入力 (技術概要・選んだターゲットなど) と出力 (AIの分析結果) をプロジェクトごとに保存し、
+# プロジェクトIDを指定すれば別のセッションから続きを再開できるようにする。
+# 値はキーごとに版(リビジョン)を付けて追記し、過去のチェックポイント時点の内容も読み出せる。
+# 保存先は ProjectStore のインターフェースを実装すれば差し替えられる (既定はローカルの SQLite。
+# 複数のレプリカで動かす場合は、全レプリカから再開できるよう共有ストアの RedisProjectStore を使う)。
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from bizdev.cache import DEFAULT_CACHE_DIR, make_key
+from bizdev.resources import registry
+from bizdev.shared import get_shared_store, open_shared_store
+
+
+class ProjectStore:
+    """プロジェクトの保存先のインターフェース。値は JSON にできるもの。"""
+
+    def create(self, title=""):
+        """新しいプロジェクトを作り、そのIDを返す。"""
+        raise NotImplementedError
+
+    def get(self, project_id):
+        """プロジェクトの情報 {id, title, step, revision, created_at, updated_at}。無ければ None。"""
+        raise NotImplementedError
+
+    def list_projects(self, limit=20):
+        """最近更新したプロジェクトの情報のリスト。"""
+        raise NotImplementedError
+
+    def save(self, project_id, values, deleted=(), step=None):
+        """values の値と deleted のキーの削除を1つのチェックポイントとして保存し、その版番号を返す。"""
+        raise NotImplementedError
+
+    def load(self, project_id, keys=None, revision=None):
+        """keys (None なら全キー) の値を返す。revision を指定するとその版の時点の値。削除済みのキーは含めない。"""
+        raise NotImplementedError
+
+    def history(self, project_id, key):
+        """key を保存した版の [(版番号, 保存時刻)]。新しい順。"""
+        raise NotImplementedError
+
+
+class SQLiteProjectStore(ProjectStore):
+    """ローカルの SQLite ファイルに保存する ProjectStore。"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # 複数のセッション(スクリプトスレッド)から使うので、ロックで直列化して1接続を共有する
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS projects ("
+            " id TEXT PRIMARY KEY, title TEXT NOT NULL, step REAL, revision INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            " project_id TEXT NOT NULL, key TEXT NOT NULL, revision INTEGER NOT NULL,"
+            " value TEXT, created_at REAL NOT NULL, PRIMARY KEY (project_id, key, revision))"
+        )
+        self._conn.commit()
+
+    def create(self, title=""):
+        project_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT INTO projects VALUES (?, ?, NULL, 0, ?, ?)", (project_id, title, now, now))
+            self._conn.commit()
+        return project_id
+
+    def get(self, project_id):
+        with self._lock:
+            row = self._conn.execute("SELECT id, title, step, revision, created_at, updated_at FROM projects WHERE id = ?",
+                                     (project_id,)).fetchone()
+        return _project_info(row) if row else None
+
+    def list_projects(self, limit=20):
+        with self._lock:
+            rows = self._conn.execute("SELECT id, title, step, revision, created_at, updated_at FROM projects"
+                                      " ORDER BY updated_at DESC LIMIT ?", (limit,)).fetchall()
+        return [_project_info(row) for row in rows]
+
+    def save(self, project_id, values, deleted=(), step=None):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT revision FROM projects WHERE id = ?", (project_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"プロジェクトがありません: {project_id}")
+            revision = row[0] + 1
+            # 削除は値が NULL の版として残す (それより前の版の値は履歴から読める)
+            rows = [(project_id, key, revision, json.dumps(value, ensure_ascii=False), now) for key, value in values.items()]
+            rows += [(project_id, key, revision, None, now) for key in deleted]
+            self._conn.executemany("INSERT INTO artifacts VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.execute("UPDATE projects SET revision = ?, updated_at = ?, step = COALESCE(?, step) WHERE id = ?",
+                               (revision, now, step, project_id))
+            self._conn.commit()
+        return revision
+
+    def load(self, project_id, keys=None, revision=None):
+        # キーごとに、指定した版(無ければ最新)以前で最も新しい版の値
+        query = ("SELECT a.key, a.value FROM artifacts a JOIN ("
+                 " SELECT key, MAX(revision) AS revision FROM artifacts WHERE project_id = ? AND revision <= ? GROUP BY key"
+                 ") latest ON a.key = latest.key AND a.revision = latest.revision WHERE a.project_id = ?")
+        params = [project_id, revision if revision is not None else 2 ** 62, project_id]
+        if keys is not None:
+            keys = list(keys)
+            if not keys:
+                return {}
+            query += f" AND a.key IN ({', '.join('?' * len(keys))})"
+            params += keys
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return {key: json.loads(value) for key, value in rows if value is not None}
+
+    def history(self, project_id, key):
+        with self._lock:
+            return self._conn.execute("SELECT revision, created_at FROM artifacts WHERE project_id = ? AND key = ?"
+                                      " ORDER BY revision DESC", (project_id, key)).fetchall()
+
+
+class RedisProjectStore(ProjectStore):
+    """共有ストア (Redis 互換) に保存する ProjectStore。
+
+    bizdev:project:<ID>            プロジェクトの情報 (ハッシュ)
+    bizdev:project:<ID>:keys       保存したことのあるキー (セット)
+    bizdev:project:<ID>:key:<キー>  版番号 -> {"at": 保存時刻, "value": 値} の JSON (削除の版は value が無い)
+    bizdev:projects                プロジェクトIDを更新時刻順に並べたソート済みセット
+    版番号は HINCRBY で採番するので、複数のレプリカから同時に保存しても重複しない。
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def _key(self, project_id, suffix=""):
+        return f"bizdev:project:{project_id}{suffix}"
+
+    def create(self, title=""):
+        project_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        self.store.hset(self._key(project_id), mapping={"title": title, "step": "", "revision": 0,
+                                                         "created_at": now, "updated_at": now})
+        self.store.zadd("bizdev:projects", {project_id: now})
+        return project_id
+
+    def get(self, project_id):
+        info = self.store.hgetall(self._key(project_id))
+        if not info:
+            return None
+        return {"id": project_id, "title": info["title"], "step": float(info["step"]) if info["step"] else None,
+                "revision": int(info["revision"]), "created_at": float(info["created_at"]),
+                "updated_at": float(info["updated_at"])}
+
+    def list_projects(self, limit=20):
+        projects = [self.get(project_id) for project_id in self.store.zrevrange("bizdev:projects", 0, limit - 1)]
+        return [info for info in projects if info is not None]
+
+    def save(self, project_id, values, deleted=(), step=None):
+        if not self.store.exists(self._key(project_id)):
+            raise KeyError(f"プロジェクトがありません: {project_id}")
+        now = time.time()
+        revision = self.store.hincrby(self._key(project_id), "revision", 1)
+        entries = {key: {"at": now, "value": value} for key, value in values.items()}
+        entries.update({key: {"at": now} for key in deleted})
+        for key, entry in entries.items():
+            self.store.hset(self._key(project_id, f":key:{key}"), revision, json.dumps(entry, ensure_ascii=False))
+        if entries:
+            self.store.sadd(self._key(project_id, ":keys"), *entries)
+        self.store.hset(self._key(project_id), mapping={"updated_at": now, **({"step": step} if step is not None else {})})
+        self.store.zadd("bizdev:projects", {project_id: now})
+        return revision
+
+    def _versions(self, project_id, key):
+        versions = self.store.hgetall(self._key(project_id, f":key:{key}"))
+        return sorted(((int(revision), json.loads(entry)) for revision, entry in versions.items()), reverse=True)
+
+    def load(self, project_id, keys=None, revision=None):
+        keys = self.store.smembers(self._key(project_id, ":keys")) if keys is None else keys
+        values = {}
+        for key in keys:
+            # 指定した版(無ければ最新)以前で最も新しい版の値
+            entry = next((entry for rev, entry in self._versions(project_id, key) if revision is None or rev <= revision), None)
+            if entry is not None and "value" in entry:
+                values[key] = entry["value"]
+        return values
+
+    def history(self, project_id, key):
+        return [(revision, entry["at"]) for revision, entry in self._versions(project_id, key)]
+
+
+def _project_info(row):
+    project_id, title, step, revision, created_at, updated_at = row
+    return {"id": project_id, "title": title, "step": step, "revision": revision,
+            "created_at": created_at, "updated_at": updated_at}
+
+
+def value_hash(value):
+    return make_key("project", value)
+
+
+def checkpoint(store, project_id, state, keys, saved, step=None):
+    """state の keys のうち、前回保存(または読み込み)した時から変わったものだけを保存する。
+
+    saved: {キー: 保存済みの値のハッシュ}。保存した内容で更新する。
+    saved にあるのに state から消えたキーは削除として記録する (まだ読み込んでいないキーは saved に無いので消さない)。
+    保存した版番号を返す。変更が無ければ None。
+    """
+    changed = {}
+    for key in keys:
+        if key in state:
+            digest = value_hash(state[key])
+            if saved.get(key) != digest:
+                changed[key] = (state[key], digest)
+    deleted = [key for key in keys if key not in state and key in saved]
+    if not changed and not deleted:
+        return None
+    revision = store.save(project_id, {key: value for key, (value, _) in changed.items()}, deleted=deleted, step=step)
+    for key, (_, digest) in changed.items():
+        saved[key] = digest
+    for key in deleted:
+        del saved[key]
+    return revision
+
+
+def restore(store, project_id, state, keys, saved):
+    """keys のうち state にまだ無いものを読み込んで state に入れる。読み込んだキーのリストを返す。"""
+    values = store.load(project_id, [key for key in keys if key not in state])
+    for key, value in values.items():
+        state[key] = value
+        saved[key] = value_hash(value)
+    return list(values)
+
+
+def open_project_store(url=None):
+    """url に対応する ProjectStore をプロセス内で1つだけ作って返す。
+
+    url: "sqlite:///path/to/projects.sqlite3" またはファイルのパス、"redis://..." / "memory://" (共有ストア)。
+    None なら、共有ストアを設定していればそこに、無ければ .cache/projects.sqlite3 に保存する
+    """
+    if not url and get_shared_store() is not None:
+        store = get_shared_store()
+        return registry.get(("projects", "shared", id(store)), lambda: RedisProjectStore(store))
+    url = url or os.path.join(DEFAULT_CACHE_DIR, "projects.sqlite3")
+    scheme, sep, rest = url.partition("://")
+    if scheme in ("redis", "rediss", "unix", "memory"):
+        return registry.get(("projects", url), lambda: RedisProjectStore(open_shared_store(url)))
+    if not sep:
+        path = url
+    elif scheme == "sqlite":
+        path = rest[1:] if rest.startswith("/") else rest
+    else:
+        raise ValueError(f"未対応のプロジェクト保存先です: {url}")
+    return registry.get(("projects", os.path.abspath(path)), lambda: SQLiteProjectStore(path))
@@ -0,0 +1,206 @@
+# --- APIクォータ共有のためのレート制限 ---
+# Gemini / Custom Search のクォータはAPIキー単位なので、プロセス内の全セッションの呼び出しを
+# 1つのトークンバケットで平準化する。トークンが無い間は優先度付きの待ち行列に並ぶ。
+# 共有ストア (bizdev.shared) を設定している場合は、全レプリカの呼び出し回数も共有ストアで数えて上限を守る。
+import heapq
+import itertools
+import threading
+import time
+
+from bizdev.jobs import current_owner
+from bizdev.resources import registry
+
+# 優先度 (小さいほど先に処理される)
+PRIORITY_INTERACTIVE = 0  # 画面上でユーザーが結果を待っている呼び出し
+PRIORITY_NORMAL = 5
+PRIORITY_BATCH = 10  # バッチ処理など、遅れても困らない呼び出し
+
+
+class RateLimitTimeout(Exception):
+    """レート制限の待ち時間が上限を超えた。
+
+    API の一時的なエラー (TimeoutError など) とは区別し、生成の再試行の対象にしない
+    (再試行するとまた待ち行列に並び、混雑をさらに悪化させる)。
+    """
+
+
+class RateLimiter:
+    """トークンバケット + 優先度付き待ち行列。
+
+    rate_per_minute: 1分あたりに補充されるトークン数 (= 平均の呼び出し回数の上限)
+    burst: バケットの容量 (= 一度に連続して呼び出せる回数)
+    """
+
+    def __init__(self, rate_per_minute, burst=1):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._waiters = []  # (priority, seq) のヒープ
+        self._owners = {}  # (priority, seq) -> 呼び出したジョブの持ち主 (bizdev.jobs。画面の順番表示用)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+    def acquire(self, priority=PRIORITY_NORMAL, timeout=None):
+        """トークンを1つ取得するまで待つ。timeout 秒で取得できなければ RateLimitTimeout。"""
+        ticket = (priority, next(self._seq))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        owner = current_owner()
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            if owner is not None:
+                self._owners[ticket] = owner
+            try:
+                while True:
+                    self._refill()
+                    if self._waiters[0] == ticket and self._tokens >= 1:
+                        heapq.heappop(self._waiters)
+                        self._tokens -= 1
+                        self._cond.notify_all()  # 次の待ち手に先頭が回ったことを知らせる
+                        return
+                    # 先頭なら次のトークンが貯まるまで、そうでなければ順番が回るまで待つ
+                    wait_seconds = (1 - self._tokens) / self.rate_per_second if self._waiters[0] == ticket else None
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise RateLimitTimeout("レート制限の待ち時間が上限を超えました")
+                        wait_seconds = remaining if wait_seconds is None else min(wait_seconds, remaining)
+                    self._cond.wait(wait_seconds)
+            except BaseException:
+                if ticket in self._waiters:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                raise
+            finally:
+                self._owners.pop(ticket, None)
+
+    def queue_length(self):
+        """現在トークン待ちで並んでいる呼び出しの数。"""
+        with self._cond:
+            return len(self._waiters)
+
+    def position_for(self, owner):
+        """owner のジョブの呼び出しのうち最も先に処理されるものより、前に並んでいる呼び出しの数 (画面表示用)。
+
+        owner の呼び出しが並んでいなければ None。
+        """
+        with self._cond:
+            mine = [ticket for ticket in self._waiters if self._owners.get(ticket) == owner]
+            if not mine:
+                return None
+            first = min(mine)
+            return sum(1 for ticket in self._waiters if ticket < first)
+
+
+class SharedRateLimiter:
+    """RateLimiter に、全レプリカ共通の呼び出し回数の上限を加える。
+
+    プロセス内の RateLimiter で優先度順に並んだあと、共有ストアの固定ウィンドウのカウンタ
+    (burst 回を補充にかかる時間ごとに区切る) で全レプリカの回数を数え、超えていれば次のウィンドウまで待つ。
+    """
+
+    def __init__(self, limiter, store, name, rate_per_minute, burst=1):
+        self.limiter = limiter
+        self.store = store
+        self.name = name
+        self.burst = max(1, burst)
+        self.window_seconds = max(1.0, self.burst * 60.0 / rate_per_minute)
+        self.waited = 0  # 他のレプリカの呼び出しのために待った回数
+
+    def acquire(self, priority=PRIORITY_NORMAL, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self.limiter.acquire(priority=priority, timeout=timeout)
+        while True:
+            now = time.time()
+            window = int(now // self.window_seconds)
+            key = f"bizdev:ratelimit:{self.name}:{window}"
+            count = self.store.incr(key)
+            if count == 1:
+                self.store.expire(key, int(self.window_seconds) + 1)
+            if count <= self.burst:
+                return
+            self.waited += 1
+            wait_seconds = (window + 1) * self.window_seconds - now
+            if deadline is not None and time.monotonic() + wait_seconds > deadline:
+                raise RateLimitTimeout("レート制限の待ち時間が上限を超えました")
+            time.sleep(wait_seconds)
+
+    def __getattr__(self, name):
+        # queue_length / position_for は、このレプリカの待ち行列を返す
+        return getattr(self.limiter, name)
+
+
+class PriorityModel:
+    """生成呼び出しを決まった優先度で行うモデルのラッパー (呼び出し側が priority を指定した場合はそれを使う)。"""
+
+    def __init__(self, model, priority):
+        self.model = model
+        self.priority = priority
+
+    def generate_content(self, prompt, **kwargs):
+        kwargs.setdefault("priority", self.priority)
+        return self.model.generate_content(prompt, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class PrioritySearchClient:
+    """検索を決まった優先度で行う SearchClient のラッパー。"""
+
+    def __init__(self, client, priority):
+        self.client = client
+        self.priority = priority
+
+    def submit(self, query, num=2):
+        return self.client.submit(query, num=num, priority=self.priority)
+
+    def search(self, query, num=2):
+        return self.client.search(query, num=num, priority=self.priority)
+
+    def search_many(self, queries, num=2):
+        return self.client.search_many(queries, num=num, priority=self.priority)
+
+
+class PriorityContextCache:
+    """コンテキストキャッシュが返すモデルも決まった優先度で呼び出すラッパー。"""
+
+    def __init__(self, context_cache, priority):
+        self.context_cache = context_cache
+        self.priority = priority
+
+    def model_for(self, preamble):
+        model = self.context_cache.model_for(preamble)
+        return PriorityModel(model, self.priority) if model is not None else None
+
+    def __getattr__(self, name):
+        return getattr(self.context_cache, name)
+
+
+def get_limiter(name, rate_per_minute, burst=1):
+    """name ごとにプロセス内で1つの RateLimiter を返す (全セッションで共有)。
+
+    共有ストアを設定している場合は、全レプリカで上限を共有する SharedRateLimiter を返す。
+    """
+    from bizdev.shared import get_shared_store
+
+    store = get_shared_store()
+    if store is None:
+        return registry.get(("ratelimit", name), lambda: RateLimiter(rate_per_minute, burst=burst))
+    return registry.get(("ratelimit", name, "shared"),
+                        lambda: SharedRateLimiter(RateLimiter(rate_per_minute, burst=burst), store, name, rate_per_minute, burst=burst))
+
+
+def limiter_settings(secrets):
+    """st.secrets の [rate_limits] セクションから設定を読む。未設定の項目は既定値。"""
+    section = secrets.get("rate_limits", {})
+    return {
+        "gemini": (float(section.get("gemini_rpm", 60)), int(section.get("gemini_burst", 10))),
+        "search": (float(section.get("search_qpm", 60)), int(section.get("search_burst", 5))),
+    }
@@ -0,0 +1,61 @@
+# --- キーワード生成とWeb検索のパイプライン化 ---
+# キーワード生成の応答をストリーミングで受け取り、1行(=1キーワード)が確定した時点で
+# その検索を開始する。LLMの生成待ちと検索待ちを重ねることで、調査ステップの待ち時間を短くする。
+import time
+from concurrent.futures import wait
+
+
+def iter_lines(text_chunks):
+    """ストリーミングで届く文字列チャンクを、改行で区切られた行単位にして返す。"""
+    buffer = ""
+    for chunk in text_chunks:
+        buffer += chunk
+        while "\n" in buffer:
+            line, buffer = buffer.split("\n", 1)
+            yield line
+    if buffer:
+        yield buffer
+
+
+def parse_keyword_line(line):
+    """箇条書き1行から検索キーワードを取り出す。キーワードでない行は None。"""
+    stripped = line.strip()
+    if not stripped or stripped.startswith("Please provide"): # AIがエラーを返した場合の対策
+        return None
+    return stripped.strip("* ").strip() or None
+
+
+class ResearchResult:
+    def __init__(self, raw_text, keywords, results):
+        self.raw_text = raw_text  # キーワード生成AIの応答全文
+        self.keywords = keywords  # 応答から取り出したキーワード (全件)
+        self.results = results  # 検索できたキーワードの (キーワード, items, エラー)。入力順
+
+
+def pipelined_search(text_chunks, search_client, max_keywords=3, num=2, min_items=3, straggler_timeout=5.0):
+    """キーワード生成のストリームを読みながら、確定したキーワードから順に検索を開始する。
+
+    全ての検索が終わるか、min_items 件以上の検索結果が揃った状態で生成完了から
+    straggler_timeout 秒経過した時点で返す (遅い検索を待ち続けて後続の分析を止めない)。
+    """
+    raw_lines = []
+    keywords = []
+    futures = []
+    for line in iter_lines(text_chunks):
+        raw_lines.append(line)
+        keyword = parse_keyword_line(line)
+        if keyword is None:
+            continue
+        keywords.append(keyword)
+        if len(futures) < max_keywords:
+            futures.append(search_client.submit(keyword, num=num))
+
+    deadline = time.monotonic() + straggler_timeout
+    while True:
+        done, not_done = wait(futures, timeout=0.2)
+        items_count = sum(len(future.result()[1]) for future in done)
+        if not not_done or (items_count >= min_items and time.monotonic() >= deadline):
+            break
+
+    results = [future.result() for future in futures if future.done()]
+    return ResearchResult("\n".join(raw_lines), keywords, results)
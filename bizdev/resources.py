@@ -0,0 +1,131 @@
+# --- プロセス内で共有するリソース (モデル・検索クライアントなど) ---
+# Streamlitはセッションごと・操作ごとにスクリプトを再実行するが、このモジュールは
+# プロセスで1回しか読み込まれないので、ここに置いたオブジェクトは全セッションで共有される。
+# 一定間隔でヘルスチェックを行い、失敗したリソースは作り直す (再接続)。
+import threading
+import time
+
+
+class _Entry:
+    def __init__(self, resource):
+        self.resource = resource
+        self.created_at = time.time()
+        self.checked_at = self.created_at
+        self.healthy = True
+        self.reconnects = 0
+        self.last_error = None
+
+
+class ResourceRegistry:
+    """名前ごとに1つのリソースを保持するレジストリ。"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, factory, health_check=None, check_interval=600):
+        """name のリソースを返す。無ければ factory() で作る。
+
+        health_check(resource) が check_interval 秒ごとにロックの外で呼ばれ、例外を送出した場合は
+        factory() で作り直して置き換え、古いリソースの close() を呼ぶ。
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                entry = _Entry(factory())
+                self._entries[name] = entry
+                return entry.resource
+            if health_check is None or time.time() - entry.checked_at < check_interval:
+                return entry.resource
+            # チェックするのは最初に期限を過ぎたのを見たスレッドだけ。他のスレッドは今のリソースを使う
+            entry.checked_at = time.time()
+
+        # ヘルスチェック (ネットワーク越しの呼び出し) の間はロックを持たない。他のリソースの取得を止めないため
+        try:
+            health_check(entry.resource)
+            entry.healthy = True
+            return entry.resource
+        except Exception as e:
+            # 接続が切れている等。作り直して以降の呼び出しは新しいリソースを使う
+            entry.healthy = False
+            entry.last_error = repr(e)
+        new_entry = _Entry(factory())
+        new_entry.reconnects = entry.reconnects + 1
+        new_entry.last_error = entry.last_error
+        with self._lock:
+            current = self._entries.get(name)
+            if current is not None and current is not entry:
+                # チェックの間に別のスレッドが作り直した。作ったものは使わない
+                stale = new_entry.resource
+                new_entry = current
+            else:
+                stale = entry.resource
+                self._entries[name] = new_entry
+        # 置き換えた古いリソースのスレッドプールなどを解放する (使用中の呼び出しはそのまま終わる)
+        _close(stale)
+        return new_entry.resource
+
+    def invalidate(self, name):
+        """name のリソースを破棄する。次回の get() で作り直される。"""
+        with self._lock:
+            self._entries.pop(name, None)
+
+    def status(self):
+        """管理表示用: リソースごとの作成時刻・最終チェック・再接続回数など。"""
+        with self._lock:
+            return {
+                name: {
+                    "created_at": entry.created_at,
+                    "checked_at": entry.checked_at,
+                    "healthy": entry.healthy,
+                    "reconnects": entry.reconnects,
+                    "last_error": entry.last_error,
+                }
+                for name, entry in self._entries.items()
+            }
+
+
+def _close(resource):
+    # close() を持つリソース (GenerationClient のヘッジ用スレッドプール、Redis の接続など) を閉じる
+    close = getattr(resource, "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception:
+            pass
+
+
+registry = ResourceRegistry()
+
+
+def _check_model(model):
+    # 生成の課金なしで、実際に使う生成用チャネルが生きているかを確認する
+    model.count_tokens("ping")
+
+
+def get_model(api_key, model_name='gemini-1.5-flash', cache_ttl_seconds=7 * 24 * 3600,
+              cache_max_bytes=200 * 1024 * 1024, check_interval=600, generation_options=None, price_per_mtok=(0.075, 0.30),
+              backend=None):
+    """設定済みのGeminiモデルをプロセス内で1つだけ作って返す。
+
+    計測 (InstrumentedModel) → 応答キャッシュ → リトライ/ヘッジ (GenerationClient) → GenerativeModel の順にラップする。
+    generation_options は GenerationClient への引数 (max_attempts, hedge など)。
+    price_per_mtok は計測で使う (入力, 出力) 100万トークンあたりの料金 (USD)。
+    backend は GenerativeModel を作る bizdev.backends のバックエンド (既定は本番のAPI)。
+    """
+    from bizdev.backends import get_backend
+
+    backend = backend or get_backend()
+
+    def create():
+        from bizdev.cache import open_cache
+        from bizdev.gemini import CachedModel
+        from bizdev.generation import GenerationClient
+        from bizdev.metrics import InstrumentedModel
+
+        # 同一プロンプトへの応答はディスクキャッシュから返す (戻る→再生成やデモの再実行を高速化)
+        llm_cache = open_cache("gemini_responses", ttl_seconds=cache_ttl_seconds, max_bytes=cache_max_bytes)
+        client = GenerationClient(backend.generative_model(api_key, model_name), **(generation_options or {}))
+        return InstrumentedModel(CachedModel(client, llm_cache), price_per_mtok=price_per_mtok)
+
+    return registry.get(("gemini", backend.name, api_key, model_name), create, health_check=_check_model, check_interval=check_interval)
@@ -0,0 +1,99 @@
+# --- Google Custom Search の共有クライアント ---
+# discoveryサービスはプロセス内で1回だけ構築し、キーワードごとの検索はワーカースレッドで並列に実行する。
+# 検索結果は (クエリ, 検索エンジンID, 件数) をキーにディスクキャッシュへ保存し、TTL内は再検索しない。
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bizdev.cache import make_key, open_cache
+from bizdev.metrics import CallRecord, current_step, metrics, step_scope
+from bizdev.ratelimit import PRIORITY_NORMAL
+from bizdev.resources import registry
+
+
+class SearchClient:
+    def __init__(self, api_key, cx, cache=None, max_workers=3, limiter=None, backend=None):
+        from bizdev.backends import get_backend
+
+        self.cx = cx
+        self.cache = cache
+        self.limiter = limiter  # RateLimiter (キャッシュに無いクエリを実行する前にトークンを取得)
+        self.max_workers = max_workers
+        backend = backend or get_backend()
+        self.service = backend.search_service(api_key)
+        # 再生用のバックエンドの結果が本番の検索結果としてキャッシュされないよう、キーを分ける
+        self.namespace = "" if backend.name == "live" else backend.name
+        # httplib2.Http はスレッドセーフではないので、ワーカースレッドごとに接続を持つ
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="customsearch")
+
+    def _http(self):
+        if not hasattr(self._local, "http"):
+            import httplib2
+
+            self._local.http = httplib2.Http(timeout=30)
+        return self._local.http
+
+    def search(self, query, num=2, priority=PRIORITY_NORMAL):
+        """1つのクエリを検索し、結果の items (dictのリスト) を返す。"""
+        record = CallRecord("search", current_step())
+        started = time.perf_counter()
+        try:
+            items, record.cache_hit = self._search(query, num, priority)
+            return items
+        except Exception as e:
+            record.error = type(e).__name__
+            raise
+        finally:
+            record.latency = record.ttft = time.perf_counter() - started
+            metrics.record(record)
+
+    def _search(self, query, num, priority):
+        key = make_key("customsearch", query, self.cx, num, *([self.namespace] if self.namespace else []))
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return json.loads(cached), True
+
+        if self.limiter is not None:
+            self.limiter.acquire(priority=priority)
+        try:
+            res = self.service.cse().list(q=query, cx=self.cx, num=num).execute(http=self._http())
+        except Exception:
+            # 接続が壊れている可能性があるので、このスレッドの接続は次回作り直す
+            self._local.__dict__.pop("http", None)
+            raise
+        items = res.get('items', [])
+        if self.cache is not None:
+            self.cache.set(key, json.dumps(items, ensure_ascii=False))
+        return items, False
+
+    def submit(self, query, num=2, priority=PRIORITY_NORMAL):
+        """検索をワーカースレッドで開始し、(クエリ, items, エラー) を返す Future を返す。"""
+        step = current_step() # 計測では呼び出し元のステップの検索として数える
+
+        def run():
+            try:
+                with step_scope(step):
+                    return query, self.search(query, num=num, priority=priority), None
+            except Exception as e:
+                return query, [], e
+
+        return self._pool.submit(run)
+
+    def search_many(self, queries, num=2, priority=PRIORITY_NORMAL):
+        """複数クエリを並列に検索する。入力順に (クエリ, items, エラー) のリストを返す。"""
+        futures = [self.submit(query, num=num, priority=priority) for query in queries]
+        return [future.result() for future in futures]
+
+
+def get_search_client(api_key, cx, ttl_seconds=24 * 3600, max_workers=3, limiter=None, backend=None):
+    """(APIキー, 検索エンジンID) ごとにプロセス内で共有される SearchClient を返す。"""
+    backend_name = backend.name if backend is not None else "live"
+
+    def create():
+        cache = open_cache("google_search", ttl_seconds=ttl_seconds, max_bytes=50 * 1024 * 1024)
+        return SearchClient(api_key, cx, cache=cache, max_workers=max_workers, limiter=limiter, backend=backend)
+
+    return registry.get(("customsearch", backend_name, api_key, cx), create)
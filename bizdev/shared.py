@@ -0,0 +1,169 @@
+# --- 複数のレプリカで共有するストア (Redis 互換) ---
+# 1つのコンテナで捌ける同時利用者数を超えたら、アプリを複数のレプリカで動かしてロードバランサーの後ろに置く。
+# その場合、プロセス内・ローカルディスクにある次のものを Redis 互換のストアに置き、全レプリカで共有する。
+#   応答キャッシュ・要約・検索結果・共有ストアの退避先 (bizdev.cache の open_cache)
+#   APIクォータのレート制限 (bizdev.ratelimit)
+#   実行中・実行済みの分析 (bizdev.jobs の run_once。同じ入力の分析を複数のレプリカで重複して実行しない)
+#   プロジェクト (bizdev.projects の RedisProjectStore)
+#
+# SHARED_STORE_URL:
+#   未設定       これまでどおりプロセス内とローカルディスク (.cache/) に置く
+#   redis://...  Redis (redis パッケージが必要。Valkey など互換のサーバーでもよい)
+#   memory://    プロセス内の代替 (InMemoryRedis)。Redis なしで共有ストアを使う経路を確認する用
+# 使う Redis のコマンドは文字列・ハッシュ・セット・ソート済みセットの基本的なものだけ
+# (Luaスクリプトやトランザクションは使わない)。値はすべて文字列で保存する。
+import threading
+import time
+import uuid
+
+from bizdev.resources import registry
+
+# このプロセス (レプリカ) の識別子。ロックの持ち主の記録などに使う
+REPLICA_ID = uuid.uuid4().hex[:12]
+
+_shared_store = None
+
+
+class InMemoryRedis:
+    """このモジュールで使う Redis のコマンドだけを実装した、プロセス内の代替 (decode_responses=True 相当)。"""
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}  # キー -> 期限 (time.time())
+        self._lock = threading.RLock()
+
+    def _alive(self, name):
+        expires_at = self._expires.get(name)
+        if expires_at is not None and time.time() >= expires_at:
+            self._data.pop(name, None)
+            self._expires.pop(name, None)
+        return name in self._data
+
+    def _container(self, name, factory):
+        if not self._alive(name):
+            self._data[name] = factory()
+        return self._data[name]
+
+    def ping(self):
+        return True
+
+    def get(self, name):
+        with self._lock:
+            return self._data[name] if self._alive(name) else None
+
+    def set(self, name, value, ex=None, nx=False):
+        with self._lock:
+            if nx and self._alive(name):
+                return None
+            self._data[name] = str(value)
+            self._expires.pop(name, None)
+            if ex is not None:
+                self._expires[name] = time.time() + ex
+            return True
+
+    def delete(self, *names):
+        with self._lock:
+            count = 0
+            for name in names:
+                if self._alive(name):
+                    count += 1
+                self._data.pop(name, None)
+                self._expires.pop(name, None)
+            return count
+
+    def exists(self, *names):
+        with self._lock:
+            return sum(1 for name in names if self._alive(name))
+
+    def expire(self, name, seconds):
+        with self._lock:
+            if not self._alive(name):
+                return False
+            self._expires[name] = time.time() + seconds
+            return True
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            value = int(self._data[name]) + amount if self._alive(name) else amount
+            self._data[name] = str(value)
+            return value
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        with self._lock:
+            hash_ = self._container(name, dict)
+            items = dict(mapping or {})
+            if key is not None:
+                items[key] = value
+            added = sum(1 for k in items if str(k) not in hash_)
+            hash_.update({str(k): str(v) for k, v in items.items()})
+            return added
+
+    def hget(self, name, key):
+        with self._lock:
+            return self._data[name].get(str(key)) if self._alive(name) else None
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self._data[name]) if self._alive(name) else {}
+
+    def hincrby(self, name, key, amount=1):
+        with self._lock:
+            hash_ = self._container(name, dict)
+            value = int(hash_.get(str(key), 0)) + amount
+            hash_[str(key)] = str(value)
+            return value
+
+    def sadd(self, name, *values):
+        with self._lock:
+            members = self._container(name, set)
+            added = sum(1 for v in values if str(v) not in members)
+            members.update(str(v) for v in values)
+            return added
+
+    def smembers(self, name):
+        with self._lock:
+            return set(self._data[name]) if self._alive(name) else set()
+
+    def zadd(self, name, mapping):
+        with self._lock:
+            scores = self._container(name, dict)
+            added = sum(1 for member in mapping if str(member) not in scores)
+            scores.update({str(member): float(score) for member, score in mapping.items()})
+            return added
+
+    def zrevrange(self, name, start, end):
+        with self._lock:
+            if not self._alive(name):
+                return []
+            members = sorted(self._data[name], key=lambda member: self._data[name][member], reverse=True)
+            return members[start:None if end == -1 else end + 1]
+
+
+def open_shared_store(url):
+    """url ("redis://..." / "memory://") の共有ストアのクライアントをプロセス内で1つだけ作って返す。"""
+    if url.startswith("memory://"):
+        return registry.get(("shared_store", url), InMemoryRedis)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        def create():
+            try:
+                import redis
+            except ImportError as e:
+                raise ImportError("SHARED_STORE_URL に Redis を指定するには redis パッケージが必要です (pip install redis)") from e
+            return redis.Redis.from_url(url, decode_responses=True, health_check_interval=30)
+        return registry.get(("shared_store", url), create, health_check=lambda client: client.ping())
+    raise ValueError(f"未対応の共有ストアです: {url}")
+
+
+def use_shared_store(url):
+    """このプロセスで共有ストアを使うように設定する。url が空なら使わない。設定したストア (または None) を返す。
+
+    キャッシュやレート制限を最初に開く前に呼ぶ (すでに開いたものは切り替わらない)。
+    """
+    global _shared_store
+    _shared_store = open_shared_store(url) if url else None
+    return _shared_store
+
+
+def get_shared_store():
+    """use_shared_store() で設定した共有ストア。設定していなければ None。"""
+    return _shared_store
@@ -0,0 +1,222 @@
+# --- 構造化出力 (JSON) ---
+# マークダウンの応答を正規表現で読み取ると、AIの書式の揺れでパースに失敗し、生成し直しになることがある。
+# Gemini に response_mime_type="application/json" と response_schema を指定して決まった形のJSONを返させ、
+# 型付きの結果クラスで検証する。検証に通った結果は、アプリが保存している形式
+# (ステップ間で受け渡すマークダウン本文・ブロック辞書) に変換するので、画面や後続のプロンプトは変わらない。
+# JSONが返らない・検証に失敗した場合は、従来のマークダウン出力とパース関数にフォールバックする。
+import json
+
+from bizdev.parsing import (VPC_HEADINGS, parse_lean_canvas_response, parse_problem_lines, parse_target_options,
+                            parse_vpc_response, split_framework_sections, split_moat_proposals)
+
+# JSONのキー -> アプリで使うブロック名
+LEAN_CANVAS_FIELDS = {
+    "problem": "課題",
+    "customer_segments": "顧客セグメント",
+    "unique_value_proposition": "独自の価値提案",
+    "solution": "解決策",
+    "channels": "チャネル",
+    "revenue_streams": "収益の流れ",
+    "cost_structure": "コスト構造",
+    "key_metrics": "主要指標",
+    "unfair_advantage": "圧倒的優位性",
+}
+
+VPC_FIELDS = {
+    "customer_jobs": "顧客のジョブ",
+    "customer_pains": "ペイン",
+    "customer_gains": "ゲイン",
+    "products_and_services": "製品・サービス",
+    "pain_relievers": "ペインリリーバー",
+    "gain_creators": "ゲインクリエイター",
+}
+
+# 構造化出力のときにプロンプトの末尾へ付ける指示 (プロンプト内のマークダウンの出力形式より優先させる)
+JSON_INSTRUCTION = """
+    # 出力について
+    上記の出力形式の代わりに、指定されたJSONスキーマに従って出力してください。各項目の本文はマークダウンで記述して構いません。
+    """
+
+
+class StructuredOutputError(ValueError):
+    """JSONの応答がスキーマどおりでない。"""
+
+
+def _text(data, key):
+    value = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(value, str) or not value.strip():
+        raise StructuredOutputError(f"'{key}' がありません")
+    return value.strip()
+
+
+def _items(data, key):
+    value = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(value, list) or not value:
+        raise StructuredOutputError(f"'{key}' のリストがありません")
+    return value
+
+
+def _object_schema(fields, extra=None):
+    properties = {key: {"type": "string"} for key in fields}
+    properties.update(extra or {})
+    return {"type": "object", "properties": properties, "required": list(properties)}
+
+
+class TargetIdeas:
+    """ターゲット案のリスト。ideas は [(セグメント名, 根拠)]。"""
+
+    SCHEMA = {"type": "object", "properties": {"targets": {"type": "array", "items": _object_schema(["name", "rationale"])}},
+              "required": ["targets"]}
+
+    def __init__(self, ideas, text=None):
+        self.ideas = ideas
+        self.text = text if text is not None else "\n\n".join(
+            f"**ターゲット案{i}: {name}**\n* 根拠: {rationale}" for i, (name, rationale) in enumerate(ideas, 1))
+
+    @classmethod
+    def from_json(cls, data):
+        return cls([(_text(item, "name"), _text(item, "rationale")) for item in _items(data, "targets")])
+
+    @classmethod
+    def from_markdown(cls, text):
+        return cls([(line, "") for line in parse_target_options(text)], text=text)
+
+
+class ProblemList:
+    """ターゲット顧客の課題のリスト。"""
+
+    SCHEMA = {"type": "object", "properties": {"problems": {"type": "array", "items": {"type": "string"}}},
+              "required": ["problems"]}
+
+    def __init__(self, problems, text=None):
+        self.problems = problems
+        self.text = text if text is not None else "\n".join(f"* {p}" for p in problems)
+
+    @classmethod
+    def from_json(cls, data):
+        problems = [p.strip() for p in _items(data, "problems") if isinstance(p, str) and p.strip()]
+        if not problems:
+            raise StructuredOutputError("課題が空です")
+        return cls(problems)
+
+    @classmethod
+    def from_markdown(cls, text):
+        return cls(parse_problem_lines(text), text=text)
+
+
+class ValuePropositionCanvas:
+    """VPCの6ブロック。blocks は {ブロック名: 本文}。"""
+
+    SCHEMA = _object_schema(VPC_FIELDS)
+
+    def __init__(self, blocks, text=None):
+        self.blocks = blocks
+        self.text = text if text is not None else "\n\n".join(
+            f"## {VPC_HEADINGS[name]}\n{blocks[name]}" for name in VPC_FIELDS.values())
+
+    @classmethod
+    def from_json(cls, data):
+        return cls({name: _text(data, key) for key, name in VPC_FIELDS.items()})
+
+    @classmethod
+    def from_markdown(cls, text):
+        return cls(parse_vpc_response(text), text=text)
+
+
+class LeanCanvas:
+    """Lean Canvasの9ブロックと品質スコア。"""
+
+    SCHEMA = _object_schema(LEAN_CANVAS_FIELDS, {"score": {"type": "integer"}, "score_rationale": {"type": "string"}})
+
+    def __init__(self, blocks, score_text, text=None):
+        self.blocks = blocks
+        self.score_text = score_text
+        self.text = text if text is not None else "## Lean Canvas Draft\n" + "\n".join(
+            f"### {i}. {name}\n{content}" for i, (name, content) in enumerate(blocks.items(), 1)) + f"\n\n## 品質スコア\n{score_text}"
+
+    @classmethod
+    def from_json(cls, data):
+        blocks = {name: _text(data, key) for key, name in LEAN_CANVAS_FIELDS.items()}
+        score = data.get("score")
+        if not isinstance(score, int) or not 0 <= score <= 100:
+            raise StructuredOutputError(f"スコアが0～100の整数ではありません: {score!r}")
+        return cls(blocks, f"スコア: {score}/100\n根拠: {_text(data, 'score_rationale')}")
+
+    @classmethod
+    def from_markdown(cls, text):
+        score_text, blocks = parse_lean_canvas_response(text)
+        return cls(blocks, score_text, text=text)
+
+
+class MoatProposals:
+    """Moat案のリスト。proposals は [(ステートメント, 模倣困難な理由)]。"""
+
+    SCHEMA = {"type": "object", "properties": {"moats": {"type": "array", "items": _object_schema(["statement", "reason"])}},
+              "required": ["moats"]}
+
+    def __init__(self, proposals, text=None):
+        self.proposals = proposals
+        self.text = text if text is not None else "## Moat（持続可能な競争優位性）の提案\n" + "\n\n".join(
+            f"**Moat案{i}:** {statement}\n* 理由: {reason}" for i, (statement, reason) in enumerate(proposals, 1))
+
+    @classmethod
+    def from_json(cls, data):
+        return cls([(_text(item, "statement"), _text(item, "reason")) for item in _items(data, "moats")])
+
+    @classmethod
+    def from_markdown(cls, text):
+        return cls([(proposal, "") for proposal in split_moat_proposals(text)], text=text)
+
+
+class FrameworkAnalyses:
+    """まとめて生成した SWOT・4P・3C 分析。各本文は個別に生成した場合と同じく "## X分析結果" の見出しで始まる。"""
+
+    SECTIONS = {"swot": "SWOT", "four_p": "4P", "three_c": "3C"}  # JSONのキー -> 見出しの分析名
+    SCHEMA = _object_schema(SECTIONS)
+
+    def __init__(self, sections, text=None):
+        self.sections = sections  # {"SWOT": 本文, "4P": 本文, "3C": 本文}
+        self.text = text if text is not None else "\n\n".join(sections.values())
+
+    @classmethod
+    def from_json(cls, data):
+        return cls({name: f"## {name}分析結果\n{_text(data, key)}" for key, name in cls.SECTIONS.items()})
+
+    @classmethod
+    def from_markdown(cls, text):
+        sections = split_framework_sections(text)
+        missing = [name for name in cls.SECTIONS.values() if name not in sections]
+        if missing:
+            raise StructuredOutputError(f"{'・'.join(missing)}分析の見出しが見つかりません")
+        return cls({name: sections[name] for name in cls.SECTIONS.values()}, text=text)
+
+
+def json_config(schema):
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+
+def generate_json(model, prompt, schema):
+    """schema に従ったJSONを生成させ、読み込んだ値を返す。JSONでなければ StructuredOutputError。"""
+    response = model.generate_content(prompt + JSON_INSTRUCTION, generation_config=json_config(schema))
+    try:
+        return json.loads(response.text)
+    except ValueError as e: # JSONDecodeError / 本文なし (ブロックされた応答など)
+        raise StructuredOutputError(f"JSONの応答を読み込めません: {e}") from e
+
+
+def generate_structured(model, prompt, result_class, structured=True):
+    """result_class の結果を生成する。
+
+    structured が True ならJSONで生成して検証し、失敗した場合だけマークダウンで生成し直してパースする。
+    結果の source に "json" / "markdown" のどちらで得たかを記録する。
+    """
+    if structured:
+        try:
+            result = result_class.from_json(generate_json(model, prompt, result_class.SCHEMA))
+            result.source = "json"
+            return result
+        except StructuredOutputError:
+            pass # 従来のマークダウン出力にフォールバック
+    result = result_class.from_markdown(model.generate_content(prompt).text)
+    result.source = "markdown"
+    return result